@@ -0,0 +1,63 @@
+"""
+get_positions 응답 하나를 encode/decode하는 시간 비교 (설치되어 있는 codec별: json / orjson / msgpack)
+
+포지션마다 --fills번 체결해서 history list가 채워진 실제 Position.to_dict() 응답을 만든다.
+
+python -m benchmarks.bench_codec --positions 100 --fills 1000
+"""
+import json
+import time
+import random
+import argparse
+
+from core.order import OrderState
+from core.position import Position
+from periphery import codec
+
+
+def make_payload(positions, fills):
+    rng = random.Random(0)
+    res = {}
+    for i in range(positions):
+        position = Position(strategy_name='strategy_1', symbol=f'symbol_{i}')
+        for _ in range(fills):
+            quantity = rng.choice([1, 2, 3]) * rng.choice([1, -1])
+            position.apply_fill(side='BUY' if quantity > 0 else 'SELL', price=round(rng.uniform(90, 110), 1),
+                                quantity=quantity, position_amount=None, order_state=OrderState.FILLED)
+        res[position.symbol] = position.to_dict()
+    return {'status': 'success', 'result': res}
+
+
+def measure(encode, decode, payload, repeat):
+    encoded = encode(payload)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encode(payload)
+    encode_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(encoded)
+    decode_time = (time.perf_counter() - start) / repeat
+    return len(encoded), encode_time, decode_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--positions', type=int, default=100)
+    parser.add_argument('--fills', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = make_payload(args.positions, args.fills)
+
+    # 이전 방식 (json.dumps --> send_string / recv_string --> json.loads)
+    candidates = {'json (str)': (lambda obj: json.dumps(obj, default=str).encode('utf-8'), json.loads)}
+    for name, c in codec.CODECS.items():
+        if name == 'json' and codec.ORJSON_AVAILABLE:
+            name = 'json (orjson)'
+        candidates[name] = (c.encode, c.decode)
+
+    for name, (encode, decode) in candidates.items():
+        size, encode_time, decode_time = measure(encode, decode, payload, args.repeat)
+        print(f'{name:14s} {size / 1e6:8.2f}MB  encode {encode_time * 1e3:8.2f}ms  decode {decode_time * 1e3:8.2f}ms')
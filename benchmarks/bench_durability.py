@@ -0,0 +1,55 @@
+"""
+auto_save durability 모드별 초당 체결(fill) 처리량 비교
+
+주문 하나마다 init --> register --> fill(전량 체결) 과정을 거치며, symbols개의 종목에 번갈아가며 체결시킨다.
+
+python -m benchmarks.bench_durability --fills 20000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from core.ledger import Ledger
+from core.journal import Durability
+
+
+def run(durability, journal, fills, resting_orders, symbols):
+    with tempfile.TemporaryDirectory() as home:
+        os.environ['HOME'] = home
+
+        ledger = Ledger(name='bench', username='bench', auto_save=True, journal=journal, durability=durability)
+        strategy_name = 'strategy_1'
+
+        for i in range(resting_orders):
+            order_hash = ledger.init_order(strategy_name, f'{i:06d}', 100, 1, 'BUY', 'LIMIT')
+            ledger.register_order(f'resting_{i}', order_hash)
+
+        start = time.perf_counter()
+        for i in range(fills):
+            order_number = f'order_{i}'
+            order_hash = ledger.init_order(strategy_name, f'symbol_{i % symbols}', 100, 1, 'BUY', 'LIMIT')
+            ledger.register_order(order_number, order_hash)
+            ledger.fill_order(strategy_name, order_number, 100, 1)
+        ledger.flush()
+        elapsed = time.perf_counter() - start
+
+        ledger.close()
+        return fills / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fills', type=int, default=5000)
+    parser.add_argument('--resting-orders', type=int, default=1000)
+    parser.add_argument('--symbols', type=int, default=100)
+    args = parser.parse_args()
+
+    home = os.environ.get('HOME')
+    for journal in (False, True):
+        for durability in Durability.ALL:
+            fps = run(durability, journal, args.fills, args.resting_orders, args.symbols)
+            mode = 'journal' if journal else 'pickle'
+            print(f'{mode:8s} {durability:8s} {fps:12,.0f} fills/s')
+    if home is not None:
+        os.environ['HOME'] = home
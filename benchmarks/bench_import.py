@@ -0,0 +1,48 @@
+"""
+core ledger를 import하고 in-memory Ledger를 만드는 데 걸리는 시간 (새 python process 기준)
+
+--backend를 주면 persistence backend(Django)까지 불러오는 시간도 같이 측정한다.
+
+python -m benchmarks.bench_import --repeat 10 --backend
+"""
+import sys
+import argparse
+import subprocess
+
+CORE = '''
+import time
+start = time.perf_counter()
+from core.ledger import Ledger
+imported = time.perf_counter()
+Ledger(name='bench', username='bench', auto_save=False)
+print(imported - start, time.perf_counter() - start)
+'''
+
+BACKEND = '''
+import time
+start = time.perf_counter()
+from core.ledger_db import load_backend
+backend = load_backend('django')
+print(time.perf_counter() - start, backend is not None)
+'''
+
+
+def run(code):
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--backend', action='store_true')
+    args = parser.parse_args()
+
+    imports, ledgers = zip(*[map(float, run(CORE)) for _ in range(args.repeat)])
+    print(f'import core.ledger      {min(imports) * 1000:8.1f}ms (min of {args.repeat})')
+    print(f'import + Ledger()       {min(ledgers) * 1000:8.1f}ms (min of {args.repeat})')
+
+    if args.backend:
+        res = [run(BACKEND) for _ in range(args.repeat)]
+        available = res[0][1] == 'True'
+        print(f'load_backend(django)    {min(float(r[0]) for r in res) * 1000:8.1f}ms '
+              f'({"available" if available else "not available"})')
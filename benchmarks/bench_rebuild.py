@@ -0,0 +1,45 @@
+"""
+fill 기록으로 포지션을 다시 만드는 시간 비교 (fill마다 Position.update_position vs numpy vectorized rebuild)
+
+python -m benchmarks.bench_rebuild --fills 1000000
+"""
+import time
+import random
+import argparse
+
+from core.order import OrderState
+from core.rebuild import rebuild_positions, _rebuild_scalar, _columns
+
+
+def make_fills(fills, strategies, symbols):
+    rng = random.Random(0)
+    columns = {field: [] for field in ('strategy_name', 'symbol', 'side', 'price', 'quantity', 'order_state')}
+    for _ in range(fills):
+        quantity = rng.choice([1, 2, 3]) * rng.choice([1, -1])
+        columns['strategy_name'].append(f'strategy_{rng.randrange(strategies)}')
+        columns['symbol'].append(f'symbol_{rng.randrange(symbols)}')
+        columns['side'].append('BUY' if quantity > 0 else 'SELL')
+        columns['price'].append(round(rng.uniform(90, 110), 1))
+        columns['quantity'].append(quantity)
+        columns['order_state'].append(OrderState.FILLED)
+    return columns
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fills', type=int, default=1000000)
+    parser.add_argument('--strategies', type=int, default=10)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--skip-scalar', action='store_true')
+    args = parser.parse_args()
+
+    columns = make_fills(args.fills, args.strategies, args.symbols)
+
+    start = time.perf_counter()
+    rebuild_positions(columns)
+    print(f'vectorized {time.perf_counter() - start:8.2f}s')
+
+    if not args.skip_scalar:
+        start = time.perf_counter()
+        _rebuild_scalar(_columns(columns))
+        print(f'scalar     {time.perf_counter() - start:8.2f}s')
@@ -0,0 +1,88 @@
+"""
+DB 기록으로 ledger를 복구하는 시간 (Django backend 필요)
+
+bench user에 ledger별로 주문/체결/cash row를 --rows개 만든 뒤 순차 복구와 병렬 복구(ThreadPoolExecutor)를 비교한다.
+
+python -m benchmarks.bench_recovery --rows 1000000 --ledgers 4 --workers 4
+"""
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from core.ledger import Ledger
+from core.order import OrderState
+from core.clock import now_ns, format_timestamp
+from core.ledger_db import load_backend
+
+USERNAME = 'bench@easy-ledger.local'
+
+
+def populate(backend, ledger_names, rows, batch_size=10000):
+    rng = random.Random(0)
+    user = backend.User.objects.filter(email=USERNAME).first()
+    if user is None:
+        user = backend.User.objects.create(username=USERNAME, email=USERNAME)
+
+    timestamp = now_ns()
+    for ledger_name in ledger_names:
+        backend.Ledger.objects.filter(user=user, name=ledger_name).delete()
+        ledger = backend.Ledger.objects.create(user=user, name=ledger_name)
+        backend.Cash.objects.bulk_create([backend.Cash(user=user, ledger=ledger, strategy_name=f'strategy_{i}',
+                                                       quote='krw', amount=1e8) for i in range(10)])
+
+        for start in range(0, rows, batch_size):
+            orders = []
+            for i in range(start, min(start + batch_size, rows)):
+                state = rng.choice([OrderState.FILLED] * 8 + [OrderState.OPEN, OrderState.CLOSED])
+                orders.append(backend.Order(user=user, ledger=ledger, strategy_name=f'strategy_{i % 10}',
+                                            order_state=state, init_time=format_timestamp(timestamp + i),
+                                            symbol=f'symbol_{rng.randrange(100)}', quantity=1.0, price=100.0,
+                                            side=rng.choice(['BUY', 'SELL']), order_type='LIMIT',
+                                            init_id=str(i), order_number=str(i),
+                                            closed_time=format_timestamp(timestamp + i),
+                                            orders_filled=1.0 if state == OrderState.FILLED else 0.0,
+                                            orders_remaining=0.0 if state == OrderState.FILLED else 1.0))
+            backend.Order.objects.bulk_create(orders)
+
+            created = backend.Order.objects.filter(ledger=ledger, order_state=OrderState.FILLED,
+                                                   init_id__in=[o.init_id for o in orders]).values_list('pk', 'init_id')
+            backend.Fill.objects.bulk_create([backend.Fill(order_id=pk, timestamp=format_timestamp(timestamp + int(i)),
+                                                           quantity=1.0, price=round(rng.uniform(90, 110), 1))
+                                              for pk, i in created])
+
+
+def recover(ledger_name, chunk_size):
+    ledger = Ledger(name=ledger_name, username=USERNAME, db_save=True, db_write_behind=False)
+    ledger.recover_db(chunk_size=chunk_size)
+    return ledger
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--ledgers', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--skip-populate', action='store_true')
+    args = parser.parse_args()
+
+    backend = load_backend('django')
+    if backend is None:
+        raise SystemExit('Django backend를 사용할 수 없습니다.')
+
+    ledger_names = [f'bench_{i}' for i in range(args.ledgers)]
+    if not args.skip_populate:
+        start = time.perf_counter()
+        populate(backend, ledger_names, args.rows // args.ledgers)
+        print(f'populate   {time.perf_counter() - start:8.2f}s ({args.rows} orders)')
+
+    start = time.perf_counter()
+    for ledger_name in ledger_names:
+        recover(ledger_name, args.chunk_size)
+    print(f'sequential {time.perf_counter() - start:8.2f}s')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(lambda ledger_name: recover(ledger_name, args.chunk_size), ledger_names))
+    print(f'parallel   {time.perf_counter() - start:8.2f}s ({args.workers} workers)')
@@ -0,0 +1,317 @@
+import os
+import json
+from array import array
+from pathlib import Path
+
+from core.clock import now_ns, format_date, parse_timestamp
+from core.table import atomic_write
+from core.journal import Durability
+
+try:
+    """
+    numpy가 있다면 column 파일을 memmap으로 읽어서 vectorized 필터링을 한다.
+    """
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+def _archive_id(order_id):
+    # audit 모드(HashIdGenerator)의 id는 sha1 hex 문자열이기 때문에 앞 15자리(60bit)를 정수로 저장한다.
+    if isinstance(order_id, int):
+        return order_id
+    return int(str(order_id)[:15], 16)
+
+
+class ColumnPartition:
+    """
+    하루치 데이터를 field별 column 파일(<field>.bin)에 append하는 partition
+
+    문자열 column은 partition별 dictionary의 code(int32)로 저장한다.
+    dictionary는 column별 <field>.strings 파일에 한 줄에 하나씩 (json) 새로 추가된 문자열만 append한다.
+
+    rows: archive index에 기록된 (완전히 기록된) row 수 --> column 파일이 이보다 길다면 기록 도중 종료된 것이므로 잘라낸다.
+    """
+
+    def __init__(self, path, schema, rows=0):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.buffer = {name: array('i' if typecode == 's' else typecode) for name, typecode in schema}
+        self.strings = {name: [] for name, typecode in schema if typecode == 's'}
+        self.written = {name: 0 for name in self.strings}     # 파일에 기록된 문자열 수
+        self.rows = rows
+
+        legacy_path = self.path / 'strings.json'
+        if os.path.exists(legacy_path):
+            # 이전 버전: 모든 dictionary를 하나의 strings.json에 매번 다시 기록했다.
+            with open(legacy_path, 'r') as f:
+                self.strings.update(json.load(f))
+        else:
+            for name in self.strings:
+                self.strings[name] = self._read_strings(name)
+                self.written[name] = len(self.strings[name])
+        self.codes = {name: {value: code for code, value in enumerate(values)}
+                      for name, values in self.strings.items()}
+
+        for name, values in self.buffer.items():
+            column_path = self.path / f'{name}.bin'
+            if os.path.exists(column_path) and os.path.getsize(column_path) > rows * values.itemsize:
+                with open(column_path, 'ab') as f:
+                    f.truncate(rows * values.itemsize)
+
+    def _read_strings(self, name):
+        strings_path = self.path / f'{name}.strings'
+        if not os.path.exists(strings_path):
+            return []
+        with open(strings_path, 'rb') as f:
+            data = f.read()
+        complete = data.rfind(b'\n') + 1
+        if complete != len(data):
+            # 마지막 줄을 쓰는 도중 종료된 경우
+            with open(strings_path, 'ab') as f:
+                f.truncate(complete)
+        return [json.loads(line) for line in data[:complete].splitlines()]
+
+    def encode(self, name, value):
+        value = None if value is None else str(value)
+        codes = self.codes[name]
+        if value not in codes:
+            codes[value] = len(self.strings[name])
+            self.strings[name].append(value)
+        return codes[value]
+
+    def append(self, row: dict):
+        for name, typecode in self.schema:
+            value = row[name]
+            if typecode == 's':
+                value = self.encode(name, value)
+            self.buffer[name].append(value)
+
+    @property
+    def pending(self):
+        return len(self.buffer[self.schema[0][0]])
+
+    def flush(self, fsync=True):
+        """
+        새 문자열 --> column 순서로 append한다. 완료된 row 수(rows)는 OrderArchive가 index에 마지막으로 기록한다.
+        """
+        if not self.pending:
+            return
+        for name, values in self.strings.items():
+            if self.written[name] < len(values):
+                lines = ''.join(json.dumps(value) + '\n' for value in values[self.written[name]:])
+                with open(self.path / f'{name}.strings', 'a' if self.written[name] else 'w') as f:
+                    f.write(lines)
+                    f.flush()
+                    if fsync:
+                        os.fsync(f.fileno())
+                self.written[name] = len(values)
+
+        legacy_path = self.path / 'strings.json'
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+        for name, values in self.buffer.items():
+            with open(self.path / f'{name}.bin', 'ab') as f:
+                values.tofile(f)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+        self.rows += self.pending
+        for values in self.buffer.values():
+            del values[:]
+
+    def read(self, name):
+        """
+        column 하나를 읽는다. (numpy가 있다면 memmap, 없다면 array)
+        """
+        typecode = dict(self.schema)[name]
+        typecode = 'i' if typecode == 's' else typecode
+        column_path = self.path / f'{name}.bin'
+
+        if NUMPY_AVAILABLE:
+            if not os.path.exists(column_path) or os.path.getsize(column_path) == 0:
+                return np.zeros(0, dtype=typecode)
+            return np.memmap(column_path, dtype=typecode, mode='r')
+
+        values = array(typecode)
+        if os.path.exists(column_path):
+            with open(column_path, 'rb') as f:
+                values.frombytes(f.read())
+        return values
+
+
+class OrderArchive:
+    """
+    체결완료(filled) / 취소(closed)된 주문을 보관하는 append-only columnar archive
+
+    archive/orders/<YYYYMMDD>/<field>.bin: 완료된 주문 한 건당 한 row
+    archive/fills/<YYYYMMDD>/<field>.bin: 체결 한 건당 한 row (price는 체결가격)
+    archive/index.json: {table: {day: rows}} --> partition 목록과 완전히 기록된 row 수 (column 파일을 쓴 뒤 마지막에 교체)
+
+    주문 객체를 heap에 남겨두지 않고도 "오늘 전략 X가 종목 Y에서 체결한 내역"을 빠르게 조회할 수 있다.
+    flush_size개의 row가 쌓이면 파일에 기록한다. (Ledger.flush / close에서도 기록)
+    durability: ledger와 같은 저장 방식 --> ASYNC가 아니라면 fsync
+                (OrderTable은 table에서 주문을 제거한 기록이 저장되기 전에 archive를 먼저 기록한다)
+    """
+
+    ORDER_SCHEMA = (
+        ('init_id', 'q'),
+        ('strategy_name', 's'),
+        ('symbol', 's'),
+        ('side', 's'),
+        ('order_type', 's'),
+        ('quote', 's'),
+        ('meta', 's'),
+        ('order_state', 's'),
+        ('order_number', 's'),
+        ('price', 'd'),
+        ('quantity', 'd'),
+        ('orders_filled', 'd'),
+        ('init_time', 'q'),
+        ('done_time', 'q'),
+    )
+
+    FILL_SCHEMA = (
+        ('init_id', 'q'),
+        ('strategy_name', 's'),
+        ('symbol', 's'),
+        ('side', 's'),
+        ('order_number', 's'),
+        ('price', 'd'),
+        ('quantity', 'd'),
+        ('timestamp', 'q'),
+    )
+
+    SCHEMAS = {'orders': ORDER_SCHEMA, 'fills': FILL_SCHEMA}
+
+    def __init__(self, path, flush_size=100, durability=Durability.SYNC):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.flush_size = flush_size
+        self.durability = durability
+        self.partitions = {}
+
+        self.index_path = self.path / 'index.json'
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {table: {} for table in self.SCHEMAS}
+
+    def _partition(self, table, day) -> ColumnPartition:
+        key = (table, day)
+        if key not in self.partitions:
+            self.partitions[key] = ColumnPartition(self.path / table / day, self.SCHEMAS[table],
+                                                   rows=self.index[table].get(day, 0))
+        return self.partitions[key]
+
+    def append(self, order):
+        done_time = getattr(order, 'filled_time', None) or getattr(order, 'closed_time', None) or now_ns()
+        done_time = parse_timestamp(done_time)
+        day = format_date(done_time)
+        init_id = _archive_id(order.init_id)
+        order_number = getattr(order, 'order_number', None)
+
+        self._partition('orders', day).append({
+            'init_id': init_id,
+            'strategy_name': order.strategy_name,
+            'symbol': order.symbol,
+            'side': order.side,
+            'order_type': order.order_type,
+            'quote': order.quote,
+            'meta': order.meta,
+            'order_state': order.state,
+            'order_number': order_number,
+            'price': order.price,
+            'quantity': order.quantity,
+            'orders_filled': getattr(order, 'orders_filled', 0.0),
+            'init_time': parse_timestamp(order.init_time),
+            'done_time': done_time,
+        })
+
+        fills = self._partition('fills', day)
+        for fill in (order.fill_history if order_number is not None else []):
+            fills.append({
+                'init_id': init_id,
+                'strategy_name': order.strategy_name,
+                'symbol': order.symbol,
+                'side': order.side,
+                'order_number': order_number,
+                'price': fill['price'],
+                'quantity': fill['quantity'],
+                'timestamp': parse_timestamp(fill['timestamp']),
+            })
+
+        if self.pending >= self.flush_size:
+            self.flush()
+
+    @property
+    def pending(self):
+        return sum(partition.pending for partition in self.partitions.values())
+
+    def flush(self):
+        fsync = self.durability != Durability.ASYNC
+        updated = False
+        for (table, day), partition in self.partitions.items():
+            if partition.pending:
+                partition.flush(fsync=fsync)
+                self.index[table][day] = partition.rows
+                updated = True
+
+        if updated:
+            atomic_write(self.index_path, json.dumps(self.index).encode('utf-8'), fsync=fsync)
+
+    def days(self, table='orders'):
+        return sorted(self.index[table])
+
+    def query(self, table='orders', day=None, strategy_name=None, symbol=None, order_state=None):
+        """
+        하루치 partition에서 조건에 맞는 row를 column별로 리턴한다. (day가 None이면 오늘)
+
+        문자열 column은 dictionary에서 code를 찾아 code 비교로 필터링하기 때문에 문자열 비교가 발생하지 않는다.
+        """
+        self.flush()
+
+        day = day or format_date(now_ns())
+        if day not in self.index[table]:
+            return {name: [] for name, _ in self.SCHEMAS[table]}
+
+        partition = self._partition(table, day)
+        conditions = {'strategy_name': strategy_name, 'symbol': symbol, 'order_state': order_state}
+        conditions = {name: value for name, value in conditions.items()
+                      if value is not None and name in partition.codes}
+
+        for name, value in conditions.items():
+            if str(value) not in partition.codes[name]:
+                return {name: [] for name, _ in self.SCHEMAS[table]}
+
+        if NUMPY_AVAILABLE:
+            mask = np.ones(partition.rows, dtype=bool)
+            for name, value in conditions.items():
+                mask &= (partition.read(name) == partition.codes[name][str(value)])
+            rows = np.nonzero(mask)[0]
+        else:
+            columns = {name: partition.read(name) for name in conditions}
+            rows = [i for i in range(partition.rows)
+                    if all(columns[name][i] == partition.codes[name][str(value)] for name, value in conditions.items())]
+
+        res = {}
+        for name, typecode in self.SCHEMAS[table]:
+            column = partition.read(name)
+            if NUMPY_AVAILABLE:
+                values = column[rows]
+            else:
+                values = [column[i] for i in rows]
+            if typecode == 's':
+                strings = partition.strings[name]
+                values = [strings[code] for code in values]
+            res[name] = values
+        return res
+
+    def close(self):
+        self.flush()
+        self.partitions = {}
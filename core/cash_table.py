@@ -1,32 +1,22 @@
-import os
-import pickle
-from pathlib import Path
+from core.table import Table
 
 
-class CashTable:
+class CashTable(Table):
 
     CACHE_NAME = 'CashTable.pkl'
+    JOURNAL_NAME = 'CashTable.log'
+    STATE_FIELDS = ('cash_table',)
 
-    def __init__(self, user_name='', ledger_name='', auto_save=False):
-        path = Path.home() / 'easy_ledger' / user_name / ledger_name
-        path.mkdir(parents=True, exist_ok=True)
-        self.CACHE_NAME = path / self.CACHE_NAME
-        self.auto_save = auto_save
-        self._load_state()
-
-    def _load_state(self):
-        if os.path.exists(self.CACHE_NAME) and self.auto_save:
-            f = open(self.CACHE_NAME, 'rb')
-            cached = pickle.load(f)
-            self.cash_table = cached.cash_table
-        else:
-            self.cash_table = {}
-            self._save_state()
+    def _init_state(self):
+        self.cash_table = {}
 
-    def _save_state(self):
-        if self.auto_save:
-            with open(self.CACHE_NAME, 'wb') as f:
-                pickle.dump(self, f)
+    def _apply(self, record):
+        op, *args = record
+        if op == 'update_cash':
+            strategy_name, key, amount = args
+            self.get_cash(strategy_name)[key] = amount
+        elif op == 'load_cash':
+            self.cash_table = args[0]
 
     def get_cash(self, strategy_name, quote=None):
         if strategy_name not in self.cash_table:
@@ -40,15 +30,20 @@ class CashTable:
     def update_cash(self, strategy_name, amount, quote=None):
         cash_info = self.get_cash(strategy_name)
 
-        if quote is None:
-            cash_info['cash'] = amount
-        else:
-            cash_info[quote] = amount
+        key = 'cash' if quote is None else quote
+        cash_info[key] = amount
+
+        self._commit('update_cash', strategy_name, key, amount)
 
-        self._save_state()
+    def load_cash(self, cash_table):
+        """
+        DB에서 복구한 {strategy_name: {quote: amount}}로 table을 한번에 교체한다.
+        """
+        self.cash_table = cash_table
+        self._commit('load_cash', cash_table)
 
 
 if __name__ == '__main__':
     ct = CashTable()
     cash = ct.get_cash('strategy_1')
-    print(cash)
\ No newline at end of file
+    print(cash)
@@ -0,0 +1,49 @@
+import threading
+import traceback
+
+
+class Checkpointer(threading.Thread):
+    """
+    background에서 주기적으로 Ledger.checkpoint()를 호출하는 thread
+
+    interval: checkpoint 주기 (초)
+    max_records: 마지막 checkpoint 이후 쌓인 log record 수가 이 값을 넘으면 interval을 기다리지 않고 checkpoint
+
+    변경사항이 없다면 checkpoint를 건너뛴다.
+    poll 주기마다 init_ttl이 지난 init 주문을 만료시킨다. (주문이 더 들어오지 않는 경우)
+    """
+
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, ledger, interval=60.0, max_records=None):
+        super().__init__(daemon=True)
+        self.ledger = ledger
+        self.interval = interval
+        self.max_records = max_records
+        self.stopped = threading.Event()
+
+    def run(self):
+        elapsed = 0.0
+        poll_interval = min(self.POLL_INTERVAL, self.interval)
+        while not self.stopped.wait(poll_interval):
+            elapsed += poll_interval
+            try:
+                self.ledger.expire_init_orders()
+            except:
+                traceback.print_exc()
+
+            pending = self.ledger.pending_records()
+            if not pending:
+                continue
+
+            due = (elapsed >= self.interval) or \
+                  (self.max_records is not None and pending >= self.max_records)
+            if due:
+                try:
+                    self.ledger.checkpoint()
+                except:
+                    traceback.print_exc()
+                elapsed = 0.0
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,59 @@
+import time
+import datetime
+
+
+class Clock:
+    """
+    주문/포지션 hot path에서 사용하는 시간: epoch 기준 정수 nanosecond
+
+    wall clock은 처음에 한번만 읽어서 monotonic clock과의 차이(offset)를 저장해두고,
+    이후에는 monotonic clock + offset으로 계산하기 때문에 항상 증가하는 (정렬/차이 계산이 가능한) 값을 얻는다.
+    문자열 변환은 LedgerServer/LedgerDB에서 내보낼 때만 한다.
+    """
+
+    def __init__(self):
+        self.resync()
+
+    def resync(self):
+        self.offset = time.time_ns() - time.perf_counter_ns()
+
+    def now(self) -> int:
+        return time.perf_counter_ns() + self.offset
+
+
+CLOCK = Clock()
+
+
+def now_ns() -> int:
+    return CLOCK.now()
+
+
+def format_timestamp(timestamp):
+    """
+    epoch ns --> '%Y%m%d%H%M%S%f'[:-3] (이전 버전의 ms 단위 문자열 형식)
+
+    이전 버전에서 저장된 문자열이나 None은 그대로 리턴한다.
+    """
+    if not isinstance(timestamp, int):
+        return timestamp
+    seconds, ns = divmod(timestamp, 1_000_000_000)
+    return datetime.datetime.fromtimestamp(seconds).strftime('%Y%m%d%H%M%S') + f'{ns // 1_000_000:03d}'
+
+
+def format_date(timestamp):
+    """
+    epoch ns --> '%Y%m%d'
+    """
+    if not isinstance(timestamp, int):
+        return timestamp
+    return datetime.datetime.fromtimestamp(timestamp // 1_000_000_000).strftime('%Y%m%d')
+
+
+def parse_timestamp(timestamp) -> int:
+    """
+    '%Y%m%d%H%M%S%f'[:-3] 형식의 문자열 --> epoch ns (이전 버전 데이터 변환용)
+    """
+    if isinstance(timestamp, int):
+        return timestamp
+    dt = datetime.datetime.strptime(timestamp[:14], '%Y%m%d%H%M%S')
+    return int(dt.timestamp()) * 1_000_000_000 + int(timestamp[14:17] or 0) * 1_000_000
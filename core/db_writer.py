@@ -0,0 +1,131 @@
+import time
+import queue
+import atexit
+import pickle
+import threading
+import traceback
+
+
+class DBWriter(threading.Thread):
+    """
+    ledger event를 queue에 모아두었다가 background에서 batch로 기록하는 write-behind worker
+
+    handler: handler(events)로 batch 하나를 기록하는 함수 (LedgerDB._write_batch --> 하나의 transaction)
+    max_queue: queue에 쌓을 수 있는 최대 event 수. 가득 차면 put이 기다린다. (backpressure)
+    batch_size: 한번에 기록하는 최대 event 수
+    put_timeout: queue가 가득 찬 상태로 이 시간(초)이 지나면 예외 (None이면 자리가 날 때까지 기다림)
+    retries: handler가 실패한 batch를 다시 기록해보는 횟수 (retry_interval초 간격)
+    dead_letter_path: 재시도 후에도 기록하지 못한 batch를 pickle로 append하는 파일
+                      (None이면 failed에 보관 --> retry_failed()로 다시 기록)
+
+    기록에 실패한 batch가 있다면 flush() / close()에서 예외로 알려준다.
+    프로세스가 종료될 때 (atexit) 남아있는 event를 모두 기록한다.
+    """
+
+    def __init__(self, handler, max_queue=10000, batch_size=500, put_timeout=None, retries=3, retry_interval=0.5,
+                 dead_letter_path=None):
+        super().__init__(daemon=True)
+        self.handler = handler
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.dead_letter_path = dead_letter_path
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stopped = threading.Event()
+        self.failed = []            # 기록하지 못한 batch (dead_letter_path가 없을 때)
+        self.errors = []            # flush / close에서 아직 알려주지 않은 예외
+        self.errors_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def put(self, event):
+        if self.stopped.is_set():
+            raise Exception('DB writer가 종료되었습니다.')
+        try:
+            self.queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            raise Exception('DB write queue가 가득 찼습니다.')
+
+    def run(self):
+        while not (self.stopped.is_set() and self.queue.empty()):
+            try:
+                events = [self.queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            while len(events) < self.batch_size:
+                try:
+                    events.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._write(events)
+            finally:
+                for _ in events:
+                    self.queue.task_done()
+
+    def _write(self, events):
+        for attempt in range(self.retries + 1):
+            try:
+                self.handler(events)
+                return
+            except Exception as e:
+                traceback.print_exc()
+                error = e
+                if attempt < self.retries:
+                    time.sleep(self.retry_interval)
+
+        self.dead_letter(events, error)
+
+    def dead_letter(self, events, error):
+        """
+        기록할 수 없는 event를 dead-letter 파일(없으면 failed)에 남기고 flush / close에서 알려준다.
+        (handler가 batch 안에서 기록하지 못한 event를 넘길 때도 사용)
+        """
+        try:
+            if self.dead_letter_path is not None:
+                with open(self.dead_letter_path, 'ab') as f:
+                    f.write(pickle.dumps(events, protocol=pickle.HIGHEST_PROTOCOL))
+            else:
+                self.failed.append(events)
+        except Exception:
+            traceback.print_exc()
+            self.failed.append(events)
+        with self.errors_lock:
+            self.errors.append((len(events), error))
+
+    def retry_failed(self):
+        """
+        보관하고 있던 (기록하지 못한) batch를 다시 queue에 넣는다.
+        """
+        failed, self.failed = self.failed, []
+        for events in failed:
+            for event in events:
+                self.put(event)
+
+    def raise_errors(self):
+        with self.errors_lock:
+            errors, self.errors = self.errors, []
+        if errors:
+            count = sum(size for size, _ in errors)
+            raise Exception(f'DB에 기록하지 못한 event가 있습니다. ({count}건, 마지막 오류: {errors[-1][1]!r})')
+
+    def flush(self):
+        """
+        지금까지 들어온 event가 모두 기록될 때까지 기다린다. (기록하지 못한 batch가 있었다면 예외)
+        """
+        if self.is_alive():
+            self.queue.join()
+        self.raise_errors()
+
+    def close(self):
+        if self.stopped.is_set():
+            return
+        if self.is_alive():
+            self.queue.join()
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        atexit.unregister(self.close)
+        self.raise_errors()
@@ -0,0 +1,27 @@
+"""
+LedgerDB의 기본 persistence backend (Django ORM)
+
+core.ledger_db.load_backend가 db_save=True인 Ledger를 처음 만들 때 import하므로 Django는 그때 한번만 부팅된다.
+"""
+try:
+    """
+    Django 관련 모듈이 있다면 DB에 데이터를 저장하여 Ledger 데이터를 persist할 수 있다.
+    """
+    import os
+    from django.db import transaction
+    from django.core.wsgi import get_wsgi_application
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
+    application = get_wsgi_application()
+
+    from user.models import User
+    from db.models import (
+        Ledger,
+        Cash,
+        Order,
+        Fill,
+    )
+
+    DB_AVAILABLE = True
+except:
+    DB_AVAILABLE = False
@@ -0,0 +1,73 @@
+from core.position_watcher import PositionWatcher
+
+
+class ExposureAggregator(PositionWatcher):
+    """
+    모든 ledger / 전략의 포지션을 종목별, 유저별, 전체로 합산한 exposure
+
+    포지션이 바뀔 때마다 (PositionTable listener) 그 포지션이 이전에 더했던 값과의 차이만 반영하기 때문에
+    조회할 때 ledger / 전략을 순회하지 않는다. (O(1))
+
+    net_quantity: 수량 합계 (SELL은 음수) --> 종목별로만 의미가 있다.
+    net_notional: 평균단가 * 수량 합계
+    gross_notional: |평균단가 * 수량| 합계
+    position_amount: |투자금액| 합계
+    leverage: gross_notional / position_amount
+    """
+
+    FIELDS = ('net_quantity', 'net_notional', 'gross_notional', 'position_amount')
+
+    def __init__(self):
+        super().__init__()
+        self.contributions = {}                 # (username, ledger_name) --> {(strategy_name, symbol): 값}
+        self.symbols = {}
+        self.users = {}
+        self.total = dict.fromkeys(self.FIELDS, 0.0)
+
+    def _forget(self, key):
+        for (strategy_name, symbol), values in self.contributions.pop(key, {}).items():
+            self._add(key[0], symbol, values, sign=-1)
+
+    def _exposure(self, position):
+        quantity = getattr(position, 'quantity', 0.0) or 0.0
+        notional = quantity * (getattr(position, 'average_price', 0.0) or 0.0)
+        position_amount = abs(getattr(position, 'position_amount', 0.0) or 0.0) if quantity else 0.0
+        return quantity, notional, abs(notional), position_amount
+
+    def _add(self, username, symbol, values, sign=1):
+        for bucket in (self.symbols.setdefault(symbol, dict.fromkeys(self.FIELDS, 0.0)),
+                       self.users.setdefault(username, dict.fromkeys(self.FIELDS, 0.0)),
+                       self.total):
+            for field, value in zip(self.FIELDS, values):
+                bucket[field] += sign * value
+
+    def on_position(self, key, position):
+        username = key[0]
+        values = self._exposure(position)
+        with self.lock:
+            contributions = self.contributions.setdefault(key, {})
+            row_key = (position.strategy_name, position.symbol)
+            prev = contributions.get(row_key)
+            if prev is not None:
+                self._add(username, position.symbol, prev, sign=-1)
+            self._add(username, position.symbol, values)
+            contributions[row_key] = values
+
+    def _result(self, bucket):
+        if bucket is None:
+            bucket = dict.fromkeys(self.FIELDS, 0.0)
+        res = dict(bucket)
+        res['leverage'] = res['gross_notional'] / res['position_amount'] if res['position_amount'] else 0.0
+        return res
+
+    def get_symbol_exposure(self, symbol):
+        with self.lock:
+            return self._result(self.symbols.get(symbol))
+
+    def get_user_exposure(self, username):
+        with self.lock:
+            return self._result(self.users.get(username))
+
+    def get_total_exposure(self):
+        with self.lock:
+            return self._result(self.total)
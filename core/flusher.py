@@ -0,0 +1,29 @@
+import threading
+import traceback
+
+
+class Flusher(threading.Thread):
+    """
+    write-behind 모드(GROUPED/ASYNC)에서 쌓인 변경사항을 주기적으로 Ledger.flush()로 기록하는 thread
+
+    interval: flush 주기 (초) --> 이 주기가 곧 최대 데이터 손실 구간이 된다.
+
+    flush할 때 init_ttl이 지난 init 주문도 만료시킨다. (주문이 더 들어오지 않는 경우)
+    """
+
+    def __init__(self, ledger, interval=0.1):
+        super().__init__(daemon=True)
+        self.ledger = ledger
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.ledger.expire_init_orders()
+                self.ledger.flush()
+            except:
+                traceback.print_exc()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,144 @@
+import os
+from array import array
+from pathlib import Path
+
+
+class History:
+    """
+    Position history (가격/수량/매매구분/체결여부)를 저장하는 typed array
+
+    capacity가 None이면 제한 없이 늘어나고, capacity가 있으면 고정 크기 ring buffer로 동작한다.
+    ring buffer가 가득 차면 가장 오래된 값을 pending에 옮기고 덮어쓴다.
+    (메모리와 snapshot 크기는 capacity로 제한되지만 full_history()로 전체 history를 조회할 수 있다)
+
+    pending은 flush_spill()에서 spill_path 파일의 정해진 위치(밀려난 순번)에 기록한다.
+    파일 내용이 evicted 수로 정해지기 때문에 journal replay로 같은 값을 다시 기록해도 중복되지 않고,
+    journal에 남지 못한 값이 파일 끝에 남아있다면 다음 flush에서 잘라낸다. (파일은 기록할 때만 열고 닫는다)
+    """
+
+    __slots__ = ('typecode', 'capacity', 'spill_path', 'values', 'start', 'evicted', 'pending', 'spilled')
+
+    def __init__(self, typecode, capacity=None, spill_path=None):
+        if capacity is not None and capacity < 1:
+            raise Exception('history capacity는 1 이상이어야 합니다.')
+        self.typecode = typecode
+        self.capacity = capacity
+        self.spill_path = None if spill_path is None else str(spill_path)
+        self.values = array(typecode)
+        self.start = 0
+        self.evicted = 0
+        self.pending = array(typecode)          # 밀려났지만 아직 파일에 기록하지 않은 값
+        self.spilled = 0                        # 마지막 flush 시점의 파일 길이 (값 개수)
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        for name, value in state.items():
+            setattr(self, name, value)
+        if not hasattr(self, 'pending'):
+            # 밀려난 값을 바로 파일에 기록하던 이전 버전
+            self.pending = array(self.typecode)
+            self.spilled = self.evicted
+
+    def append(self, value):
+        if self.capacity is None or len(self.values) < self.capacity:
+            self.values.append(value)
+            return
+
+        evicted_value = self.values[self.start]
+        self.values[self.start] = value
+        self.start = (self.start + 1) % self.capacity
+        self.evicted += 1
+        if self.spill_path is not None:
+            self.pending.append(evicted_value)
+
+    def extend(self, values):
+        values = array(self.typecode, values)
+        if self.capacity is None:
+            self.values.extend(values)
+            return
+
+        # 한번에 추가하는 경우에는 남길 부분만 메모리에 두고 나머지는 한번에 pending으로 옮긴다.
+        values = array(self.typecode, self) + values
+        overflow = len(values) - self.capacity
+        if overflow > 0:
+            self.evicted += overflow
+            if self.spill_path is not None:
+                self.pending.extend(values[:overflow])
+            values = values[overflow:]
+        self.values = values
+        self.start = 0
+
+    def clear(self):
+        """
+        history를 비운다. (포지션이 닫힐 때) spill 파일은 다음 flush_spill에서 정리한다.
+        """
+        self.values = array(self.typecode)
+        self.start = 0
+        self.evicted = 0
+        self.pending = array(self.typecode)
+
+    @property
+    def spill_dirty(self):
+        return self.spill_path is not None and (len(self.pending) > 0 or self.spilled != self.evicted)
+
+    def flush_spill(self, fsync=False):
+        """
+        pending을 spill 파일의 자기 위치에 기록하고 파일을 evicted개로 맞춘다. (evicted가 0이면 파일 삭제)
+        """
+        if not self.spill_dirty:
+            return False
+
+        if self.evicted == 0:
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+        else:
+            Path(self.spill_path).parent.mkdir(parents=True, exist_ok=True)
+            itemsize = self.pending.itemsize
+            with open(self.spill_path, 'r+b' if os.path.exists(self.spill_path) else 'wb') as f:
+                f.seek((self.evicted - len(self.pending)) * itemsize)
+                self.pending.tofile(f)
+                f.truncate(self.evicted * itemsize)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+        self.pending = array(self.typecode)
+        self.spilled = self.evicted
+        return True
+
+    def sync_spill(self):
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            with open(self.spill_path, 'rb') as f:
+                os.fsync(f.fileno())
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        if self.start == 0:
+            return iter(self.values)
+        return iter(self.values[self.start:] + self.values[:self.start])
+
+    def __getitem__(self, index):
+        size = len(self.values)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('history index out of range')
+        return self.values[(self.start + index) % size]
+
+    def tolist(self):
+        return list(self)
+
+    def full_history(self):
+        """
+        spill 파일에 기록된 값 + 아직 기록하지 않은 값 + 메모리에 남아있는 값
+        """
+        values = array(self.typecode)
+        spilled = self.evicted - len(self.pending)
+        if self.spill_path is not None and spilled and os.path.exists(self.spill_path):
+            with open(self.spill_path, 'rb') as f:
+                values.frombytes(f.read(spilled * values.itemsize))
+        values.extend(self.pending)
+        values.extend(self)
+        return values
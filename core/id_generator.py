@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+class IdGenerator:
+    """
+    Order의 state별 id (init_id, open_id, filled_id, closed_id)를 만드는 방식
+
+    Order.set_id_generator로 교체할 수 있다.
+    """
+
+    def __call__(self, order):
+        raise NotImplementedError
+
+
+class SnowflakeIdGenerator(IdGenerator):
+    """
+    프로세스 내에서 단조 증가하는 64bit 정수 id (기본값)
+
+    | 41bit: EPOCH 이후 ms | 10bit: worker id | 12bit: 같은 ms 안에서의 순번 |
+
+    한 ms 안에서 순번을 모두 사용하면 다음 ms를 미리 빌려 쓰기 때문에 기다리지 않고 항상 상수 시간에 생성된다.
+    53bit를 넘으므로 JSON 응답에서는 문자열로 보낸다. (periphery.codec.JsonCodec, msgpack은 정수 그대로)
+    worker_id: 여러 process가 함께 id를 만든다면 process마다 다른 값을 넘겨야 한다. (기본값인 pid 하위 10bit는 겹칠 수 있다)
+    """
+
+    EPOCH_MS = 1609459200000  # 2021-01-01 00:00:00 UTC
+    WORKER_BITS = 10
+    SEQUENCE_BITS = 12
+
+    def __init__(self, worker_id=None):
+        if worker_id is None:
+            worker_id = os.getpid()
+        self.worker_id = worker_id & ((1 << self.WORKER_BITS) - 1)
+        self.max_sequence = (1 << self.SEQUENCE_BITS) - 1
+        self.last_ms = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, order=None):
+        with self.lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self.last_ms:
+                self.last_ms = now_ms
+                self.sequence = 0
+            elif self.sequence < self.max_sequence:
+                self.sequence += 1
+            else:
+                self.last_ms += 1
+                self.sequence = 0
+
+            return ((self.last_ms - self.EPOCH_MS) << (self.WORKER_BITS + self.SEQUENCE_BITS)) | \
+                   (self.worker_id << self.SEQUENCE_BITS) | \
+                   self.sequence
+
+
+class HashIdGenerator(IdGenerator):
+    """
+    audit 모드: 주문의 모든 property를 hash하여 id를 만든다. (이전 버전의 방식)
+
+    id만 보고도 그 시점의 주문 내용을 검증할 수 있지만, fill_history가 길어질수록 느려진다.
+    json으로 변환할 수 없는 meta는 str로 변환하여 hash한다.
+    """
+
+    def __call__(self, order):
+        return hashlib.sha1(json.dumps(order.to_dict(), default=str).encode('utf-8')).hexdigest()
@@ -0,0 +1,126 @@
+import os
+import pickle
+from pathlib import Path
+
+
+class Durability:
+    """
+    SYNC: mutation마다 바로 기록하고 fsync (손실 없음)
+    GROUPED: flush_size개의 mutation이 쌓이거나 flush 주기가 되면 한번에 기록하고 fsync (손실 구간이 제한됨)
+    ASYNC: background flush 주기에만 기록하고 fsync는 OS에 맡김 (가장 빠름)
+    """
+    SYNC = 'sync'
+    GROUPED = 'grouped'
+    ASYNC = 'async'
+
+    ALL = (SYNC, GROUPED, ASYNC)
+
+
+class Journal:
+    """
+    table에서 발생하는 변경사항(mutation)을 하나의 record로 append하는 write-ahead log
+
+    table 전체를 매번 pickle하는 대신 변경된 부분만 기록하기 때문에
+    table의 크기와 상관없이 한번의 저장 비용이 일정하다.
+
+    모든 record에는 순차적으로 증가하는 lsn(log sequence number)이 부여된다.
+    snapshot에 저장된 lsn 이하의 record는 이미 반영된 것이므로 replay하지 않는다.
+
+    durability가 SYNC가 아니라면 record를 메모리에 모아두었다가 flush할 때 한번에 기록한다. (group commit)
+    """
+
+    def __init__(self, path, durability=Durability.SYNC, flush_size=100):
+        self.path = Path(path)
+        self.rotated_path = self.path.with_name(self.path.name + '.old')
+        self.durability = durability
+        self.flush_size = flush_size
+        self.file = None
+        self.buffer = []
+        self.lsn = 0
+
+    def append(self, record):
+        self.lsn += 1
+        self.buffer.append(pickle.dumps((self.lsn, record), protocol=pickle.HIGHEST_PROTOCOL))
+
+        if self.durability == Durability.SYNC:
+            self.flush()
+        elif self.durability == Durability.GROUPED and len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+        self.file.write(b''.join(self.buffer))
+        self.buffer = []
+        self.file.flush()
+        if self.durability != Durability.ASYNC:
+            os.fsync(self.file.fileno())
+
+    def replay(self, after_lsn=0):
+        """
+        after_lsn 이후의 record를 기록된 순서대로 리턴한다. (rotate된 log가 남아있다면 먼저 읽는다)
+
+        마지막 record가 쓰는 도중에 프로세스가 종료되었다면 (torn write) 그 부분은 잘라낸다.
+        """
+        self.lsn = max(self.lsn, after_lsn)
+        for path in (self.rotated_path, self.path):
+            for lsn, record in self._read(path):
+                if lsn > after_lsn:
+                    self.lsn = max(self.lsn, lsn)
+                    yield record
+
+    def _read(self, path):
+        if not os.path.exists(path):
+            return
+
+        valid_size = 0
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    entry = pickle.load(f)
+                except Exception:           # EOFError (끝) / UnpicklingError (torn write)
+                    break
+                valid_size = f.tell()
+                yield entry
+
+        if valid_size != os.path.getsize(path):
+            with open(path, 'ab') as f:
+                f.truncate(valid_size)
+
+    def rotate(self):
+        """
+        checkpoint를 시작할 때 현재 log를 .old로 옮기고 새로운 log에 이어서 기록한다.
+
+        이전 checkpoint가 완료되지 못해서 .old가 남아있다면 그 뒤에 이어 붙인다.
+        """
+        self.close()
+        if not os.path.exists(self.path):
+            return
+        if os.path.exists(self.rotated_path):
+            with open(self.rotated_path, 'ab') as dst, open(self.path, 'rb') as src:
+                dst.write(src.read())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.rotated_path)
+
+    def discard_rotated(self):
+        """
+        snapshot이 안전하게 저장된 후에 호출하여 이미 반영된 log를 제거한다.
+        """
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    def truncate(self):
+        self.buffer = []
+        self.close()
+        with open(self.path, 'wb'):
+            pass
+        self.discard_rotated()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
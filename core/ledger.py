@@ -1,13 +1,34 @@
+import os
 import uuid
+import pickle
+import functools
+import threading
 
 from core.order import Order
+from core.clock import now_ns
+from core.table import ledger_path, atomic_write
 from core.cash_table import CashTable
+from core.flusher import Flusher
+from core.journal import Durability
 from core.order_table import OrderTable
+from core.checkpoint import Checkpointer
 from core.position_table import PositionTable
+from core.versions import VersionIndex
 
 from core.ledger_db import LedgerDB
 
 
+def synchronized(method):
+    """
+    checkpoint와 같은 background 작업과 동시에 table을 변경하지 않도록 Ledger lock을 잡고 실행한다.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Ledger(LedgerDB):
     """
     Ledger는 원장이라는 뜻이며, 프로그램 상에서 발생하는 모든 액션을 기록하는 목적을 가지고 있다.
@@ -15,21 +36,160 @@ class Ledger(LedgerDB):
     실제 주문 발생과 같은 역할은 모두 외부에서 발생시키며, 원장은 철저히 데이터 관리에만 집중한다.
     """
 
+    SNAPSHOT_NAME = 'Ledger.pkl'
+    TABLES = ('cash_table', 'order_table', 'position_table')
+
+    # 변경사항 feed로 내보내는 필드 (history 등 큰 필드는 제외)
+    ORDER_DELTA_FIELDS = ('init_id', 'ORDER_STATE', 'symbol', 'side', 'price', 'quantity', 'hash', 'order_number',
+                          'orders_filled', 'orders_remaining')
+    POSITION_DELTA_FIELDS = ('POSITION_STATE', 'symbol', 'side', 'quantity', 'average_price', 'position_amount',
+                             'leverage', 'realized_pnl', 'fees', 'turnover')
+
     def __init__(self,
                  name=str(uuid.uuid1()),
                  username=None,
                  auto_save=False,
-                 db_save=False):
+                 db_save=False,
+                 journal=False,
+                 checkpoint_interval=None,
+                 checkpoint_records=None,
+                 durability=Durability.SYNC,
+                 flush_interval=100,
+                 flush_size=100,
+                 init_ttl=None,
+                 archive=False,
+                 history_capacity=None,
+                 history_spill=True,
+                 db_write_behind=True):
         """
         auto_save: pkl파일로 각 table의 상태를 저장
         db_save: 모든 transaction을 DB에 저장
+        journal: auto_save를 pkl 전체 저장 대신 변경사항 log(append-only)로 처리
+        checkpoint_interval: journal 모드에서 세 table의 snapshot을 background로 저장하는 주기 (초)
+        checkpoint_records: 쌓인 log record 수가 이 값을 넘으면 주기와 상관없이 checkpoint
+        durability: sync / grouped / async --> auto_save 저장을 요청 thread에서 바로 할지, background로 모아서 할지
+        flush_interval: grouped/async 모드에서 background flush 주기 (ms)
+        flush_size: grouped 모드에서 이 개수만큼 mutation이 쌓이면 주기와 상관없이 flush
+        init_ttl: 거래소 접수가 되지 않은 init 주문을 만료시키는 시간 (초)
+        archive: 체결완료/취소된 주문을 버리지 않고 columnar archive(~/easy_ledger/<user>/<ledger>/archive)에 보관
+        history_capacity: 포지션 history(가격/수량/매매구분/체결여부)를 메모리에 최근 몇개까지 유지할지 (None이면 제한 없음)
+        history_spill: history_capacity를 넘어서 밀려난 history를 ~/easy_ledger/<user>/<ledger>/history에 기록
+        db_write_behind: db_save를 요청 thread에서 바로 쿼리하지 않고 background에서 batch로 기록
         """
 
-        super().__init__(name, username, db_save)
+        super().__init__(name, username, db_save, write_behind=db_write_behind)
+
+        self.lock = threading.RLock()
+        self.checkpoint_lock = threading.Lock()
+        self.journaled = auto_save and journal
+        self.snapshot_path = ledger_path(username, name) / self.SNAPSHOT_NAME
+        snapshot = self._load_snapshot() if self.journaled else {}
+
+        table_params = {'user_name': username, 'ledger_name': name, 'auto_save': auto_save, 'journal': journal,
+                        'durability': durability, 'flush_size': flush_size}
+        self.cash_table = CashTable(**table_params, snapshot=snapshot.get('cash_table'))
+        self.archive = None
+        if archive:
+            from core.archive import OrderArchive  # numpy는 archive를 사용할 때만 import
+
+            self.archive = OrderArchive(ledger_path(username, name) / 'archive', flush_size=flush_size,
+                                        durability=durability)
+        self.order_table = OrderTable(**table_params, snapshot=snapshot.get('order_table'),
+                                      init_ttl=init_ttl, archive=self.archive)
+        spill_dir = ledger_path(username, name) / 'history' if (history_capacity and history_spill) else None
+        self.position_table = PositionTable(**table_params, snapshot=snapshot.get('position_table'),
+                                            history_capacity=history_capacity, spill_dir=spill_dir)
+        self.checkpoint_lsn = {name: snapshot[name]['lsn'] if name in snapshot else 0 for name in self.TABLES}
 
-        self.cash_table = CashTable(user_name=username, ledger_name=name, auto_save=auto_save)
-        self.order_table = OrderTable(user_name=username, ledger_name=name, auto_save=auto_save)
-        self.position_table = PositionTable(user_name=username, ledger_name=name, auto_save=auto_save)
+        # 변경사항 feed: 변경이 있을 때마다 ledger 안에서 단조 증가하는 seq를 붙여서 listener에 넘긴다.
+        # (seq는 ledger를 불러올 때마다 새로 시작하므로 epoch가 바뀌면 구독하는 쪽은 전체를 다시 조회해야 한다)
+        # change seq는 주문 / 포지션의 변경 version으로도 사용한다. (get_changes(since_version=...))
+        self.change_listeners = []
+        self.change_seq = 0
+        self.change_epoch = now_ns()
+        self.versions = {'orders': VersionIndex(), 'positions': VersionIndex()}
+        self.position_table.add_listener(
+            lambda position: self._emit_change('position', position.strategy_name, self._position_delta(position)))
+        self.order_table.add_removal_listener(
+            lambda order: self._emit_change('order_removed', order.strategy_name,
+                                            {'init_id': order.init_id, 'ORDER_STATE': order.ORDER_STATE}))
+
+        self.checkpointer = None
+        if self.journaled and checkpoint_interval is not None:
+            self.checkpointer = Checkpointer(self, interval=checkpoint_interval, max_records=checkpoint_records)
+            self.checkpointer.start()
+
+        self.flusher = None
+        if auto_save and durability != Durability.SYNC:
+            self.flusher = Flusher(self, interval=flush_interval / 1000)
+            self.flusher.start()
+
+    def _load_snapshot(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                return pickle.load(f)
+        return {}
+
+    def pending_records(self):
+        """
+        마지막 checkpoint 이후에 log에 쌓인 record 수
+        """
+        if not self.journaled:
+            return 0
+        return sum(getattr(self, name).journal.lsn - self.checkpoint_lsn[name] for name in self.TABLES)
+
+    def checkpoint(self):
+        """
+        세 table의 상태를 하나의 snapshot 파일로 저장하고 반영된 log를 정리한다.
+
+        1. lock을 잡은 상태에서 세 table을 한번에 직렬화하고 log를 rotate (cash/order/position이 같은 시점)
+        2. 임시 파일에 쓰고 fsync 후 rename하여 snapshot을 원자적으로 교체
+        3. snapshot에 반영된 (rotate된) log 제거
+
+        2번 도중 프로세스가 종료되어도 이전 snapshot + rotate된 log + 새 log로 복구된다.
+        """
+        if not self.journaled:
+            return
+
+        with self.checkpoint_lock:
+            with self.lock:
+                self.position_table.sync_spills()      # snapshot에 기록될 spill 위치까지 파일에 먼저 기록
+                state = {name: getattr(self, name).snapshot() for name in self.TABLES}
+                data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+                for name in self.TABLES:
+                    getattr(self, name).journal.rotate()
+
+            atomic_write(self.snapshot_path, data)
+
+            for name in self.TABLES:
+                getattr(self, name).journal.discard_rotated()
+
+            self.checkpoint_lsn = {name: state[name]['lsn'] for name in self.TABLES}
+
+    def flush(self):
+        with self.lock:
+            for name in self.TABLES:
+                getattr(self, name).flush()     # order_table은 archive를 먼저 기록한다.
+        self.flush_db()
+
+    def close(self):
+        if self.flusher is not None:
+            self.flusher.stop()
+            self.flusher.join()
+        if self.checkpointer is not None:
+            self.checkpointer.stop()
+            self.checkpointer.join()
+        try:
+            self.close_db()     # DB에 기록하지 못한 event가 있다면 나머지를 모두 정리한 뒤에 예외가 전달된다.
+        finally:
+            self.flush()
+            if self.archive is not None:
+                self.archive.close()
+            if self.journaled:
+                self.checkpoint()
+                for name in self.TABLES:
+                    getattr(self, name).journal.close()
+            self.position_table.close()
 
     def order_hash(self, symbol, price, quantity, side, order_type, quote, meta):
         return Order.make_order_hash(symbol=symbol,
@@ -40,46 +200,192 @@ class Ledger(LedgerDB):
                                      quote=quote,
                                      meta=meta)
 
+    @synchronized
     def get_cash(self, strategy_name, quote=None):
         return self.cash_table.get_cash(strategy_name=strategy_name, quote=quote)
 
+    @synchronized
     def update_cash(self, strategy_name, amount, quote=None):
         self.cash_table.update_cash(strategy_name=strategy_name, amount=amount, quote=quote)
         self.update_cash_db(strategy_name=strategy_name, amount=amount, quote=quote)
+        self._emit_change('cash', strategy_name, {'quote': quote, 'amount': amount})
 
+    @synchronized
     def get_orders(self, strategy_name):
         return self.order_table.get_orders(strategy_name=strategy_name)
 
+    @synchronized
     def get_order(self, strategy_name, order_number, format='dict'):
         order = self.order_table.get_order(strategy_name=strategy_name, order_number=order_number)
         if order is not None:
             if format == 'dict':
-                return order.__dict__
+                return order.to_dict()
             else:
                 return order
 
+    @synchronized
     def clean_orders(self, state, strategy_name=None):
         self.order_table.clean_orders(state=state, strategy_name=strategy_name)
 
+    @synchronized
+    def get_archived_orders(self, strategy_name=None, symbol=None, day=None, table='orders'):
+        """
+        archive에 보관된 완료 주문(table='orders') 혹은 체결 내역(table='fills') 조회 (day: YYYYMMDD, None이면 오늘)
+        """
+        if self.archive is None:
+            return {}
+        return self.archive.query(table=table, day=day, strategy_name=strategy_name, symbol=symbol)
+
+    @synchronized
     def get_positions(self, strategy_name):
         return self.position_table.get_positions(strategy_name=strategy_name)
 
+    @synchronized
     def get_position(self, strategy_name, symbol, format='dict'):
         position = self.position_table.get_position(strategy_name=strategy_name, symbol=symbol)
         if format == 'dict':
-            return position.__dict__
+            return position.to_dict()
         else:
             return position
 
-    def update_position(self, strategy_name, symbol, side, price, quantity, position_amount=None, order_state=None):
+    @synchronized
+    def rebuild_positions(self, fills=None):
+        """
+        fill 기록으로 모든 포지션을 다시 계산한다. (fills가 None이면 DB의 Fill/Order 기록 사용)
+
+        fills: [(strategy_name, symbol, side, price, quantity, position_amount, order_state), ...] 혹은 column dict
+        """
+        if fills is None:
+            if not self.db_save:
+                raise Exception('fill 기록이 없습니다. (db_save가 활성화되어 있지 않음)')
+            fills = self.load_fills_db()
+        self.position_table.rebuild(fills)
+        self._emit_change('reset', None, {})
+
+    def add_change_listener(self, listener):
+        """
+        listener(event): 주문 / 포지션 / cash가 바뀔 때마다 호출 (ledger lock 안에서 호출되므로 빠르게 리턴해야 한다)
+
+        event: {'seq', 'epoch', 'type': order|position|cash|reset, 'strategy_name', 'data'}
+        reset: 여러 table이 한번에 교체되었으므로 전체를 다시 조회해야 한다.
+        """
+        self.change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        if listener in self.change_listeners:
+            self.change_listeners.remove(listener)
+
+    def _emit_change(self, event_type, strategy_name, data):
+        self.change_seq += 1
+        version = self.change_seq
+        if event_type == 'position':
+            self.versions['positions'].touch(strategy_name, data['symbol'], version)
+        elif event_type in ('order', 'order_removed'):
+            # 취소/체결완료로 이미 table에서 빠진 주문은 tombstone으로 남긴다.
+            if data['init_id'] in self.order_table.order_table:
+                self.versions['orders'].touch(strategy_name, data['init_id'], version)
+            else:
+                self.versions['orders'].remove(strategy_name, data['init_id'], version)
+        elif event_type == 'reset':
+            for index in self.versions.values():
+                index.reset(version)
+
+        if not self.change_listeners:
+            return
+        event = {'seq': version, 'epoch': self.change_epoch, 'type': event_type,
+                 'strategy_name': strategy_name, 'data': data}
+        for listener in self.change_listeners:
+            listener(event)
+
+    @synchronized
+    def get_changes(self, table, strategy_name, since_version=None, epoch=None):
+        """
+        table(orders / positions)에서 since_version 이후 바뀐 entry만 조회
+
+        since_version / epoch는 이전 응답의 version / epoch를 그대로 넘긴다. (JSON 응답에서 문자열로 받은 epoch도 가능)
+        epoch가 다르거나 (ledger를 다시 불러옴) since_version이 너무 오래되었다면 전체를 돌려준다. (full=True)
+        --> {'version', 'epoch', 'full', 'entries': [Order] 혹은 {symbol: Position}, 'removed': [init_id 혹은 symbol]}
+        """
+        if table not in self.versions:
+            raise Exception(f'{table}은 지원하지 않는 table입니다. (orders / positions)')
+
+        res = {'version': self.change_seq, 'epoch': self.change_epoch, 'full': True, 'removed': []}
+        changes = None
+        if since_version is not None and epoch is not None and int(epoch) == self.change_epoch:
+            changes = self.versions[table].changed(strategy_name, since_version)
+
+        if changes is None:
+            if table == 'orders':
+                entries = {order.init_id: order for order in self.order_table.get_orders(strategy_name=strategy_name)}
+            else:
+                entries = self.position_table.get_positions(strategy_name=strategy_name)
+        else:
+            # 바뀐 entry만 찾는다. (전체 table을 만들지 않음)
+            changed, removed = changes
+            if table == 'orders':
+                lookup = lambda key: self.order_table.get_order_by_id(strategy_name, key)
+            else:
+                lookup = self.position_table.get_positions(strategy_name=strategy_name).get
+            entries = {}
+            for key in changed:
+                entry = lookup(key)
+                if entry is None:
+                    removed.append(key)
+                else:
+                    entries[key] = entry
+            res['removed'] = removed
+            res['full'] = False
+        res['entries'] = list(entries.values()) if table == 'orders' else entries
+        return res
+
+    def _order_delta(self, order):
+        return {field: getattr(order, field, None) for field in self.ORDER_DELTA_FIELDS}
+
+    def _position_delta(self, position):
+        return {field: getattr(position, field, None) for field in self.POSITION_DELTA_FIELDS}
+
+    @synchronized
+    def recover_db(self, chunk_size=2000):
+        """
+        DB 기록으로 in-memory table을 다시 만든다. (pkl/journal과 DB가 어긋났거나 로컬 상태가 없는 경우)
+
+        init/open 주문 --> OrderTable, Cash --> CashTable, Fill 기록 --> PositionTable (vectorized rebuild)
+        chunk_size: DB에서 server-side cursor로 한번에 가져오는 row 수
+        """
+        if not self.db_save:
+            raise Exception('DB에서 복구할 수 없습니다. (db_save가 활성화되어 있지 않음)')
+        self.order_table.load_orders(self.load_orders_db(chunk_size=chunk_size))
+        self.cash_table.load_cash(self.load_cash_db(chunk_size=chunk_size))
+        self.position_table.rebuild(self.load_fills_db(chunk_size=chunk_size))
+        self._emit_change('reset', None, {})
+
+    @synchronized
+    def get_position_history(self, strategy_name, symbol, name='price_history'):
+        """
+        history_capacity로 밀려난 부분(spill 파일)까지 포함한 포지션의 전체 history
+        """
+        return self.position_table.get_full_history(strategy_name=strategy_name, symbol=symbol, name=name)
+
+    @synchronized
+    def update_position(self, strategy_name, symbol, side, price, quantity, position_amount=None, order_state=None,
+                        fee=0.0):
         self.position_table.update_position(strategy_name=strategy_name,
                                             symbol=symbol,
                                             side=side,
                                             price=price,
                                             quantity=quantity,
                                             position_amount=position_amount,
-                                            order_state=order_state)
+                                            order_state=order_state,
+                                            fee=fee)
+
+    @synchronized
+    def get_strategy_pnl(self, strategy_name):
+        """
+        전략의 누적 실현손익 / 수수료 / 거래대금 (realized_pnl, fees, turnover, net_pnl)
+        """
+        return self.position_table.get_strategy_pnl(strategy_name=strategy_name)
 
+    @synchronized
     def init_order(self, strategy_name, symbol, price, quantity, side, order_type, quote=None, meta=None):
         order = Order(strategy_name=strategy_name,
                       symbol=symbol,
@@ -91,13 +397,24 @@ class Ledger(LedgerDB):
                       meta=meta)
         self.order_table.add_order(order)
         self.init_order_db(order)
+        self._emit_change('order', strategy_name, self._order_delta(order))
         return order.hash
 
+    @synchronized
+    def expire_init_orders(self):
+        """
+        init_ttl이 지나도록 접수되지 않은 init 주문 만료 (새 주문이 없어도 Flusher / Checkpointer 주기마다 호출)
+        """
+        return self.order_table.expire_init_orders()
+
+    @synchronized
     def register_order(self, order_number, order_hash):
         order = self.order_table.make_open_order(order_hash=order_hash, order_number=order_number)
         self.register_order_db(order)
+        self._emit_change('order', order.strategy_name, self._order_delta(order))
         return order.strategy_name
 
+    @synchronized
     def cancel_order(self, strategy_name, order_number):
         orders = self.order_table.remove_order(strategy_name=strategy_name, order_number=order_number)
         for order in orders:
@@ -110,13 +427,17 @@ class Ledger(LedgerDB):
                                                 position_amount=0.0,
                                                 order_state=order.ORDER_STATE)
             self.cancel_order_db(order)
+            self._emit_change('order', strategy_name, self._order_delta(order))
 
-    def fill_order(self, strategy_name, order_number, price, quantity, position_amount=None):
+    @synchronized
+    def fill_order(self, strategy_name, order_number, price, quantity, position_amount=None, fee=0.0):
         order = self.order_table.fill_order(strategy_name=strategy_name,
                                             order_number=order_number,
                                             quantity=quantity,
-                                            return_order=True)
+                                            return_order=True,
+                                            price=price)
         self.fill_order_db(order, price)
+        self._emit_change('order', strategy_name, self._order_delta(order))
 
         order_base_info = order.order_base_info
         self.position_table.update_position(strategy_name=strategy_name,
@@ -125,7 +446,8 @@ class Ledger(LedgerDB):
                                             price=price,
                                             quantity=quantity,
                                             position_amount=position_amount,
-                                            order_state=order.ORDER_STATE)
+                                            order_state=order.ORDER_STATE,
+                                            fee=fee)
 
 
 if __name__ == '__main__':
@@ -1,44 +1,85 @@
-import datetime
+import importlib
+from array import array
+from collections import ChainMap
 
-try:
-    """
-    Django 관련 모듈이 있다면 DB에 데이터를 저장하여 Ledger 데이터를 persist할 수 있다.
+from core.clock import format_timestamp, parse_timestamp
+from core.order import Order as CoreOrder, OrderState
+from core.db_writer import DBWriter
+from core.table import ledger_path
+
+DB_BACKENDS = {
+    'django': 'core.django_backend',
+}
+
+_loaded_backends = {}
+
+
+def load_backend(name='django'):
     """
-    import os
-    from django.contrib.auth import authenticate
-    from django.core.wsgi import get_wsgi_application
+    persistence backend module을 처음 사용할 때 import한다. (db_save=False라면 Django를 부팅하지 않는다)
 
-    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
-    application = get_wsgi_application()
+    backend module은 DB_AVAILABLE, transaction, User, Ledger, Order, Fill, Cash를 제공해야 한다.
+    DB_BACKENDS에 없는 이름은 module 경로로 보고 import한다. 사용할 수 없다면 None
+    """
+    if name not in _loaded_backends:
+        try:
+            backend = importlib.import_module(DB_BACKENDS.get(name, name))
+        except ImportError:
+            backend = None
+        if backend is not None and not getattr(backend, 'DB_AVAILABLE', False):
+            backend = None
+        _loaded_backends[name] = backend
+    return _loaded_backends[name]
 
-    from user.models import User, UserProfile
-    from db.models import (
-        Ledger,
-        Strategy,
-        Cash,
-        Order,
-        Fill,
-        Position,
-        Universe,
-    )
 
-    DB_AVAILABLE = True
-except:
-    DB_AVAILABLE = False
+def list_ledgers_db(username, db_backend='django'):
+    """
+    DB에 저장된 유저의 ledger 이름 목록 (backend를 사용할 수 없다면 빈 목록)
+    """
+    backend = load_backend(db_backend)
+    if backend is None:
+        return []
+    return list(backend.Ledger.objects.filter(user__email=username).order_by('id').values_list('name', flat=True))
 
 
 class LedgerDB:
+    """
+    Ledger의 변경사항을 Django DB에 기록한다.
+
+    write_behind: 요청을 처리하는 thread에서 바로 쿼리하지 않고 event를 queue에 넣어두면
+                  DBWriter가 background에서 모아서 bulk_create / bulk_update로 한번의 transaction에 기록한다.
+                  (False라면 event 하나를 바로 같은 방식으로 기록)
+
+    db_backend: db_save=True일 때만 load_backend로 불러오는 persistence backend (기본: Django)
+    write_behind에서 기록하지 못한 batch는 ~/easy_ledger/<user>/<ledger>/DBWriter.dead에 남기고 flush_db / close_db에서 예외
+    order_pks: 주문 row를 만들 때 (strategy_name, init_id)별 pk를 기억해두고 이후 update는 pk로 바로 처리한다.
+    """
+
+    DEAD_LETTER_NAME = 'DBWriter.dead'         # 재시도 후에도 DB에 기록하지 못한 event batch (pickle)
+
+    ORDER_FIELDS = ('strategy_name', 'order_state', 'init_time', 'symbol', 'quantity', 'price', 'side', 'order_type',
+                    'quote', 'meta', 'hash', 'init_id')
 
-    def __init__(self, name=None, username=None, db_save=False):
+    def __init__(self, name=None, username=None, db_save=False, write_behind=True, queue_size=10000, batch_size=500,
+                 db_backend='django'):
         self.name = name
         self.username = username
         self.db_save = db_save
 
-        self.db_save = (DB_AVAILABLE and db_save)
+        self.backend = load_backend(db_backend) if db_save else None
+        self.db_save = self.backend is not None
         self.sync_db()
 
+        self.order_pks = {}                     # (strategy_name, init_id) --> Order pk
+        self.db_writer = None
+        if self.db_save and write_behind:
+            self.db_writer = DBWriter(self._write_batch, max_queue=queue_size, batch_size=batch_size,
+                                      dead_letter_path=ledger_path(self.username, self.name) / self.DEAD_LETTER_NAME)
+            self.db_writer.start()
+
     def sync_db(self):
         if self.db_save:
+            User, Ledger = self.backend.User, self.backend.Ledger
             if self.username is None:
                 self.username = input('[Ledger] Enter Email: ')
             self.user = User.objects.filter(email=self.username).first()
@@ -55,72 +96,294 @@ class LedgerDB:
             else:
                 self.db = ledger
 
+    def _write(self, event, data):
+        if self.db_writer is not None:
+            self.db_writer.put((event, data))
+        else:
+            self._write_batch([(event, data)])
+
+    def _write_batch(self, events):
+        """
+        event 목록을 하나의 transaction으로 기록한다.
+
+        init_order: 새로 만들 주문 (bulk_create), 같은 batch 안의 update는 생성 전에 미리 반영
+        update_order: 주문 상태 변경 (init_id로 한번에 조회 후 bulk_update)
+        add_fill: 체결 내역 (bulk_create)
+        update_cash: 전략/quote별 마지막 금액만 반영 (기존 row를 한번에 조회 후 bulk_update, 없는 row는 bulk_create)
+
+        DB에서 주문 row를 찾지 못한 update / fill은 버리지 않고 commit 후에 dead-letter로 넘긴다. (_unresolved)
+        """
+        Order, Fill, Cash, transaction = self.backend.Order, self.backend.Fill, self.backend.Cash, self.backend.transaction
+        new_orders = {}
+        updates = {}
+        fills = []
+        cash = {}
+
+        for event, data in events:
+            if event == 'init_order':
+                new_orders[(data['strategy_name'], str(data['init_id']))] = Order(user=self.user, ledger=self.db, **data)
+            elif event == 'update_order':
+                key = (data['strategy_name'], str(data['init_id']))
+                fields = {field: value for field, value in data.items() if field not in ('strategy_name', 'init_id')}
+                if key in new_orders:
+                    for field, value in fields.items():
+                        setattr(new_orders[key], field, value)
+                else:
+                    updates.setdefault(key, {}).update(fields)
+            elif event == 'add_fill':
+                fills.append(data)
+            elif event == 'update_cash':
+                cash[(data['strategy_name'], data['quote'])] = data['amount']
+
+        # transaction이 commit된 뒤에만 cache에 반영한다. (rollback된 pk를 기억하지 않도록)
+        pks = ChainMap({}, self.order_pks)
+        with transaction.atomic():
+            if new_orders:
+                created = Order.objects.bulk_create(list(new_orders.values()))
+                for key, o in zip(new_orders, created):
+                    if o.pk is not None:
+                        pks[key] = o.pk
+
+            # pk를 모르는 주문 (bulk_create가 pk를 돌려주지 않는 DB이거나 재시작 이전에 만들어진 주문)만 한번에 조회한다.
+            keys = set(updates) | {(fill['strategy_name'], str(fill['init_id'])) for fill in fills}
+            missing = {key for key in keys if key not in pks}
+            if missing:
+                qs = Order.objects.filter(user=self.user, ledger=self.db,
+                                          init_id__in={init_id for _, init_id in missing})
+                for pk, strategy_name, init_id in qs.values_list('pk', 'strategy_name', 'init_id'):
+                    if (strategy_name, init_id) in missing:
+                        pks[(strategy_name, init_id)] = pk
+
+            # 조회 없이 pk로 바로 update (UPDATE ... WHERE id IN (...))
+            # bulk_update는 넘겨준 field를 모든 row에 기록하므로 update한 field 조합이 같은 주문끼리 묶는다.
+            groups = {}
+            for key, fields in updates.items():
+                if key in pks:
+                    groups.setdefault(tuple(sorted(fields)), []).append(Order(pk=pks[key], **fields))
+            for update_fields, changed in groups.items():
+                Order.objects.bulk_update(changed, list(update_fields))
+
+            Fill.objects.bulk_create([Fill(order_id=pks[key],
+                                           timestamp=fill['timestamp'],
+                                           quantity=fill['quantity'],
+                                           price=fill['price'])
+                                      for fill in fills
+                                      for key in [(fill['strategy_name'], str(fill['init_id']))]
+                                      if key in pks])
+
+            if cash:
+                rows, new_rows = [], []
+                existing = Cash.objects.filter(user=self.user, ledger=self.db,
+                                               strategy_name__in={strategy_name for strategy_name, _ in cash})
+                for row in existing:
+                    key = (row.strategy_name, row.quote)
+                    if key in cash:
+                        row.amount = cash[key]
+                        rows.append(row)
+                found = {(row.strategy_name, row.quote) for row in rows}
+                for (strategy_name, quote), amount in cash.items():
+                    if (strategy_name, quote) not in found:
+                        new_rows.append(Cash(user=self.user, ledger=self.db, strategy_name=strategy_name,
+                                             quote=quote, amount=amount))
+                if rows:
+                    Cash.objects.bulk_update(rows, ['amount'])
+                if new_rows:
+                    Cash.objects.bulk_create(new_rows)
+
+            unresolved = [(event, data) for event, data in events if event in ('update_order', 'add_fill')
+                          for key in [(data['strategy_name'], str(data['init_id']))]
+                          if key not in pks and not (event == 'update_order' and key in new_orders)]
+
+        # 체결완료/취소된 주문은 더이상 update되지 않으므로 cache에서 제거
+        self.order_pks.update(pks.maps[0])
+        for key, o in list(new_orders.items()) + list(updates.items()):
+            state = o.order_state if isinstance(o, Order) else o.get('order_state')
+            if state in (OrderState.FILLED, OrderState.CLOSED):
+                self.order_pks.pop(key, None)
+        if unresolved:
+            self._unresolved(unresolved)
+
+    def _unresolved(self, events):
+        error = Exception(f'DB에서 주문을 찾을 수 없습니다. ({len(events)}건: '
+                          f'{sorted({(data["strategy_name"], str(data["init_id"])) for _, data in events})})')
+        print(f'[LedgerDB] {error}')
+        if self.db_writer is not None:
+            self.db_writer.dead_letter(events, error)
+
+    def flush_db(self):
+        if self.db_writer is not None:
+            self.db_writer.flush()
+
+    def close_db(self):
+        if self.db_writer is not None:
+            self.db_writer.close()
+
     def update_cash_db(self, strategy_name, amount, quote='krw'):
         if self.db_save:
-            cash = Cash.objects.get_or_create(user=self.user,
-                                              strategy_name=strategy_name,
-                                              quote=quote)[0]
-            cash.amount = amount
-            cash.save()
+            self._write('update_cash', {'strategy_name': strategy_name, 'quote': quote, 'amount': amount})
 
     def init_order_db(self, order):
         if self.db_save:
-            order_instance = Order(user=self.user,
-                                   strategy_name=order.strategy_name,
-                                   order_state=order.ORDER_STATE,
-                                   init_time=order.init_time,
-                                   symbol=order.symbol,
-                                   quantity=order.quantity,
-                                   price=order.price,
-                                   side=order.side,
-                                   order_type=order.order_type,
-                                   quote=order.quote,
-                                   meta=order.meta,
-                                   hash=order.hash,
-                                   init_id=order.init_id)
-            order_instance.save()
+            data = {field: getattr(order, field) for field in self.ORDER_FIELDS if field not in ('order_state', 'init_time')}
+            data['order_state'] = order.ORDER_STATE
+            data['init_time'] = format_timestamp(order.init_time)
+            self._write('init_order', data)
 
     def register_order_db(self, order):
         if self.db_save:
-            o = Order.objects.filter(user=self.user,
-                                     strategy_name=order.strategy_name,
-                                     init_id=order.init_id).first()
-            o.order_state = order.ORDER_STATE
-            o.order_number = order.order_number
-            o.open_id = order.open_id
-            o.open_time = order.open_time
-            o.orders_filled = order.orders_filled
-            o.orders_remaining = order.orders_remaining
-            o.save()
+            self._write('update_order', {'strategy_name': order.strategy_name,
+                                         'init_id': order.init_id,
+                                         'order_state': order.ORDER_STATE,
+                                         'order_number': order.order_number,
+                                         'open_id': order.open_id,
+                                         'open_time': format_timestamp(order.open_time),
+                                         'orders_filled': order.orders_filled,
+                                         'orders_remaining': order.orders_remaining})
 
     def cancel_order_db(self, order):
         if self.db_save:
-            o = Order.objects.filter(user=self.user,
-                                     strategy_name=order.strategy_name,
-                                     init_id=order.init_id).first()
-            o.order_state = order.ORDER_STATE
-            o.closed_id = order.closed_id
-            o.closed_time = order.closed_time
-            o.save()
+            self._write('update_order', {'strategy_name': order.strategy_name,
+                                         'init_id': order.init_id,
+                                         'order_state': order.ORDER_STATE,
+                                         'closed_id': order.closed_id,
+                                         'closed_time': format_timestamp(order.closed_time)})
 
     def fill_order_db(self, order, price):
         if self.db_save:
-            o = Order.objects.filter(user=self.user,
-                                     strategy_name=order.strategy_name,
-                                     init_id=order.init_id).first()
-            o.order_state = order.ORDER_STATE
-            o.filled_id = order.filled_id
-            o.filled_time = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]
-            o.orders_filled = order.orders_filled
-            o.orders_remaining = order.orders_remaining
-            o.save()
-
-            fill_history = order.fill_history
-
-            if fill_history:
-                fill = fill_history[-1]
-                f = Fill(order=o,
-                         timestamp=fill['timestamp'],
-                         quantity=fill['quantity'],
-                         price=price)
-                f.save()
\ No newline at end of file
+            fill = order.last_fill
+            self._write('update_order', {'strategy_name': order.strategy_name,
+                                         'init_id': order.init_id,
+                                         'order_state': order.ORDER_STATE,
+                                         'filled_id': order.filled_id,
+                                         'orders_filled': order.orders_filled,
+                                         'orders_remaining': order.orders_remaining})
+            if fill is not None:
+                self._write('add_fill', {'strategy_name': order.strategy_name,
+                                         'init_id': order.init_id,
+                                         'timestamp': format_timestamp(fill['timestamp']),
+                                         'quantity': fill['quantity'],
+                                         'price': price})
+
+    def load_fills_db(self, chunk_size=2000):
+        """
+        DB의 Fill/Order 기록을 포지션 rebuild에 사용하는 fill 목록으로 변환한다. (시간순)
+
+        Ledger.cancel_order와 같이 취소된 주문은 수량 0의 fill로, 주문의 마지막 체결은 filled 상태로 기록한다.
+        chunk_size: server-side cursor로 한번에 가져오는 row 수 (전체 queryset을 메모리에 올리지 않는다)
+        """
+        if not self.db_save:
+            return []
+
+        Order, Fill = self.backend.Order, self.backend.Fill
+        fills = Fill.objects.filter(order__user=self.user, order__ledger=self.db) \
+            .order_by('order_id', 'timestamp', 'id') \
+            .values_list('order_id', 'order__strategy_name', 'order__symbol', 'order__side', 'order__order_state',
+                         'timestamp', 'price', 'quantity')
+        cancelled = Order.objects.filter(user=self.user, ledger=self.db, order_state=OrderState.CLOSED) \
+            .values_list('strategy_name', 'symbol', 'side', 'closed_time')
+        return fill_events(fills.iterator(chunk_size=chunk_size), cancelled.iterator(chunk_size=chunk_size))
+
+    def load_orders_db(self, chunk_size=2000):
+        """
+        DB에 남아있는 init/open 주문을 Order 객체로 복구한다. (init 주문은 init_time 순서 --> 접수 대기 queue 순서)
+        """
+        if not self.db_save:
+            return []
+
+        Order, Fill = self.backend.Order, self.backend.Fill
+        states = (OrderState.INIT, OrderState.OPEN)
+        fields = ('pk', 'ORDER_STATE', 'init_time', 'strategy_name', 'symbol', 'quantity', 'price', 'side',
+                  'order_type', 'quote', 'meta', 'hash', 'init_id', 'open_id', 'open_time', 'order_number',
+                  'orders_filled', 'orders_remaining')
+        rows = Order.objects.filter(user=self.user, ledger=self.db, order_state__in=states) \
+            .order_by('init_time', 'id') \
+            .values_list('pk', 'order_state', *fields[2:])
+
+        orders = {}
+        for row in rows.iterator(chunk_size=chunk_size):
+            order = CoreOrder.__new__(CoreOrder)
+            values = dict(zip(fields, row))
+            pk = values.pop('pk')
+            for name, value in values.items():
+                setattr(order, name, value)
+            order.init_id = _parse_id(order.init_id)
+            order.open_id = _parse_id(order.open_id)
+            order.closed_id = None
+            order.filled_id = None
+            for name in ('init_time', 'open_time'):
+                if getattr(order, name) is not None:
+                    setattr(order, name, parse_timestamp(getattr(order, name)))
+            if order.ORDER_STATE == OrderState.OPEN:
+                order.fill_timestamps = array('q')
+                order.fill_quantities = array('d')
+                order.fill_prices = array('d')
+            orders[pk] = order
+            self.order_pks[(order.strategy_name, str(order.init_id))] = pk
+
+        fills = Fill.objects.filter(order__user=self.user, order__ledger=self.db, order__order_state=OrderState.OPEN) \
+            .order_by('order_id', 'timestamp', 'id') \
+            .values_list('order_id', 'timestamp', 'quantity', 'price')
+        for order_id, timestamp, quantity, price in fills.iterator(chunk_size=chunk_size):
+            order = orders.get(order_id)
+            if order is not None and timestamp:
+                order.fill_timestamps.append(parse_timestamp(timestamp))
+                order.fill_quantities.append(quantity or 0.0)
+                order.fill_prices.append(order.price if price is None else price)
+
+        return list(orders.values())
+
+    def load_cash_db(self, chunk_size=2000):
+        """
+        DB의 Cash row --> CashTable.cash_table 형식 ({strategy_name: {quote (없으면 'cash'): amount}})
+        """
+        if not self.db_save:
+            return {}
+
+        cash_table = {}
+        rows = self.backend.Cash.objects.filter(user=self.user, ledger=self.db) \
+            .order_by('updated', 'id') \
+            .values_list('strategy_name', 'quote', 'amount')
+        for strategy_name, quote, amount in rows.iterator(chunk_size=chunk_size):
+            cash_table.setdefault(strategy_name, {})['cash' if quote is None else quote] = amount
+        return cash_table
+
+
+def fill_events(fills, cancelled):
+    """
+    DB row를 rebuild_positions에 넘길 fill 목록으로 변환한다. (시간순)
+
+    fills: (order_id, strategy_name, symbol, side, order_state, timestamp, price, quantity) --> order_id, timestamp 순서
+    cancelled: 취소된 주문의 (strategy_name, symbol, side, closed_time)
+
+    DB의 체결 수량은 부호가 없기 때문에 (Order.fill_order) 매도 체결은 음수로 바꾼다. (포지션 수량의 부호 = side)
+    """
+    sides = {'B': 'BUY', 'S': 'SELL'}
+    events = []
+    last_fill = {}
+
+    for order_id, strategy_name, symbol, side, order_state, timestamp, price, quantity in fills:
+        side = sides.get(side, side)
+        quantity = abs(float(quantity))
+        if side == 'SELL':
+            quantity = -quantity
+        if order_state == OrderState.FILLED:
+            last_fill[order_id] = len(events)
+        events.append([timestamp or '', strategy_name, symbol, side, float(price), quantity, None, OrderState.OPEN])
+    for i in last_fill.values():
+        events[i][-1] = OrderState.FILLED
+
+    for strategy_name, symbol, side, closed_time in cancelled:
+        events.append([closed_time or '', strategy_name, symbol, sides.get(side, side), 0.0, 0.0, 0.0,
+                       OrderState.CLOSED])
+
+    events.sort(key=lambda event: event[0])
+    return [tuple(event[1:]) for event in events]
+
+
+def _parse_id(value):
+    """
+    DB에는 문자열로 저장된 주문 id를 SnowflakeIdGenerator의 정수 id로 되돌린다. (hash id는 그대로)
+    """
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value
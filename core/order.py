@@ -1,6 +1,8 @@
-import json
 import hashlib
-import datetime
+from array import array
+
+from core.clock import now_ns, parse_timestamp
+from core.id_generator import SnowflakeIdGenerator
 
 
 class OrderState:
@@ -17,8 +19,26 @@ class Order:
     init --> open --> filled
 
     상태가 변할때마다 사용할 수 있는 property의 수가 늘어난다.
+
+    state별 id는 ID_GENERATOR로 만든다. (기본값: SnowflakeIdGenerator, audit이 필요하면 HashIdGenerator)
+
+    시간 값(*_time, fill timestamp)은 epoch 기준 정수 nanosecond로 저장한다.
     """
 
+    ID_GENERATOR = SnowflakeIdGenerator()
+
+    TIME_FIELDS = ('init_time', 'open_time', 'closed_time', 'filled_time')
+
+    # __dict__ 대신 slot에 저장하여 주문 하나당 메모리를 줄인다. (state에 따라 아직 설정되지 않은 slot도 있다)
+    __slots__ = (
+        'ORDER_STATE', 'init_time',
+        'strategy_name', 'symbol', 'quantity', 'price', 'side', 'order_type', 'quote', 'meta',
+        'hash', 'init_id', 'open_id', 'closed_id', 'filled_id',
+        'open_time', 'order_number', 'orders_filled', 'orders_remaining', 'fill_timestamps', 'fill_quantities',
+        'fill_prices',
+        'closed_time', 'filled_time',
+    )
+
     def __init__(self, strategy_name, symbol, price, quantity, side, order_type, quote=None, meta=None):
         self.ORDER_STATE = OrderState.INIT
         self.init_time = self._time()
@@ -48,8 +68,71 @@ class Order:
 
         self.init_id = self.id
 
+    @classmethod
+    def set_id_generator(cls, id_generator):
+        cls.ID_GENERATOR = id_generator
+
+    def __setstate__(self, state):
+        # __dict__를 가진 이전 버전의 Order도 복구할 수 있도록 dict state를 slot으로 옮긴다.
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        for name, value in state.items():
+            if name in self.__slots__:
+                setattr(self, name, value)
+
+        for name in self.TIME_FIELDS:
+            if isinstance(state.get(name), str):
+                setattr(self, name, parse_timestamp(state[name]))
+
+        if 'fill_history' in state:
+            self.fill_timestamps = array('q', [parse_timestamp(fill['timestamp']) for fill in state['fill_history']])
+            self.fill_quantities = array('d', [fill['quantity'] for fill in state['fill_history']])
+            self.fill_prices = array('d', [fill.get('price', self.price) for fill in state['fill_history']])
+        if hasattr(self, 'fill_timestamps') and not hasattr(self, 'fill_prices'):
+            # 체결가격을 기록하지 않던 이전 버전 --> 주문 가격으로 채운다.
+            self.fill_prices = array('d', [self.price] * len(self.fill_timestamps))
+
+    def to_dict(self) -> dict:
+        """
+        LedgerServer/DB로 내보내기 위한 dict (이전 버전의 __dict__와 같은 형식)
+
+        시간 값은 정수 그대로이며, 문자열 변환은 내보내는 쪽에서 한다.
+        """
+        res = {}
+        for name in self.__slots__:
+            if name in ('fill_quantities', 'fill_prices') or not hasattr(self, name):
+                continue
+            if name == 'fill_timestamps':
+                res['fill_history'] = self.fill_history
+            else:
+                res[name] = getattr(self, name)
+        return res
+
+    @property
+    def fill_history(self):
+        return [{'timestamp': timestamp, 'quantity': quantity, 'price': price}
+                for timestamp, quantity, price in zip(self.fill_timestamps, self.fill_quantities, self.fill_prices)]
+
+    @property
+    def last_fill(self):
+        if self.fill_timestamps:
+            return {'timestamp': self.fill_timestamps[-1], 'quantity': self.fill_quantities[-1],
+                    'price': self.fill_prices[-1]}
+
+    @property
+    def order_base_info(self):
+        return {
+            'symbol': self.symbol,
+            'quantity': self.quantity,
+            'price': self.price,
+            'side': self.side,
+            'order_type': self.order_type,
+            'quote': self.quote,
+            'meta': self.meta
+        }
+
     def _time(self):
-        return datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]
+        return now_ns()
 
     @classmethod
     def make_order_hash(self, symbol, price, quantity, side, order_type, quote, meta):
@@ -60,15 +143,6 @@ class Order:
 
         meta 인자를 넣어줌으로써 같은 형식의 주문과 차이를 줄 수 있다. (거래소/자산군 등과 같은 정보)
         """
-        self.order_base_info = {
-            'symbol': symbol,
-            'quantity': quantity,
-            'price': price,
-            'side': side,
-            'order_type': order_type,
-            'quote': quote,
-            'meta': meta
-        }
         order_info_string = f'{symbol} {price} {quantity} {side} {order_type} {quote} {meta}'
         return hashlib.sha1(order_info_string.encode('utf-8')).hexdigest()
 
@@ -79,7 +153,9 @@ class Order:
         self.order_number = order_number
         self.orders_filled = 0
         self.orders_remaining = self.quantity
-        self.fill_history = []
+        self.fill_timestamps = array('q')
+        self.fill_quantities = array('d')
+        self.fill_prices = array('d')
 
         # property를 모두 업데이트하고 state의 id 부여하기
         self.open_id = self.id
@@ -97,15 +173,19 @@ class Order:
         # property를 모두 업데이트하고 state의 id 부여하기
         self.filled_id = self.id
 
-    def fill_order(self, quantity, return_filled=False):
+    def fill_order(self, quantity, return_filled=False, price=None):
         """
         양수 수량만큼만 체결시킬 수 있기 때문에 양수/음수 모두 절대값으로 취해준 후에 업데이트한다.
+
+        price: 체결가격 (없으면 주문 가격)
         """
         if quantity > self.orders_remaining:
             raise Exception('체결 수량이 남은 수량보다 클 수 없습니다. 다시 확인바랍니다.')
         self.orders_filled += abs(quantity)
         self.orders_remaining -= abs(quantity)
-        self.fill_history.append({'timestamp': self._time(), 'quantity': abs(quantity)})
+        self.fill_timestamps.append(self._time())
+        self.fill_quantities.append(abs(quantity))
+        self.fill_prices.append(self.price if price is None else price)
 
         if self.filled:
             self.make_filled_order()
@@ -119,7 +199,7 @@ class Order:
         state = self.state
         id = getattr(self, f'{state}_id')
         if id is None:
-            return hashlib.sha1(json.dumps(self.__dict__).encode('utf-8')).hexdigest()
+            return self.ID_GENERATOR(self)
         else:
             return id
 
@@ -138,13 +218,13 @@ class Order:
 if __name__ == '__main__':
     o = Order('strategy', 'symbol', 1, 100, 'BUY', 'LIMIT', 'KRW', '신한')
     print(o.state)
-    print(o.__dict__)
+    print(o.to_dict())
 
     print(o.id)
 
     o.make_open_order('123123')
     print(o.state)
-    print(o.__dict__)
+    print(o.to_dict())
 
     print(o.id)
 
@@ -157,7 +237,7 @@ if __name__ == '__main__':
         o.make_filled_order()
 
     print(o.state)
-    print(o.__dict__)
+    print(o.to_dict())
 
     print(o.id)
 
@@ -1,86 +1,217 @@
-import os
-import pickle
+import time
 from typing import List
-from pathlib import Path
+from collections import deque
 
+from core.table import Table
+from core.journal import Durability
 from core.order import Order, OrderState
+from core.clock import parse_timestamp
 
 
-class OrderTable:
+class OrderTable(Table):
     """
     Order 관련된 meta 데이터를 저장하기 위한 수단
     예를 들어서 동일한 종류의 주문을 어떤 전략들이 현재 넣은 상태인지 등
 
     hash값이 같은 경우도 발생할 수 있기 때문에 (다른 전략이 같은 종류의 주문을 연속해서 넣는 경우)
-    equal_orders 같은 meta 데이터로 이를 관리한다.
+    equal_orders 같은 meta 데이터로 이를 관리한다. (hash별 FIFO queue)
+
+    init_ttl: 거래소 접수 확인을 받지 못한 init 주문을 이 시간(초)이 지나면 만료시킨다. (None이면 만료시키지 않음)
+    archive: OrderArchive가 있다면 table에서 제거되는 체결완료/취소 주문을 archive로 옮긴다.
+             주문이 제거된 기록(journal / pkl)이 저장되기 전에 archive를 먼저 기록해서 완료 주문을 잃어버리지 않는다.
+    removal_listeners: 주문이 table에서 제거될 때마다 listener(order)를 호출한다. (변경 version 관리 등)
     """
 
     CACHE_NAME = 'OrderTable.pkl'
+    JOURNAL_NAME = 'OrderTable.log'
+    STATE_FIELDS = ('order_table', 'order_meta')
+    TRANSIENT_FIELDS = Table.TRANSIENT_FIELDS + ('number_index', 'strategy_index', 'state_index', 'init_queue',
+                                                 'archive', 'removal_listeners')
+
+    def __init__(self, *args, init_ttl=None, archive=None, **kwargs):
+        self.init_ttl = init_ttl
+        self.archive = archive
+        self.removal_listeners = []
+        super().__init__(*args, **kwargs)
+
+    def add_removal_listener(self, listener):
+        self.removal_listeners.append(listener)
+
+    def _init_state(self):
+        self.order_table = {}
+        self.order_meta = {}
+        self._build_indexes()
+
+    def _restore_state(self, state: dict):
+        super()._restore_state(state)
+        for meta in self.order_meta.values():
+            if not isinstance(meta['equal_orders'], deque):
+                # 이전 버전은 list 앞쪽에 insert하고 뒤에서 pop하는 방식이었다.
+                meta['equal_orders'] = deque(reversed(meta['equal_orders']))
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """
+        order_table을 매번 scan하지 않기 위한 보조 index (저장하지 않고 로딩시 다시 만든다)
 
-    def __init__(self, user_name='', ledger_name='', auto_save=False):
-        path = Path.home() / 'easy_ledger' / user_name / ledger_name
-        path.mkdir(parents=True, exist_ok=True)
-        self.CACHE_NAME = path / self.CACHE_NAME
-        self.auto_save = auto_save
-        self._load_state()
-
-    def _load_state(self):
-        if os.path.exists(self.CACHE_NAME) and self.auto_save:
-            f = open(self.CACHE_NAME, 'rb')
-            cached = pickle.load(f)
-            self.order_table = cached.order_table
-            self.order_meta = cached.order_meta
-        else:
-            self.order_table = {}
-            self.order_meta = {}
-            self._save_state()
+        number_index: (strategy_name, order_number) --> {init_id: order} (init 상태가 아닌 주문만)
+        strategy_index: strategy_name --> {init_id: order}
+        state_index: order state --> {init_id: order}
+        init_queue: (등록 시간, order) --> 모든 hash의 대기중인 init 주문을 등록 순서대로 (만료 처리용)
+        """
+        self.number_index = {}
+        self.strategy_index = {}
+        self.state_index = {}
+        for order in self.order_table.values():
+            self._index(order)
+        self._queue_init_orders()
+
+    def _queue_init_orders(self):
+        """
+        대기중인 init 주문을 init_time 순서로 init_queue에 넣는다. (snapshot / DB에서 복구한 경우)
 
-    def _save_state(self):
-        if self.auto_save:
-            with open(self.CACHE_NAME, 'wb') as f:
-                pickle.dump(self, f)
+        복구한 시점이 아니라 주문의 init_time부터 init_ttl을 계산하기 때문에 이미 만료된 주문은 다음 만료 처리에서 제거된다.
+        """
+        self.init_queue = deque()
+        if self.init_ttl is None:
+            return
+        orders = [(parse_timestamp(order.init_time) / 1e9, order)
+                  for meta in self.order_meta.values() for order in meta['equal_orders']]
+        orders.sort(key=lambda entry: entry[0])
+        self.init_queue.extend(orders)
+
+    def _index(self, order: Order):
+        init_id = order.init_id
+        self.strategy_index.setdefault(order.strategy_name, {})[init_id] = order
+        self.state_index.setdefault(order.state, {})[init_id] = order
+        if order.state != OrderState.INIT:
+            self.number_index.setdefault((order.strategy_name, order.order_number), {})[init_id] = order
+
+    def _unindex(self, order: Order):
+        init_id = order.init_id
+        keys = [(self.strategy_index, order.strategy_name), (self.state_index, order.state)]
+        if order.state != OrderState.INIT:
+            keys.append((self.number_index, (order.strategy_name, order.order_number)))
+
+        for index, key in keys:
+            orders = index.get(key)
+            if orders is not None:
+                orders.pop(init_id, None)
+                if not orders:
+                    del index[key]
+
+    def _put_order(self, order: Order):
+        prev_order = self.order_table.get(order.init_id)
+        if prev_order is not None:
+            self._unindex(prev_order)
+        self.order_table[order.init_id] = order
+        self._index(order)
+
+    def _pop_order(self, init_id) -> Order:
+        order = self.order_table.pop(init_id, None)
+        if order is not None:
+            self._unindex(order)
+            for listener in self.removal_listeners:
+                listener(order)
+        return order
+
+    def _commit(self, *record):
+        if self.archive is not None and self.archive.pending and self.durability != Durability.ASYNC:
+            pending = len(self.journal.buffer) if self.journal is not None else self.dirty
+            if self.durability == Durability.SYNC or pending + 1 >= self.flush_size:
+                self.archive.flush()
+        super()._commit(*record)
+
+    def flush(self):
+        if self.archive is not None:
+            self.archive.flush()
+        super().flush()
+
+    def _apply(self, record):
+        op, *args = record
+        if op == 'add_order':
+            self._add_order(args[0])
+        elif op == 'register_order':
+            self._register_order(args[0])
+        elif op == 'make_open_order':
+            order_hash, order = args
+            self._register_order(order_hash)
+            self._put_order(order)
+        elif op == 'put_order':
+            self._put_order(args[0])
+        elif op == 'pop_orders':
+            for init_id in args[0]:
+                self._pop_order(init_id)
+        elif op == 'expire_init_orders':
+            for order_hash, init_id in args[0]:
+                self._expire_init_order(order_hash, init_id)
+        elif op == 'load_orders':
+            self._load_orders(args[0])
 
     def add_order(self, order: Order):
         """
         equal_orders: 같은 내용의 주문을 여러개의 전략 혹은 하나의 전략에서 연속 발생할 수 있기 때문에 관리 필요
         """
+        self._add_order(order)
+        self._commit('add_order', order)
+        self.expire_init_orders()
+
+    def _add_order(self, order: Order):
         if order.init_id not in self.order_table:
-            self.order_table[order.init_id] = order
+            self._put_order(order)
 
         if order.hash not in self.order_meta:
             self.order_meta[order.hash] = {
-                'equal_orders': [order]
+                'equal_orders': deque([order])
             }
         else:
-            self.order_meta[order.hash]['equal_orders'].insert(0, order)
-
-        self._save_state()
+            self.order_meta[order.hash]['equal_orders'].append(order)
 
-    def remove_order(self, order_number: str, strategy_name: str = None):
-        to_del = []
-        for init_id, order in self.order_table.items():
-            # Condition #1: init 상태가 아닌 주문에 대해서만 적용 (order_number이 필요하기 때문)
-            order_state_condition = (order.ORDER_STATE != OrderState.INIT)
+        if self.init_ttl is not None:
+            self.init_queue.append((parse_timestamp(order.init_time) / 1e9, order))
 
-            if order_state_condition:
-                # Condition #2: 주문 번호가 일치하는지 확인
-                order_number_condition = (order.order_number == order_number)
+    def load_orders(self, orders: List[Order]):
+        """
+        DB에서 복구한 init/open 주문으로 table을 한번에 교체한다. (init 주문은 접수 대기 순서대로 넘겨준다)
+        """
+        self._load_orders(orders)
+        self._commit('load_orders', orders)
+
+    def _load_orders(self, orders: List[Order]):
+        self.order_table = {}
+        self.order_meta = {}
+        for order in orders:
+            if order.state == OrderState.INIT:
+                self.order_meta.setdefault(order.hash, {'equal_orders': deque()})['equal_orders'].append(order)
+            self.order_table[order.init_id] = order
+        self._build_indexes()                   # 복구한 init 주문도 init_time 기준으로 init_queue에 넣는다.
 
-                # Condition #3: strategy_name이 일치하는지 확인
-                if strategy_name is not None:
-                    strategy_name_condition = (order.strategy_name == strategy_name)
-                else:
-                    strategy_name_condition = True
+    def _find_orders(self, order_number: str, strategy_name: str = None) -> List[Order]:
+        """
+        order_number로 접수된 주문 찾기 (strategy_name이 없다면 모든 전략에서 찾는다)
+        """
+        if strategy_name is not None:
+            keys = [(strategy_name, order_number)]
+        else:
+            keys = [(name, order_number) for name in self.strategy_index]
 
-                if order_number_condition and strategy_name_condition:
-                    order.make_closed_order()
-                    to_del.append(init_id)
+        orders = []
+        for key in keys:
+            orders.extend(self.number_index.get(key, {}).values())
+        return orders
 
+    def remove_order(self, order_number: str, strategy_name: str = None):
+        # init 상태의 주문은 order_number가 없기 때문에 number_index에 포함되지 않는다.
         cancelled_orders = []
-        for id in to_del:
-            cancelled_orders.append(self.order_table.pop(id))
+        for order in self._find_orders(order_number, strategy_name):
+            self._pop_order(order.init_id)
+            order.make_closed_order()
+            cancelled_orders.append(order)
+            if self.archive is not None:
+                self.archive.append(order)
 
-        self._save_state()
+        if cancelled_orders:
+            self._commit('pop_orders', [order.init_id for order in cancelled_orders])
 
         return cancelled_orders
 
@@ -90,60 +221,114 @@ class OrderTable:
 
         먼저 주문을 init한 전략의 주문이 먼저 체결된다는 가정하에 먼저 등록된 order를 pop하여 리턴한다.
         """
+        order = self._register_order(order_hash)
+        if order is not None:
+            self._commit('register_order', order_hash)
+        return order
+
+    def _register_order(self, order_hash):
         try:
-            order = self.order_meta[order_hash]['equal_orders'].pop()
+            order = self.order_meta[order_hash]['equal_orders'].popleft()
             if not self.order_meta[order_hash]['equal_orders']: # 더 이상 이 주문이 접수되길 대기하는 전략이 없다면 제거
                 del self.order_meta[order_hash]
-            self._save_state()
             return order
         except:
             return
 
+    def expire_init_orders(self, now=None):
+        """
+        init_ttl이 지나도록 접수되지 않은 init 주문을 한번에 만료시킨다.
+
+        init_queue와 hash별 queue 모두 등록 순서대로 쌓이기 때문에 만료된 주문은 항상 queue의 앞쪽에 있다.
+        이미 접수된 주문은 hash별 queue에서 빠져있으므로 건너뛴다.
+        """
+        if self.init_ttl is None:
+            return []
+
+        cutoff = (time.time() if now is None else now) - self.init_ttl
+        expired = []
+        while self.init_queue and self.init_queue[0][0] <= cutoff:
+            _, order = self.init_queue.popleft()
+            if self._expire_init_order(order.hash, order.init_id):
+                expired.append(order)
+
+        if expired:
+            self._commit('expire_init_orders', [(order.hash, order.init_id) for order in expired])
+        return expired
+
+    def _expire_init_order(self, order_hash, init_id):
+        meta = self.order_meta.get(order_hash)
+        if meta is None or meta['equal_orders'][0].init_id != init_id:
+            return False
+
+        order = meta['equal_orders'].popleft()
+        if not meta['equal_orders']:
+            del self.order_meta[order_hash]
+
+        if order.state == OrderState.INIT and self.order_table.get(init_id) is order:
+            self._pop_order(init_id)
+        return True
+
+    def pending_init_count(self, order_hash) -> int:
+        """
+        같은 hash로 접수를 대기하고 있는 init 주문의 수
+        """
+        meta = self.order_meta.get(order_hash)
+        return len(meta['equal_orders']) if meta is not None else 0
+
+    def pending_init_counts(self) -> dict:
+        return {order_hash: len(meta['equal_orders']) for order_hash, meta in self.order_meta.items()}
+
     def make_open_order(self, order_hash, order_number):
         # 주문을 접수시킴과 동시에 미체결 상태로 전환
-        order = self.register_order(order_hash)
+        order = self._register_order(order_hash)
         if order is not None:
+            self._unindex(order)
             order.make_open_order(order_number)
-            self.order_table[order.init_id] = order
-        self._save_state()
+            self._index(order)
+            self._commit('make_open_order', order_hash, order)
         return order
 
-    def fill_order(self, strategy_name, order_number, quantity, return_order=False):
-        for _, order in self.order_table.items():
-            if (strategy_name == order.strategy_name) and \
-                    (order.state == OrderState.OPEN) and \
-                        (order_number == order.order_number):
+    def fill_order(self, strategy_name, order_number, quantity, return_order=False, price=None):
+        for order in self._find_orders(order_number, strategy_name):
+            if order.state == OrderState.OPEN:
+                self._unindex(order)
                 try:
-                    filled = order.fill_order(quantity, return_filled=True)
+                    filled = order.fill_order(quantity, return_filled=True, price=price)
                 except:
                     # 주문 수량보다 많은 수량을 체결시키려 하면 오류 발생
                     filled = False
+                self._index(order)
 
+                self._commit('put_order', order)
                 if filled:
                     self.clean_filled_orders()
-                self._save_state()
                 if return_order:
                     return order
+                return
 
     def clean_orders(self, state: OrderState, strategy_name: str = None):
         """
         주문 상태에 따라 필터하여 제거하는 함수
         전략 이름을 인자값으로 넣었다면 strategy로 한번 더 필터링하여 주문 제거/정리
         """
-        to_pop = []
-        for init_id, order in self.order_table.items():
-            state_condition = (order.state == state)
-            if strategy_name is not None:
-                strategy_name_condition = (order.strategy_name == strategy_name)
+        state_orders = self.state_index.get(state, {})
+        if strategy_name is None:
+            to_pop = list(state_orders)
+        else:
+            strategy_orders = self.strategy_index.get(strategy_name, {})
+            if len(strategy_orders) < len(state_orders):
+                to_pop = [init_id for init_id, order in strategy_orders.items() if order.state == state]
             else:
-                strategy_name_condition = True
-
-            if state_condition and strategy_name_condition:
-                to_pop.append(init_id)
+                to_pop = [init_id for init_id, order in state_orders.items() if order.strategy_name == strategy_name]
 
         for init_id in to_pop:
-            self.order_table.pop(init_id)
-        self._save_state()
+            order = self._pop_order(init_id)
+            if self.archive is not None and state in (OrderState.FILLED, OrderState.CLOSED):
+                self.archive.append(order)
+
+        if to_pop:
+            self._commit('pop_orders', to_pop)
 
     def clean_init_orders(self, strategy_name: str = None):
         self.clean_orders(state=OrderState.INIT, strategy_name=strategy_name)
@@ -161,17 +346,22 @@ class OrderTable:
                    strategy_name: str,
                    states: list = [OrderState.INIT, OrderState.OPEN, OrderState.FILLED]) -> List[Order]:
         orders = []
-        for _, order in self.order_table.items():
-            if (order.strategy_name == strategy_name) and (order.state in states):
+        for order in self.strategy_index.get(strategy_name, {}).values():
+            if order.state in states:
                 orders.append(order)
         return orders
 
+    def get_order_by_id(self,
+                        strategy_name: str,
+                        init_id: str,
+                        states: list = [OrderState.INIT, OrderState.OPEN, OrderState.FILLED]) -> Order:
+        order = self.strategy_index.get(strategy_name, {}).get(init_id)
+        if order is not None and order.state in states:
+            return order
+
     def get_order(self, strategy_name: str, order_number: str) -> Order:
-        for _, order in self.order_table.items():
-            if order.ORDER_STATE != OrderState.INIT:
-                # ORDER_STATE가 init이면 order_number가 없기 때문에 오류가 발생한다. (오류 방지)
-                if (order.strategy_name == strategy_name) and (order.order_number == order_number):
-                    return order
+        for order in self._find_orders(order_number, strategy_name):
+            return order
 
 
 if __name__ == '__main__':
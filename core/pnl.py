@@ -0,0 +1,136 @@
+import time
+from array import array
+
+from core.position_watcher import PositionWatcher
+
+try:
+    """
+    numpy가 있다면 tick batch마다 모든 포지션의 평가손익을 한번에 (vectorized) 계산한다.
+    """
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+class PnLEngine(PositionWatcher):
+    """
+    시세(tick)를 받아서 포지션별 평가손익(unrealized PnL)을 계산하는 엔진
+
+    포지션 하나를 row 하나로 보고 symbol code / 수량 / 평균단가를 column(array)으로 관리한다.
+    unrealized PnL = (현재가 - 평균단가) * 수량  (SELL 포지션은 수량이 음수)
+
+    watch: ledger의 PositionTable에 listener를 등록해서 포지션이 바뀔 때마다 해당 row만 갱신한다.
+    unwatch: ledger의 row를 free_rows에 돌려주고 다음에 추가되는 포지션이 재사용한다. (ledger가 오가도 column이 늘어나지 않는다)
+    on_ticks: tick batch의 현재가를 반영하고, publish_rate (초당 횟수)를 넘지 않는 선에서 전체 row를 다시 계산한다.
+    get_pnl: 마지막으로 계산(publish)된 결과를 조회한다.
+    """
+
+    def __init__(self, publish_rate=10.0):
+        super().__init__()
+        self.publish_interval = 1.0 / publish_rate if publish_rate else 0.0
+
+        self.symbol_codes = {}                  # symbol --> symbol code
+        self.last_price = array('d')            # symbol code --> 현재가 (시세가 없으면 nan)
+        self.rows = {}                          # key --> {(strategy_name, symbol): row}
+        self.row_symbol = array('q')
+        self.quantity = array('d')
+        self.average_price = array('d')
+        self.free_rows = []                     # unwatch된 ledger가 사용하던 row
+
+        self.unrealized = array('d')
+        self.published_at = 0.0
+        self.dirty = False
+
+    def _symbol_code(self, symbol):
+        if symbol not in self.symbol_codes:
+            self.symbol_codes[symbol] = len(self.last_price)
+            self.last_price.append(float('nan'))
+        return self.symbol_codes[symbol]
+
+    def _forget(self, key):
+        for row in self.rows.pop(key, {}).values():
+            self.quantity[row] = 0.0
+            self.average_price[row] = 0.0
+            self.free_rows.append(row)
+
+    def on_position(self, key, position):
+        quantity = getattr(position, 'quantity', 0.0) or 0.0
+        average_price = getattr(position, 'average_price', 0.0) or 0.0
+        with self.lock:
+            rows = self.rows.setdefault(key, {})
+            row_key = (position.strategy_name, position.symbol)
+            if row_key not in rows:
+                if self.free_rows:
+                    rows[row_key] = self.free_rows.pop()
+                    self.row_symbol[rows[row_key]] = self._symbol_code(position.symbol)
+                else:
+                    rows[row_key] = len(self.quantity)
+                    self.row_symbol.append(self._symbol_code(position.symbol))
+                    self.quantity.append(0.0)
+                    self.average_price.append(0.0)
+            row = rows[row_key]
+            self.quantity[row] = quantity
+            self.average_price[row] = average_price
+            self.dirty = True
+
+    def on_ticks(self, ticks):
+        """
+        ticks: [(symbol, price), ...] --> 현재가를 반영하고 publish 주기가 되었다면 평가손익을 다시 계산한다.
+        """
+        with self.lock:
+            for symbol, price in ticks:
+                self.last_price[self._symbol_code(symbol)] = price
+            self.dirty = True
+        self.publish()
+
+    def publish(self, force=False):
+        if not self.dirty:
+            return False
+        now = time.monotonic()
+        if not force and now - self.published_at < self.publish_interval:
+            return False
+
+        with self.lock:
+            self.unrealized = self._unrealized()
+            self.published_at = now
+            self.dirty = False
+        return True
+
+    def _unrealized(self):
+        if NUMPY_AVAILABLE:
+            # array의 buffer를 그대로 사용한다. (lock 안에서만 참조해야 array 크기가 바뀌는 것과 겹치지 않는다)
+            last_price = np.frombuffer(self.last_price, dtype=np.float64)
+            row_symbol = np.frombuffer(self.row_symbol, dtype=np.int64)
+            quantity = np.frombuffer(self.quantity, dtype=np.float64)
+            average_price = np.frombuffer(self.average_price, dtype=np.float64)
+            price = last_price[row_symbol]
+            return array('d', np.where(np.isnan(price), 0.0, (price - average_price) * quantity).tobytes())
+
+        unrealized = array('d')
+        for row, code in enumerate(self.row_symbol):
+            price = self.last_price[code]
+            unrealized.append(0.0 if price != price else (price - self.average_price[row]) * self.quantity[row])
+        return unrealized
+
+    def get_pnl(self, key, strategy_name=None):
+        """
+        마지막으로 publish된 평가손익 --> {'positions': {strategy_name: {symbol: {...}}}, 'total': 합계}
+        """
+        res = {}
+        total = 0.0
+        with self.lock:
+            for (row_strategy_name, symbol), row in self.rows.get(key, {}).items():
+                if strategy_name is not None and row_strategy_name != strategy_name:
+                    continue
+                price = self.last_price[self.symbol_codes[symbol]]
+                unrealized = self.unrealized[row] if row < len(self.unrealized) else 0.0
+                res.setdefault(row_strategy_name, {})[symbol] = {
+                    'quantity': self.quantity[row],
+                    'average_price': self.average_price[row],
+                    'last_price': None if price != price else price,
+                    'unrealized_pnl': unrealized,
+                }
+                total += unrealized
+        return {'positions': res, 'total': total}
@@ -1,5 +1,8 @@
-import datetime
+import os
+from array import array
 
+from core.clock import now_ns
+from core.history import History
 from core.order import OrderState
 
 
@@ -8,18 +11,172 @@ class PositionState:
     CLOSED = 'closed'
 
 
+class TradeType:
+    """
+    trade_history는 문자열 대신 code(signed char)로 저장한다.
+    """
+    CANCEL = 'CANCEL'
+    ENTER = 'ENTER'
+    EXIT = 'EXIT'
+
+    TYPES = (CANCEL, ENTER, EXIT)
+    CODES = {CANCEL: 0, ENTER: 1, EXIT: 2}
+
+
 class Position:
+    """
+    __slots__와 typed array(array 모듈) history로 포지션 하나당 메모리를 줄인다.
+
+    position_enter_cnt / position_exit_cnt / fill_cnt는 history를 다시 세지 않고 기록할 때마다 증가시킨다.
+    position_open_date는 epoch 기준 정수 nanosecond로 저장한다.
+
+    realized_pnl / fees / turnover는 포지션이 닫혀도 (close_position) 초기화하지 않고 계속 누적한다.
+    realized_pnl: EXIT할 때마다 (평균단가 - 체결가격) * 수량, turnover: |체결가격 * 수량|, fees: 체결마다 받은 수수료
+
+    history_capacity가 있으면 history는 최근 history_capacity개만 메모리에 남기고 (ring buffer),
+    spill_dir이 있으면 밀려난 값은 <spill_dir>/<strategy_name>/<symbol>.<field>.bin 파일에 기록한다. (full_history로 조회)
+    """
+
+    HISTORY_FIELDS = (
+        ('price_history', 'd'),
+        ('quantity_history', 'd'),
+        ('trade_history', 'b'),
+        ('fill_history', 'b'),
+    )
+
+    __slots__ = (
+        'POSITION_STATE', 'strategy_name', 'symbol', 'quote', 'meta',
+        'position_open_date', 'side', 'average_price', 'quantity', 'position_amount', 'leverage',
+        'price_history', 'quantity_history', 'trade_history', 'fill_history',
+        'realized_pnl', 'fees', 'turnover',
+        '_enter_cnt', '_exit_cnt', '_fill_cnt', '_history_capacity', '_spill_dir',
+    )
 
     def __init__(self,
                  strategy_name: str,
                  symbol: str,
                  quote: str = None,
-                 meta: str = None):
+                 meta: str = None,
+                 history_capacity: int = None,
+                 spill_dir: str = None):
         self.POSITION_STATE = PositionState.CLOSED
         self.strategy_name = strategy_name
         self.symbol = symbol
         self.quote = quote
         self.meta = meta
+        self._history_capacity = history_capacity
+        self._spill_dir = None if spill_dir is None else str(spill_dir)
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self.turnover = 0.0
+        self._reset_history()
+
+    def __setstate__(self, state):
+        # __dict__와 list history를 가진 이전 버전의 Position도 복구할 수 있도록 변환한다.
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        for name, value in state.items():
+            if name in self.__slots__:
+                setattr(self, name, value)
+        if not hasattr(self, '_history_capacity'):
+            self._history_capacity = None
+            self._spill_dir = None
+        if not hasattr(self, 'realized_pnl'):
+            self.realized_pnl = 0.0
+            self.fees = 0.0
+            self.turnover = 0.0
+
+        if not hasattr(self, '_fill_cnt'):
+            price_history = state.get('price_history', [])
+            quantity_history = state.get('quantity_history', [])
+            trade_history = state.get('trade_history', [])
+            fill_history = state.get('fill_history', [])
+            self._reset_history()
+            self.price_history.extend(price_history)
+            self.quantity_history.extend(quantity_history)
+            for trade_position in trade_history:
+                self._record_trade_type(trade_position)
+            for filled in fill_history:
+                self._record_fill(filled)
+        elif not isinstance(self.price_history, History):
+            # array history를 가진 이전 버전 --> 제한 없는 History로 감싼다.
+            for name, typecode in self.HISTORY_FIELDS:
+                history = History(typecode)
+                history.values = getattr(self, name)
+                setattr(self, name, history)
+
+    def _spill_path(self, name):
+        if self._spill_dir is None:
+            return None
+        symbol = str(self.symbol).replace(os.sep, '_')
+        return os.path.join(self._spill_dir, str(self.strategy_name), f'{symbol}.{name}.bin')
+
+    def _reset_history(self):
+        for name, typecode in self.HISTORY_FIELDS:
+            history = getattr(self, name, None)
+            if isinstance(history, History) and history.spill_path == self._spill_path(name) \
+                    and history.capacity == self._history_capacity:
+                # spill 파일 정리는 flush_spills에서 하므로 같은 History를 비워서 사용한다.
+                history.clear()
+            else:
+                setattr(self, name, History(typecode, self._history_capacity, self._spill_path(name)))
+        self._enter_cnt = 0
+        self._exit_cnt = 0
+        self._fill_cnt = 0
+
+    def flush_spills(self, fsync=False):
+        """
+        history에서 밀려난 값을 spill 파일에 기록한다. --> 기록한 파일이 있다면 True
+        """
+        flushed = False
+        for name, _ in self.HISTORY_FIELDS:
+            flushed = getattr(self, name).flush_spill(fsync=fsync) or flushed
+        return flushed
+
+    def sync_spills(self):
+        for name, _ in self.HISTORY_FIELDS:
+            getattr(self, name).sync_spill()
+
+    def _record_trade_type(self, trade_position):
+        self.trade_history.append(TradeType.CODES[trade_position])
+        if trade_position == TradeType.ENTER:
+            self._enter_cnt += 1
+        elif trade_position == TradeType.EXIT:
+            self._exit_cnt += 1
+
+    def _record_fill(self, filled):
+        self.fill_history.append(bool(filled))
+        if filled:
+            self._fill_cnt += 1
+
+    def to_dict(self) -> dict:
+        """
+        LedgerServer로 내보내기 위한 dict (이전 버전의 __dict__와 같은 형식: history는 list, trade_history는 문자열)
+        """
+        res = {}
+        for name in self.__slots__:
+            if name.startswith('_') or not hasattr(self, name):
+                continue
+            value = getattr(self, name)
+            if name == 'trade_history':
+                value = [TradeType.TYPES[code] for code in value]
+            elif name == 'fill_history':
+                value = [bool(filled) for filled in value]
+            elif isinstance(value, (History, array)):
+                value = value.tolist()
+            res[name] = value
+        return res
+
+    def full_history(self, name):
+        """
+        spill 파일로 밀려난 부분까지 포함한 전체 history (to_dict와 같은 형식)
+        """
+        values = getattr(self, name).full_history()
+        if name == 'trade_history':
+            return [TradeType.TYPES[code] for code in values]
+        if name == 'fill_history':
+            return [bool(filled) for filled in values]
+        return values.tolist()
 
     def update_average_price(self,
                              prev_average_price: float,
@@ -57,7 +214,8 @@ class Position:
                       price: float = None,
                       quantity: float = None,
                       position_amount: float = None,
-                      order_state: OrderState = None):
+                      order_state: OrderState = None,
+                      fee: float = 0.0):
         """
         
         :param side: BUY / SELL
@@ -65,11 +223,12 @@ class Position:
         :param quantity: float --> 소수점으로 매매가 가능한 자산군도 존재하기 때문
         :param position_amount: 실제 투자 금액 (레버리지를 사용하는 경우)
         :param order_state: None / 'filled' --> filled인 경우 n차 매매로 기록 (분할 매수/매도에 필요한 정보)
+        :param fee: 체결 수수료
         :return: 
         """
 
         self.POSITION_STATE = PositionState.OPEN
-        self.position_open_date = datetime.datetime.now().strftime('%Y%m%d')
+        self.position_open_date = now_ns()
         self.side = side if side is not None else ''                                      # BUY / SELL
         self.average_price = price if price is not None else 0.0                          # 평균단가 (주식/계약 가격)
         self.quantity = quantity if quantity is not None else 0.0                         # 투자수량
@@ -80,22 +239,33 @@ class Position:
         except:
             self.leverage = 1.0
 
-        self.price_history = [price] if price is not None else []
-        self.quantity_history = [quantity] if quantity is not None else []
-        self.trade_history = ['ENTER'] if quantity is not None else []
-        self.fill_history = [(order_state == OrderState.FILLED) or \
-                             (order_state == OrderState.CLOSED)] # 몇차 거래인지 파악하기 위한 수단
+        self.fees += fee
+        if price is not None and quantity is not None:
+            self.turnover += abs(price * quantity)
+
+        self._reset_history()
+        if price is not None:
+            self.price_history.append(price)
+        if quantity is not None:
+            self.quantity_history.append(quantity)
+            self._record_trade_type(TradeType.ENTER)
+        self._record_fill((order_state == OrderState.FILLED) or \
+                          (order_state == OrderState.CLOSED)) # 몇차 거래인지 파악하기 위한 수단
 
     def update_position(self,
                         price: float = 0.0,
                         quantity: float = 0.0,
                         position_amount: float = None,
-                        order_state: str = None):
+                        order_state: str = None,
+                        fee: float = 0.0):
         """
         quantity, amount는 +/- 모두 가능
 
         실제로 fill/close된 주문에 대해서만 fill_history에 기록한다. (체결완료 / 주문취소 두가지 경우에 가능)
+        side가 바뀌는 경우 기존 포지션 전체를 EXIT한 만큼 realized_pnl에 반영한다.
         """
+        self.fees += fee
+
         if (self.side == 'BUY' and (self.quantity + quantity < 0.0)) or \
                 (self.side == 'SELL' and (self.quantity + quantity > 0.0)):
             quantities = [-1 * self.quantity, self.quantity + quantity]
@@ -133,9 +303,10 @@ class Position:
             else:
                 self.price_history.append(price)
                 self.quantity_history.append(quantity)
-                self.fill_history.append((order_state == OrderState.FILLED) or \
-                                         (order_state == OrderState.CLOSED))
+                self._record_fill((order_state == OrderState.FILLED) or \
+                                  (order_state == OrderState.CLOSED))
 
+                prev_average_price = self.average_price
                 self.average_price = self.update_average_price(prev_average_price=self.average_price,
                                                                prev_quantity=self.quantity,
                                                                price=price,
@@ -159,6 +330,10 @@ class Position:
                     else:
                         trade_position = 'EXIT'
 
+                if trade_position == 'EXIT':
+                    self.realized_pnl += (prev_average_price - price) * quantity
+                self.turnover += abs(price * quantity)
+
                 if trade_position == 'ENTER':
                     p = price
                 elif trade_position == 'EXIT':
@@ -171,7 +346,7 @@ class Position:
                 else:
                     self.position_amount += position_amount
 
-                self.trade_history.append(trade_position)
+                self._record_trade_type(trade_position)
 
                 try:
                     self.leverage = abs((self.average_price * self.quantity) / self.position_amount)
@@ -182,6 +357,23 @@ class Position:
 
                 update_cnt += 1
 
+    def apply_fill(self,
+                   side: str = None,
+                   price: float = 0.0,
+                   quantity: float = 0.0,
+                   position_amount: float = None,
+                   order_state: str = None,
+                   fee: float = 0.0):
+        """
+        체결/취소 한 건을 반영한다. (포지션이 닫혀있다면 새로 열고, 열려있다면 업데이트)
+        """
+        if self.POSITION_STATE == PositionState.CLOSED:
+            self.open_position(side=side, price=price, quantity=quantity,
+                               position_amount=position_amount, order_state=order_state, fee=fee)
+        else:
+            self.update_position(price=price, quantity=quantity, position_amount=position_amount,
+                                 order_state=order_state, fee=fee)
+
     def close_position(self):
         """
         매매가 종료된 시점에서 position을 닫아주고, 다른 side를 취할 수 있도록 해준다.
@@ -191,25 +383,22 @@ class Position:
 
         if init_condition_1 or init_condition_2:
             self.POSITION_STATE = PositionState.CLOSED
-            self.position_open_date = datetime.datetime.now().strftime('%Y%m%d')
+            self.position_open_date = now_ns()
             self.side = ''
             self.average_price = 0.0
             self.quantity = 0.0
             self.position_amount = 0.0
             self.leverage = 0.0
 
-            self.price_history = []
-            self.quantity_history = []
-            self.trade_history = []
-            self.fill_history = []
+            self._reset_history()
 
     @property
     def position_enter_cnt(self):
-        return self.trade_history.count('ENTER')
+        return self._enter_cnt
 
     @property
     def position_exit_cnt(self):
-        return self.trade_history.count('EXIT')
+        return self._exit_cnt
 
     @property
     def fill_cnt(self):
@@ -218,23 +407,20 @@ class Position:
         여러번 체결을 하였더라도 같은 주문에 대한 체결이면 fill_cnt로 정확히 몇번의 주문을 통해서 position이 생긴건지
         파악하기 위해서 필요하다.
         """
-        try:
-            return self.fill_history.count(True)
-        except:
-            return 0
+        return self._fill_cnt
 
 
 if __name__ == '__main__':
     p = Position('name', 'symbol')
     p.open_position(side='SELL', price=100, quantity=-1, order_state=OrderState.FILLED)
-    print(p.__dict__)
+    print(p.to_dict())
     p.update_position(price=110, quantity=-3, position_amount=-100, order_state=OrderState.FILLED)
-    print(p.__dict__)
+    print(p.to_dict())
     p.update_position(price=120, quantity=1, order_state=OrderState.FILLED)
-    print(p.__dict__)
+    print(p.to_dict())
     p.update_position(price=100, quantity=-2)
-    print(p.__dict__)
+    print(p.to_dict())
     p.update_position(price=100, quantity=8, order_state=OrderState.FILLED)
-    print(p.__dict__)
+    print(p.to_dict())
 
     print(p)
\ No newline at end of file
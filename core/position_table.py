@@ -1,34 +1,90 @@
-import os
-import pickle
-from pathlib import Path
+from core.table import Table
+from core.journal import Durability
+from .position import Position
 
-from .position import Position, PositionState
 
+class PositionTable(Table):
+    """
+    history_capacity: 포지션별 history를 최근 history_capacity개로 제한 (None이면 제한 없음)
+    spill_dir: history에서 밀려난 값을 기록할 경로 (None이면 버린다)
+               밀려난 값은 journal에 기록된 뒤에 spill 파일로 옮긴다. (SYNC는 체결마다 그 포지션만, 나머지는 flush할 때)
+               spill 파일은 checkpoint에서 snapshot을 교체하기 전에 fsync한다. (sync_spills)
 
-class PositionTable:
+    listeners: 포지션이 변경될 때마다 listener(position)을 호출한다. (PnL 계산 등 table 밖에서 포지션을 따라가는 용도)
+    strategy_pnl: 전략별 realized_pnl / fees / turnover 합계 (포지션이 변경될 때 차이만큼 더해서 조회는 O(1))
+    """
+
+    PNL_FIELDS = ('realized_pnl', 'fees', 'turnover')
 
     CACHE_NAME = 'PositionTable.pkl'
+    JOURNAL_NAME = 'PositionTable.log'
+    STATE_FIELDS = ('position_table',)
+    TRANSIENT_FIELDS = Table.TRANSIENT_FIELDS + ('listeners', 'strategy_pnl', 'spill_dirty', 'spill_unsynced')
+
+    def __init__(self, *args, history_capacity=None, spill_dir=None, **kwargs):
+        self.history_capacity = history_capacity
+        self.spill_dir = None if spill_dir is None else str(spill_dir)
+        self.listeners = []
+        self.spill_dirty = set()                # spill 파일에 기록할 값이 있는 (strategy_name, symbol)
+        self.spill_unsynced = set()             # 기록했지만 fsync하지 않은 (strategy_name, symbol)
+        super().__init__(*args, **kwargs)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _notify(self, position):
+        for listener in self.listeners:
+            listener(position)
+
+    def _init_state(self):
+        self.position_table = {}
+        self._build_strategy_pnl()
 
-    def __init__(self, user_name='', ledger_name='', auto_save=False):
-        path = Path.home() / 'easy_ledger' / user_name / ledger_name
-        path.mkdir(parents=True, exist_ok=True)
-        self.CACHE_NAME = path / self.CACHE_NAME
-        self.auto_save = auto_save
-        self._load_state()
-
-    def _load_state(self):
-        if os.path.exists(self.CACHE_NAME) and self.auto_save:
-            f = open(self.CACHE_NAME, 'rb')
-            cached = pickle.load(f)
-            self.position_table = cached.position_table
-        else:
-            self.position_table = {}
-            self._save_state()
-
-    def _save_state(self):
-        if self.auto_save:
-            with open(self.CACHE_NAME, 'wb') as f:
-                pickle.dump(self, f)
+    def _restore_state(self, state: dict):
+        super()._restore_state(state)
+        self._build_strategy_pnl()
+
+    def _build_strategy_pnl(self):
+        self.strategy_pnl = {}
+        for positions in self.position_table.values():
+            for position in positions.values():
+                self._add_pnl(position.strategy_name, self._pnl(position))
+
+    def _pnl(self, position):
+        return tuple(getattr(position, field, 0.0) for field in self.PNL_FIELDS)
+
+    def _add_pnl(self, strategy_name, values, sign=1):
+        if strategy_name not in self.strategy_pnl:
+            self.strategy_pnl[strategy_name] = dict.fromkeys(self.PNL_FIELDS, 0.0)
+        totals = self.strategy_pnl[strategy_name]
+        for field, value in zip(self.PNL_FIELDS, values):
+            totals[field] += sign * value
+
+    def _apply(self, record):
+        op, *args = record
+        if op == 'fill_position':
+            strategy_name, symbol, side, price, quantity, position_amount, order_state, fee, open_date = args
+            position = self.get_position(strategy_name, symbol)
+            self._fill(position, side, price, quantity, position_amount, order_state, fee)
+            position.position_open_date = open_date
+            self._mark_spill(position)
+        elif op == 'update_position':
+            # 포지션 전체를 기록하던 이전 버전의 log
+            position = args[0]
+            positions = self.get_positions(position.strategy_name)
+            if position.symbol in positions:
+                self._add_pnl(position.strategy_name, self._pnl(positions[position.symbol]), sign=-1)
+            positions[position.symbol] = position
+            self._add_pnl(position.strategy_name, self._pnl(position))
+            self._mark_spill(position)
+        elif op == 'rebuild_positions':
+            self.position_table = args[0]
+            self._build_strategy_pnl()
+            self._mark_all_spills()
 
     def get_positions(self, strategy_name):
         if strategy_name not in self.position_table:
@@ -40,16 +96,92 @@ class PositionTable:
         positions = self.get_positions(strategy_name)
 
         if symbol not in positions:
-            positions[symbol] = Position(strategy_name=strategy_name, symbol=symbol)
+            positions[symbol] = Position(strategy_name=strategy_name, symbol=symbol,
+                                         history_capacity=self.history_capacity, spill_dir=self.spill_dir)
 
         return positions[symbol]
 
-    def update_position(self, strategy_name, symbol, side, price, quantity, position_amount, order_state=None):
+    def get_strategy_pnl(self, strategy_name):
+        """
+        전략의 realized_pnl / fees / turnover 합계와 net_pnl (realized_pnl - fees)
+        """
+        totals = dict(self.strategy_pnl.get(strategy_name) or dict.fromkeys(self.PNL_FIELDS, 0.0))
+        totals['net_pnl'] = totals['realized_pnl'] - totals['fees']
+        return totals
+
+    def update_position(self, strategy_name, symbol, side, price, quantity, position_amount, order_state=None,
+                        fee=0.0):
+        """
+        journal에는 포지션 전체 대신 체결 한 건(delta)만 기록하고 replay할 때 다시 반영한다. (history 길이와 상관없는 비용)
+        position_open_date는 반영하는 시점의 시간이므로 replay 결과가 같도록 함께 기록한다.
+        """
         position = self.get_position(strategy_name, symbol)
-        if position.POSITION_STATE == PositionState.CLOSED:
-            position.open_position(side=side, price=price, quantity=quantity,
-                                   position_amount=position_amount, order_state=order_state)
-        else:
-            position.update_position(price=price, quantity=quantity, position_amount=position_amount,
-                                     order_state=order_state)
-        self._save_state()
\ No newline at end of file
+        self._fill(position, side, price, quantity, position_amount, order_state, fee)
+        self._commit('fill_position', strategy_name, symbol, side, price, quantity, position_amount, order_state, fee,
+                     position.position_open_date)
+        self._mark_spill(position)
+        if self.durability == Durability.SYNC:
+            self._flush_spill((strategy_name, symbol))
+        self._notify(position)
+
+    def _fill(self, position, side, price, quantity, position_amount, order_state, fee):
+        before = self._pnl(position)
+        position.apply_fill(side=side, price=price, quantity=quantity,
+                            position_amount=position_amount, order_state=order_state, fee=fee)
+        self._add_pnl(position.strategy_name, [after - prev for prev, after in zip(before, self._pnl(position))])
+
+    def rebuild(self, fills):
+        """
+        fill 기록(시간순)으로 모든 포지션을 한번에 다시 만들어서 table을 교체한다.
+        """
+        from core.rebuild import rebuild_positions  # numpy는 rebuild를 사용할 때만 import
+
+        self.position_table = rebuild_positions(fills, history_capacity=self.history_capacity, spill_dir=self.spill_dir)
+        self._build_strategy_pnl()
+        self._commit('rebuild_positions', self.position_table)
+        self._mark_all_spills()
+        for positions in self.position_table.values():
+            for position in positions.values():
+                self._notify(position)
+
+    def get_full_history(self, strategy_name, symbol, name):
+        return self.get_position(strategy_name, symbol).full_history(name)
+
+    def _mark_spill(self, position):
+        if self.spill_dir is not None:
+            self.spill_dirty.add((position.strategy_name, position.symbol))
+
+    def _mark_all_spills(self):
+        for positions in self.position_table.values():
+            for position in positions.values():
+                self._mark_spill(position)
+
+    def _flush_spill(self, key, fsync=False):
+        self.spill_dirty.discard(key)
+        position = self.position_table.get(key[0], {}).get(key[1])
+        if position is not None and position.flush_spills(fsync=fsync) and not fsync:
+            self.spill_unsynced.add(key)
+
+    def flush_spills(self, fsync=False):
+        for key in list(self.spill_dirty):
+            self._flush_spill(key, fsync=fsync)
+
+    def sync_spills(self):
+        """
+        journal을 기록한 뒤에 spill 파일을 모두 기록하고 fsync한다. (checkpoint가 log를 정리하기 전에 호출)
+        """
+        super().flush()
+        self.flush_spills(fsync=True)
+        for strategy_name, symbol in self.spill_unsynced:
+            position = self.position_table.get(strategy_name, {}).get(symbol)
+            if position is not None:
+                position.sync_spills()
+        self.spill_unsynced = set()
+
+    def flush(self):
+        # journal(pkl)을 먼저 기록한 뒤에 spill 파일을 기록한다.
+        super().flush()
+        self.flush_spills()
+
+    def close(self):
+        self.flush_spills()
@@ -0,0 +1,47 @@
+import threading
+
+
+class PositionWatcher:
+    """
+    여러 ledger의 포지션 변경을 따라가면서 값을 집계하는 객체의 공통 부분 (PnLEngine, ExposureAggregator)
+
+    watch: ledger lock 안에서 현재 포지션을 모두 반영한 뒤 PositionTable에 listener를 등록한다.
+           (반영과 등록 사이에 바뀐 포지션을 놓치지 않는다)
+    unwatch: listener를 제거하고 그 ledger가 반영했던 값을 정리한다. (_forget)
+
+    하위 클래스는 on_position(key, position)과 _forget(key)를 구현한다. (key: (username, ledger_name))
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = {}                     # key --> (PositionTable, listener)
+
+    def watch(self, key, ledger):
+        if key in self.listeners:
+            self.unwatch(key)
+
+        position_table = ledger.position_table
+        with ledger.lock:
+            for positions in position_table.position_table.values():
+                for position in positions.values():
+                    self.on_position(key, position)
+
+            listener = lambda position: self.on_position(key, position)
+            self.listeners[key] = (position_table, listener)
+            position_table.add_listener(listener)
+
+    def unwatch(self, key):
+        if key in self.listeners:
+            position_table, listener = self.listeners.pop(key)
+            position_table.remove_listener(listener)
+        with self.lock:
+            self._forget(key)
+
+    def on_position(self, key, position):
+        raise NotImplementedError
+
+    def _forget(self, key):
+        """
+        key의 ledger가 반영했던 값을 지운다. (self.lock 안에서 호출)
+        """
+        raise NotImplementedError
@@ -0,0 +1,262 @@
+from core.clock import now_ns
+from core.order import OrderState
+from core.position import Position, PositionState, TradeType
+
+try:
+    """
+    numpy가 있다면 fill 전체를 한번에 (vectorized) 처리하여 포지션을 만든다.
+    """
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+FILL_FIELDS = ('strategy_name', 'symbol', 'side', 'price', 'quantity', 'position_amount', 'order_state', 'fee')
+
+
+def _columns(fills) -> dict:
+    """
+    fill 목록을 column dict로 변환한다.
+
+    fills: {field: list} (column) / [dict, ...] / [tuple, ...] (FILL_FIELDS 순서)
+    position_amount, order_state, fee, timestamp는 없어도 된다.
+    """
+    if isinstance(fills, dict):
+        return fills
+    fills = list(fills)
+    if not fills:
+        return {field: [] for field in FILL_FIELDS}
+    if isinstance(fills[0], dict):
+        return {field: [fill.get(field) for fill in fills] for field in fills[0]}
+    return dict(zip(FILL_FIELDS, zip(*fills)))
+
+
+def _rebuild_scalar(columns, history_capacity=None, spill_dir=None) -> dict:
+    """
+    fill 한 건마다 Position.apply_fill을 호출하는 방식 (numpy가 없을 때 사용, vectorized 결과 검증용)
+    """
+    positions = {}
+    size = len(columns['quantity'])
+    amounts = columns.get('position_amount') or [None] * size
+    states = columns.get('order_state') or [None] * size
+    fees = columns.get('fee') or [0.0] * size
+    for i in range(size):
+        strategy_name, symbol = columns['strategy_name'][i], columns['symbol'][i]
+        strategy_positions = positions.setdefault(strategy_name, {})
+        if symbol not in strategy_positions:
+            strategy_positions[symbol] = Position(strategy_name, symbol,
+                                                  history_capacity=history_capacity, spill_dir=spill_dir)
+        strategy_positions[symbol].apply_fill(side=columns['side'][i],
+                                              price=columns['price'][i],
+                                              quantity=columns['quantity'][i],
+                                              position_amount=amounts[i],
+                                              order_state=states[i],
+                                              fee=fees[i])
+    return positions
+
+
+def _affine_scan(a, b):
+    """
+    x_k = a_k * x_(k-1) + b_k 를 prefix scan(doubling)으로 계산한다. (x_(-1) = 0)
+
+    곱해지는 계수는 항상 0~1 사이라서 fill이 많아도 overflow가 생기지 않는다.
+    (a_k = 0인 위치에서 이전 값과의 연결이 끊기므로 여러 포지션을 이어 붙인 상태로 한번에 계산할 수 있다)
+    """
+    a, b = a.copy(), b.copy()
+    step = 1
+    while step < len(a):
+        b[step:] = a[step:] * b[:-step] + b[step:]
+        a[step:] = a[step:] * a[:-step]
+        step *= 2
+    return b
+
+
+def rebuild_positions(fills, history_capacity=None, spill_dir=None) -> dict:
+    """
+    시간순으로 정렬된 fill 기록으로 모든 포지션을 다시 만든다. --> {strategy_name: {symbol: Position}}
+
+    Position.update_position을 fill마다 호출한 것과 같은 결과를 numpy array 연산으로 한번에 계산한다.
+
+    1. (strategy_name, symbol)별로 묶어서 누적 수량을 구한다.
+    2. 누적 수량이 0이 되는 곳(포지션 종료)과 부호가 바뀌는 곳(side 전환)으로 구간을 나눈다.
+    3. 마지막 구간(현재 열려있는 포지션)의 평균단가/투자금액/history를 계산한다.
+
+    평균단가는 prefix scan으로 계산하기 때문에 fill마다 계산한 값과 부동소수점 오차 범위 내에서 같다.
+    fill의 side는 수량의 부호와 같다고 가정한다. (BUY: +, SELL: -)
+    """
+    columns = _columns(fills)
+    if not NUMPY_AVAILABLE:
+        return _rebuild_scalar(columns, history_capacity, spill_dir)
+
+    size = len(columns['quantity'])
+    if size == 0:
+        return {}
+
+    # (strategy_name, symbol)이 처음 나온 위치를 group 번호로 사용한다.
+    first_seen = {}
+    group = np.fromiter(map(first_seen.setdefault, zip(columns['strategy_name'], columns['symbol']), range(size)),
+                        dtype=np.int64, count=size)
+    amounts = columns.get('position_amount')
+    states = columns.get('order_state')
+
+    order = np.argsort(group, kind='stable')
+    group = group[order]
+    side = np.asarray(columns['side'], dtype=object)[order]
+    price = np.asarray(columns['price'], dtype=np.float64)[order]
+    quantity = np.asarray(columns['quantity'], dtype=np.float64)[order]
+    # None --> nan
+    amount = np.full(size, np.nan) if amounts is None else np.array(amounts, dtype=np.float64)[order]
+    if states is None:
+        filled = np.zeros(size, dtype=bool)
+    else:
+        states = np.asarray(states, dtype=object)[order]
+        filled = (states == OrderState.FILLED) | (states == OrderState.CLOSED)
+    buy = side == 'BUY'
+    sell = side == 'SELL'
+
+    index = np.arange(size)
+    first = np.r_[True, group[1:] != group[:-1]]
+    starts = np.flatnonzero(first)
+    ends = np.r_[starts[1:], size]
+
+    # 누적 수량은 fill마다 더한 값과 정확히 같도록 포지션별로 순서대로 더한다.
+    total = np.empty(size)
+    for start, end in zip(starts, ends):
+        np.cumsum(quantity[start:end], out=total[start:end])
+    prev_total = np.r_[0.0, total[:-1]]
+    prev_total[first] = 0.0
+    zero = total == 0.0
+
+    # 포지션이 닫힌 상태에서 들어온 fill은 open, 그 외에는 update.
+    # update 후 수량이 0이면 닫히고, 수량 0으로 열린 (취소) 포지션은 다음 fill에서 update된다.
+    # --> 수량 0이 연속되는 구간에서는 open / update가 번갈아 나온다.
+    prev_zero = np.r_[False, zero[:-1]] & ~first
+    run_start = np.maximum.accumulate(np.where(prev_zero, 0, index))
+    group_start = np.maximum.accumulate(np.where(first, index, 0))
+    is_open = ((index - run_start) + (run_start == group_start)) % 2 == 1
+
+    prev_buy = np.r_[False, buy[:-1]]
+    prev_sell = np.r_[False, sell[:-1]]
+    flip = ~is_open & (((prev_total > 0) & (total < 0)) |
+                       ((prev_total < 0) & (total > 0)) |
+                       ((prev_total == 0) & ((prev_buy & (total < 0)) | (prev_sell & (total > 0)))))
+    segment_start = is_open | flip
+
+    # 구간(open/side 전환부터 다음 구간 전까지)별 side: open --> fill의 side, side 전환 --> 누적 수량의 부호
+    segment_side = np.where(is_open, side, np.where(total > 0, 'BUY', 'SELL'))
+    row_side = segment_side[np.maximum.accumulate(np.where(segment_start, index, 0))]
+    row_buy = row_side == 'BUY'
+    row_sell = row_side == 'SELL'
+
+    # 평균단가: ENTER --> (이전 평균단가 * 이전 수량 + 가격 * 수량) / 수량, EXIT --> 그대로, 구간 시작 --> 가격
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entering = (row_buy & (quantity >= 0)) | (row_sell & (quantity <= 0))
+        coef = np.where(zero, 0.0, np.where(entering, prev_total / total, 1.0))
+        const = np.where(zero | ~entering, 0.0, price * quantity / total)
+    coef[segment_start] = 0.0
+    const[segment_start] = price[segment_start]
+    average_price = _affine_scan(coef, const)
+
+    # 실현손익: EXIT --> (이전 평균단가 - 가격) * 수량, side 전환 --> 기존 포지션 전체를 EXIT
+    prev_average_price = np.r_[0.0, average_price[:-1]]
+    exiting = ~segment_start & ((row_buy & (quantity < 0)) | (row_sell & (quantity > 0)))
+    exit_quantity = np.where(flip, -prev_total, np.where(exiting, quantity, 0.0))
+    realized_pnl = np.add.reduceat((prev_average_price - price) * exit_quantity, starts)
+    turnover = np.add.reduceat(np.abs(price * quantity), starts)
+    fees = np.zeros(len(starts)) if columns.get('fee') is None else \
+        np.add.reduceat(np.array(columns['fee'], dtype=np.float64)[order], starts)
+
+    last = ends - 1
+    head = np.maximum.reduceat(np.where(segment_start, index, -1), starts)
+    closed = ~segment_start[last] & zero[last]
+
+    # 열려있는 포지션의 마지막 구간만 이어 붙여서 계산한다.
+    open_groups = np.flatnonzero(~closed)
+    lengths = last[open_groups] - head[open_groups] + 1
+    offsets = np.cumsum(lengths) - lengths
+    owner = np.repeat(np.arange(len(open_groups)), lengths)
+    rows = np.repeat(head[open_groups] - offsets, lengths) + np.arange(lengths.sum())
+    seg_first = np.zeros(len(rows), dtype=bool)
+    seg_first[offsets] = True
+
+    seg_side = segment_side[head[open_groups]]
+    seg_buy = row_buy[rows]
+    seg_sell = row_sell[rows]
+
+    p = price[rows]
+    q = quantity[rows]
+    q_total = total[rows]
+    a = amount[rows]
+
+    enter = (seg_buy & (q > 0)) | (seg_sell & (q < 0))
+    exit_ = (seg_buy & (q < 0)) | (seg_sell & (q > 0))
+    trade = np.where(enter, TradeType.CODES[TradeType.ENTER],
+                     np.where(exit_, TradeType.CODES[TradeType.EXIT], TradeType.CODES[TradeType.CANCEL]))
+    trade[seg_first] = TradeType.CODES[TradeType.ENTER]
+    history_quantity = np.where(seg_first, q_total, q)
+
+    seg_average_price = average_price[rows]
+
+    # 투자금액: 시작 --> position_amount (side 전환이라면 새 포지션 수량 비율만큼) 혹은 가격 * 수량
+    #          이후 --> position_amount 혹은 ENTER: 가격 * 수량, EXIT: 평균단가 * 수량
+    with np.errstate(divide='ignore', invalid='ignore'):
+        trade_price = np.where(trade == TradeType.CODES[TradeType.ENTER], p,
+                               np.where(trade == TradeType.CODES[TradeType.EXIT], seg_average_price, 0.0))
+        delta = np.where(np.isnan(a), trade_price * q, a)
+        flipped = seg_first & ~is_open[rows]
+        delta[flipped] = np.where(np.isnan(a[flipped]), p[flipped] * q_total[flipped],
+                                  a[flipped] / np.abs(q_total[flipped] / q[flipped]))
+        delta[seg_first & is_open[rows]] = np.where(np.isnan(a), p * q, a)[seg_first & is_open[rows]]
+    position_amount = np.empty(len(rows))
+    for offset, length in zip(offsets, lengths):
+        np.cumsum(delta[offset:offset + length], out=position_amount[offset:offset + length])
+
+    enter_cnt = np.bincount(owner, weights=trade == TradeType.CODES[TradeType.ENTER], minlength=len(open_groups))
+    exit_cnt = np.bincount(owner, weights=trade == TradeType.CODES[TradeType.EXIT], minlength=len(open_groups))
+    fill_cnt = np.bincount(owner, weights=filled[rows], minlength=len(open_groups))
+    timestamps = columns.get('timestamp')
+
+    keys = [(columns['strategy_name'][i], columns['symbol'][i]) for i in group[starts]]
+    positions = {}
+    for g in range(len(starts)):
+        strategy_name, symbol = keys[g]
+        position = Position(strategy_name, symbol, history_capacity=history_capacity, spill_dir=spill_dir)
+        positions.setdefault(strategy_name, {})[symbol] = position
+        for name, _ in Position.HISTORY_FIELDS:
+            getattr(position, name).clear()
+        position.realized_pnl = float(realized_pnl[g])
+        position.fees = float(fees[g])
+        position.turnover = float(turnover[g])
+        if closed[g]:
+            position.quantity = 0.0
+            position.close_position()
+
+    for i, g in enumerate(open_groups):
+        strategy_name, symbol = keys[g]
+        position = positions[strategy_name][symbol]
+        begin, end = offsets[i], offsets[i] + lengths[i]
+        final = end - 1
+
+        position.POSITION_STATE = PositionState.OPEN
+        position.position_open_date = now_ns() if timestamps is None else int(timestamps[order[head[g]]])
+        position.side = seg_side[i]
+        position.average_price = float(seg_average_price[final])
+        position.quantity = float(q_total[final])
+        position.position_amount = float(position_amount[final])
+        if lengths[i] == 1:
+            numerator, default = p[begin] * q_total[begin], 1.0
+        else:
+            numerator, default = seg_average_price[final] * q_total[final], 0.0
+        position.leverage = float(abs(numerator / position.position_amount)) if position.position_amount else default
+
+        position.price_history.extend(p[begin:end].tolist())
+        position.quantity_history.extend(history_quantity[begin:end].tolist())
+        position.trade_history.extend(trade[begin:end].tolist())
+        position.fill_history.extend(filled[rows[begin:end]].tolist())
+        position._enter_cnt = int(enter_cnt[i])
+        position._exit_cnt = int(exit_cnt[i])
+        position._fill_cnt = int(fill_cnt[i])
+
+    return positions
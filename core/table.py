@@ -0,0 +1,137 @@
+import os
+import pickle
+from pathlib import Path
+
+from core.journal import Journal, Durability
+
+
+def ledger_path(user_name='', ledger_name=''):
+    """
+    ledger의 상태 파일들이 저장되는 경로: ~/easy_ledger/<user>/<ledger>/
+    """
+    path = Path.home() / 'easy_ledger' / user_name / ledger_name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def atomic_write(path, data: bytes, fsync=True):
+    """
+    임시 파일에 쓰고 (fsync 후) rename하여 파일을 원자적으로 교체한다. (쓰는 도중 종료되어도 이전 파일이 남는다)
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Table:
+    """
+    CashTable / OrderTable / PositionTable의 상태 저장 방식을 관리하는 base class
+
+    auto_save: pkl파일로 table 전체의 상태를 저장 (변경이 있을 때마다 전체를 다시 pickle)
+    journal: auto_save와 함께 사용하면 변경사항만 log 파일에 append하고, 로딩시 replay하여 상태를 복구
+
+    하위 클래스는 STATE_FIELDS에 저장할 attribute 이름을 정의하고,
+    _init_state (빈 상태 생성), _apply (journal record replay)를 구현한다.
+
+    snapshot: Ledger checkpoint로 저장된 상태가 있다면 pkl 대신 이 상태에서 시작하여 남은 log만 replay한다.
+    durability: SYNC가 아니라면 mutation은 dirty 표시만 하고, flush_size개가 쌓이거나 flush()가 호출될 때 저장한다.
+    """
+
+    CACHE_NAME = None
+    JOURNAL_NAME = None
+    STATE_FIELDS = ()
+    TRANSIENT_FIELDS = ('journal',)
+
+    def __init__(self, user_name='', ledger_name='', auto_save=False, journal=False, snapshot=None,
+                 durability=Durability.SYNC, flush_size=100):
+        if durability not in Durability.ALL:
+            raise Exception(f'durability는 {Durability.ALL} 중 하나여야 합니다.')
+
+        path = ledger_path(user_name, ledger_name)
+        self.CACHE_NAME = path / self.CACHE_NAME
+        self.auto_save = auto_save
+        self.durability = durability
+        self.flush_size = flush_size
+        self.dirty = 0
+        self.journal = Journal(path / self.JOURNAL_NAME,
+                               durability=durability,
+                               flush_size=flush_size) if (auto_save and journal) else None
+        self._load_state(snapshot)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for field in self.TRANSIENT_FIELDS:
+            state.pop(field, None)
+        return state
+
+    def _init_state(self):
+        raise NotImplementedError
+
+    def _apply(self, record):
+        raise NotImplementedError
+
+    def _restore_state(self, state: dict):
+        for field in self.STATE_FIELDS:
+            setattr(self, field, state[field])
+
+    def _load_state(self, snapshot=None):
+        lsn = 0
+        if snapshot is not None and self.journal is not None:
+            self._restore_state(snapshot)
+            lsn = snapshot['lsn']
+        elif os.path.exists(self.CACHE_NAME) and self.auto_save:
+            with open(self.CACHE_NAME, 'rb') as f:
+                cached = pickle.load(f)
+            self._restore_state({field: getattr(cached, field) for field in self.STATE_FIELDS})
+        else:
+            self._init_state()
+            self._save_state()
+
+        if self.journal is not None:
+            for record in self.journal.replay(after_lsn=lsn):
+                self._apply(record)
+
+    def snapshot(self) -> dict:
+        """
+        checkpoint에 저장할 상태 (어느 lsn까지 반영된 상태인지 함께 기록)
+        """
+        state = {field: getattr(self, field) for field in self.STATE_FIELDS}
+        state['lsn'] = self.journal.lsn if self.journal is not None else 0
+        return state
+
+    def _save_state(self):
+        """
+        table 전체를 pkl 파일로 교체한다. (ASYNC가 아니라면 fsync)
+        """
+        if self.auto_save:
+            atomic_write(self.CACHE_NAME, pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL),
+                         fsync=self.durability != Durability.ASYNC)
+
+    def _commit(self, *record):
+        """
+        mutation이 발생할 때마다 호출한다.
+
+        journal 모드라면 record 하나만 append하고, 아니라면 table 전체를 저장한다.
+        """
+        if self.journal is not None:
+            self.journal.append(record)
+        else:
+            self.dirty += 1
+            if self.durability == Durability.SYNC or \
+                    (self.durability == Durability.GROUPED and self.dirty >= self.flush_size):
+                self.flush()
+
+    def flush(self):
+        """
+        아직 저장되지 않은 변경사항을 기록한다. (write-behind 모드에서 Flusher가 주기적으로 호출)
+        """
+        if self.journal is not None:
+            self.journal.flush()
+        elif self.dirty:
+            self._save_state()
+            self.dirty = 0
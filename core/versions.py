@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+
+class VersionIndex:
+    """
+    전략별 entry(주문 init_id, 포지션 symbol)의 마지막 변경 version --> since_version 이후 바뀐 entry만 조회
+
+    version은 Ledger의 change seq를 그대로 사용한다. (변경 feed의 seq와 같은 값)
+    version은 계속 증가하므로 entry를 version 순서로 유지하고, 최근 쪽에서부터 since_version까지만 읽는다.
+    --> 조회 비용은 전체 entry 수가 아니라 since_version 이후 바뀐 entry 수에 비례
+    table에서 제거된 entry는 tombstone으로 version을 남겨두어 삭제되었다는 것을 알려준다.
+
+    max_tombstones: 전략별 tombstone 최대 개수. 넘으면 오래된 것부터 버리고 floor를 올린다.
+                    floor보다 오래된 since_version으로는 삭제 여부를 알 수 없으므로 전체를 다시 조회해야 한다.
+    reset_version: table 전체가 교체된 version (recover / rebuild) --> 이보다 오래된 since_version은 전체 조회
+    """
+
+    def __init__(self, max_tombstones=10000):
+        self.max_tombstones = max_tombstones
+        self.live = {}                          # strategy_name --> OrderedDict(key: version), version 순서
+        self.tombstones = {}                    # strategy_name --> OrderedDict(key: version), version 순서
+        self.floor = {}                         # strategy_name --> 버려진 tombstone의 최대 version
+        self.strategy_versions = {}             # strategy_name --> 전략의 마지막 변경 version
+        self.reset_version = 0
+
+    def touch(self, strategy_name, key, version):
+        live = self.live.setdefault(strategy_name, OrderedDict())
+        live[key] = version
+        live.move_to_end(key)
+        tombstones = self.tombstones.get(strategy_name)
+        if tombstones:
+            tombstones.pop(key, None)
+        self.strategy_versions[strategy_name] = version
+
+    def remove(self, strategy_name, key, version):
+        live = self.live.get(strategy_name)
+        if live:
+            live.pop(key, None)
+        tombstones = self.tombstones.setdefault(strategy_name, OrderedDict())
+        tombstones.pop(key, None)
+        tombstones[key] = version
+        if len(tombstones) > self.max_tombstones:
+            _, dropped = tombstones.popitem(last=False)
+            self.floor[strategy_name] = dropped
+        self.strategy_versions[strategy_name] = version
+
+    def version(self, strategy_name):
+        return max(self.strategy_versions.get(strategy_name, 0), self.reset_version)
+
+    def changed(self, strategy_name, since_version):
+        """
+        --> (바뀐 key 목록, 삭제된 key 목록), since_version이 floor보다 오래되었다면 None (전체 조회 필요)
+        """
+        if since_version < max(self.floor.get(strategy_name, 0), self.reset_version):
+            return None
+        if since_version >= self.version(strategy_name):
+            return [], []
+
+        return self._since(self.live, strategy_name, since_version), \
+            self._since(self.tombstones, strategy_name, since_version)
+
+    @staticmethod
+    def _since(entries, strategy_name, since_version):
+        # 최근에 바뀐 entry부터 since_version 이후인 것까지만 (최근 순서)
+        keys = []
+        for key, version in reversed(entries.get(strategy_name, {}).items()):
+            if version <= since_version:
+                break
+            keys.append(key)
+        return keys
+
+    def reset(self, version):
+        self.live = {}
+        self.tombstones = {}
+        self.floor = {}
+        self.strategy_versions = {}
+        self.reset_version = version
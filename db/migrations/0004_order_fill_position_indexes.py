@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('db', '0003_auto_20210423_1820'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'strategy_name', 'init_id'], name='order_user_strategy_init_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'order_number'], name='order_user_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fill',
+            index=models.Index(fields=['order', 'timestamp'], name='fill_order_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['user', 'strategy_name', 'symbol'], name='position_user_strategy_idx'),
+        ),
+    ]
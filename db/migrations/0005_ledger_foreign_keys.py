@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def assign_single_ledger(apps, schema_editor):
+    """
+    ledger가 하나뿐인 유저의 기존 Order/Cash/Position row는 그 ledger에 속한 것으로 본다.
+    (여러 ledger를 가진 유저의 기존 row는 어느 ledger인지 알 수 없으므로 비워둔다)
+    """
+    Ledger = apps.get_model('db', 'Ledger')
+    ledgers = {}
+    for ledger_id, user_id in Ledger.objects.values_list('id', 'user_id').iterator():
+        ledgers.setdefault(user_id, []).append(ledger_id)
+
+    for model_name in ('Order', 'Cash', 'Position'):
+        model = apps.get_model('db', model_name)
+        for user_id, ledger_ids in ledgers.items():
+            if len(ledger_ids) == 1:
+                model.objects.filter(user_id=user_id, ledger__isnull=True).update(ledger_id=ledger_ids[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('db', '0004_order_fill_position_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cash',
+            name='ledger',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cash', to='db.ledger'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='ledger',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='db.ledger'),
+        ),
+        migrations.AddField(
+            model_name='position',
+            name='ledger',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='positions', to='db.ledger'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['ledger', 'order_state'], name='order_ledger_state_idx'),
+        ),
+        migrations.RunPython(assign_single_ledger, migrations.RunPython.noop),
+    ]
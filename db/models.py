@@ -105,6 +105,11 @@ class Cash(models.Model):
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE,
                              related_name='cash')
+    ledger = models.ForeignKey(Ledger,
+                               on_delete=models.CASCADE,
+                               related_name='cash',
+                               blank=True,
+                               null=True)
     strategy_name = models.CharField(max_length=150, blank=True, null=True)
     quote = models.CharField(max_length=50, blank=True, null=True)
     amount = models.FloatField(blank=True, null=True)
@@ -119,6 +124,11 @@ class Order(models.Model):
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE,
                              related_name='orders')
+    ledger = models.ForeignKey(Ledger,
+                               on_delete=models.CASCADE,
+                               related_name='orders',
+                               blank=True,
+                               null=True)
     strategy_name = models.CharField(max_length=150, blank=True, null=True)
     order_state = models.CharField(max_length=6, choices=ORDER_STATE_CHOICES, blank=True, null=True)
     init_time = models.CharField(max_length=25, blank=True, null=True)
@@ -142,6 +152,13 @@ class Order(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'strategy_name', 'init_id'], name='order_user_strategy_init_idx'),
+            models.Index(fields=['user', 'order_number'], name='order_user_number_idx'),
+            models.Index(fields=['ledger', 'order_state'], name='order_ledger_state_idx'),
+        ]
+
     def __str__(self):
         return f'{self.strategy_name} {self.symbol} {self.price} {self.quote} {self.quantity} [{self.created}]'
 
@@ -159,6 +176,11 @@ class Fill(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'timestamp'], name='fill_order_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f'{self.order} {self.timestamp} {self.quantity}'
 
@@ -167,6 +189,11 @@ class Position(models.Model):
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE,
                              related_name='positions')
+    ledger = models.ForeignKey(Ledger,
+                               on_delete=models.CASCADE,
+                               related_name='positions',
+                               blank=True,
+                               null=True)
     strategy_name = models.CharField(max_length=150, blank=True, null=True)
     position_state = models.CharField(max_length=6, choices=POSITION_STATE_CHOICES, blank=True, null=True)
     symbol = models.CharField(max_length=30, blank=True, null=True)
@@ -178,6 +205,11 @@ class Position(models.Model):
     invest_amount = models.FloatField(blank=True, null=True)
     borrow_amount = models.FloatField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'strategy_name', 'symbol'], name='position_user_strategy_idx'),
+        ]
+
     def __str__(self):
         return f'{self.strategy_name} {self.symbol} {self.side} {self.quantity}'
 
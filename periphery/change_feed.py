@@ -0,0 +1,112 @@
+import zmq
+import queue
+import threading
+
+from periphery import codec
+
+
+def change_topic(username, ledger_name, strategy_name=None):
+    """
+    PUB topic: <username>/<ledger_name>/<strategy_name> (prefix로 구독하므로 ledger 전체는 <username>/<ledger_name>/)
+    """
+    return f'{username}/{ledger_name}/{strategy_name or ""}'
+
+
+class ChangeFeed(threading.Thread):
+    """
+    ledger 변경사항(주문 / 포지션 / cash delta)을 PUB socket으로 내보내는 publisher
+
+    ledger의 change listener는 요청을 처리하는 worker thread에서 (ledger lock 안에서) 호출되므로 queue에 넣기만 하고,
+    PUB socket은 이 thread에서만 사용한다.
+
+    queue가 가득 차면 event를 버린다. (구독하는 쪽은 seq가 건너뛴 것을 보고 다시 조회한다)
+    bind: False라면 address로 connect한다. (ShardedLedgerServer처럼 여러 process의 feed를 XSUB/XPUB로 모으는 경우)
+    """
+
+    def __init__(self, address='tcp://*:9997', max_queue=100000, bind=True):
+        super().__init__(daemon=True)
+        self.address = address
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.listeners = {}                     # (username, ledger_name) --> (ledger, listener)
+        self.dropped = 0
+        self.stopped = threading.Event()
+
+        self.socket = zmq.Context.instance().socket(zmq.PUB)
+        if bind:
+            self.socket.bind(address)
+        else:
+            self.socket.connect(address)
+
+    def watch(self, username, ledger_name, ledger):
+        key = (username, ledger_name)
+        if key in self.listeners:
+            self.unwatch(username, ledger_name)
+
+        listener = lambda event: self.publish(username, ledger_name, event)
+        self.listeners[key] = (ledger, listener)
+        ledger.add_change_listener(listener)
+
+    def unwatch(self, username, ledger_name):
+        ledger, listener = self.listeners.pop((username, ledger_name), (None, None))
+        if ledger is not None:
+            ledger.remove_change_listener(listener)
+
+    def publish(self, username, ledger_name, event):
+        try:
+            self.queue.put_nowait((change_topic(username, ledger_name, event['strategy_name']), event))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                topic, event = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.socket.send_multipart([topic.encode('utf-8'), codec.JSON.encode(event)])
+
+    def stop(self):
+        self.stopped.set()
+
+
+class ChangeFeedSubscriber:
+    """
+    ChangeFeed 구독 (ledger 단위)
+
+    topic prefix는 전략 이름의 prefix도 함께 매칭하므로 ledger 전체를 구독하고 strategy_name으로 걸러낸다.
+    (ledger의 모든 event를 받기 때문에 전략별로 구독해도 seq로 누락을 확인할 수 있다)
+
+    recv: (topic, event, gap) --> gap이 True라면 이전 event를 놓쳤으므로 (seq가 건너뛰었거나 epoch가 바뀜, reset)
+          get_orders / get_positions / get_cash로 전체 상태를 다시 조회해야 한다.
+    """
+
+    def __init__(self, username, ledger_name, strategy_name=None, address='tcp://localhost:9997'):
+        self.socket = zmq.Context.instance().socket(zmq.SUB)
+        self.socket.connect(address)
+        self.socket.setsockopt_string(zmq.SUBSCRIBE, change_topic(username, ledger_name))
+        self.strategy_name = strategy_name
+        self.epoch = None
+        self.seq = None
+        self.gap = False
+
+    def recv(self, timeout=None):
+        """
+        timeout (ms) 동안 event가 없다면 None
+        """
+        while True:
+            if timeout is not None and not self.socket.poll(timeout):
+                return None
+            topic, payload = self.socket.recv_multipart()
+            event = codec.JSON.decode(payload)
+
+            self.gap = self.gap or self.epoch != event['epoch'] or event['seq'] != self.seq + 1 or \
+                event['type'] == 'reset'
+            self.epoch, self.seq = event['epoch'], event['seq']
+            if self.strategy_name is not None and event['strategy_name'] not in (None, self.strategy_name):
+                continue
+
+            gap, self.gap = self.gap, False
+            return topic.decode('utf-8'), event, gap
+
+    def close(self):
+        self.socket.close(linger=0)
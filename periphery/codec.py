@@ -0,0 +1,107 @@
+import json
+
+try:
+    """
+    orjson이 있다면 JSON encode/decode를 orjson으로 처리한다. (같은 JSON 형식이므로 상대방은 json 모듈이어도 된다)
+    """
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    """
+    msgpack이 있다면 binary codec으로 협상할 수 있다. (float이 많은 history 응답에서 encode/decode 비용이 줄어든다)
+    """
+    import msgpack
+
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+
+# double로 숫자를 읽는 client(JavaScript 등)가 정확히 읽을 수 있는 최대 정수
+MAX_SAFE_INTEGER = (1 << 53) - 1
+
+
+def safe_ints(obj):
+    """
+    MAX_SAFE_INTEGER를 넘는 정수(SnowflakeIdGenerator의 주문 id 등)를 문자열로 바꾼다. (dict / list / tuple 안까지)
+    """
+    if isinstance(obj, int):
+        return str(obj) if abs(obj) > MAX_SAFE_INTEGER else obj
+    if isinstance(obj, dict):
+        return {key: safe_ints(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [safe_ints(value) for value in obj]
+    return obj
+
+
+class JsonCodec:
+    """
+    기본 codec (협상하지 않은 client / 이전 버전 client는 모두 JSON)
+
+    JSON number로는 정밀도를 잃는 큰 정수는 문자열로 보낸다. (msgpack은 정수 그대로)
+    """
+
+    name = 'json'
+
+    if ORJSON_AVAILABLE:
+        def encode(self, obj) -> bytes:
+            # 큰 정수가 없다면 변환 없이 바로 encode (OPT_STRICT_INTEGER: 53bit를 넘는 정수가 있으면 예외)
+            try:
+                return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_STRICT_INTEGER)
+            except orjson.JSONEncodeError:
+                return orjson.dumps(safe_ints(obj), default=str, option=orjson.OPT_NON_STR_KEYS)
+
+        def decode(self, payload: bytes):
+            return orjson.loads(payload)
+    else:
+        def encode(self, obj) -> bytes:
+            return json.dumps(safe_ints(obj), default=str).encode('utf-8')
+
+        def decode(self, payload: bytes):
+            return json.loads(payload)
+
+
+class MsgpackCodec:
+
+    name = 'msgpack'
+
+    def encode(self, obj) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True, default=str)
+
+    def decode(self, payload: bytes):
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+# server가 지원하는 codec (binary codec이 먼저)
+CODECS = {}
+if MSGPACK_AVAILABLE:
+    CODECS['msgpack'] = MsgpackCodec()
+CODECS['json'] = JsonCodec()
+
+JSON = CODECS['json']
+
+
+def negotiate(client_codecs=None):
+    """
+    client가 지원하는 codec(선호하는 순서) 중 server도 지원하는 첫번째 codec 이름 (없으면 json)
+    """
+    for name in client_codecs or ():
+        if name in CODECS:
+            return name
+    return JSON.name
+
+
+def detect(payload: bytes):
+    """
+    요청 payload의 codec을 찾는다. JSON 요청은 항상 object('{')이므로 공백을 제외한 첫 byte로 구분한다.
+    (msgpack 요청은 map이므로 0x80 이상의 byte로 시작한다)
+
+    server는 요청과 같은 codec으로 응답하기 때문에 connection별 상태를 가지지 않는다. (sharded router도 그대로 전달)
+    """
+    if payload.lstrip()[:1] in (b'{', b'[') or not MSGPACK_AVAILABLE:
+        return JSON
+    return CODECS['msgpack']
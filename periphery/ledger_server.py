@@ -1,9 +1,23 @@
 import zmq
 import json
+import zlib
+import time
 import uuid
+import threading
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+from core.order import Order
+from core.pnl import PnLEngine
+from core.exposure import ExposureAggregator
 from core.ledger import Ledger
+from core.ledger_db import list_ledgers_db
+from core.journal import Durability
+from core.clock import format_timestamp, format_date
+from periphery.market_data import MarketDataFeed
+from periphery.change_feed import ChangeFeed
+from periphery import codec
 
 
 class LedgerServer:
@@ -11,120 +25,502 @@ class LedgerServer:
     SocketServer와 소통하게 될 Ledger 매니저 서버
 
     웹소켓 서버로부터 세션 등록을 요청하면 그 유저의 Ledger를 생성한다.
-    """
 
-    def __init__(self):
-        self.ledgers = {}
+    ledger는 (username, ledger_name)별로 하나만 만들고 같은 ledger를 요청한 session들이 함께 사용한다. (재접속해도 그대로)
+    사용하지 않는 ledger(idle_timeout / max_ledgers / 연결된 session 없음)는 저장 후 메모리에서 내리고,
+    다음 요청에서 디스크 상태로 다시 불러온다.
 
-        ctx = zmq.Context()
-        self.socket = ctx.socket(zmq.REP)
-        self.socket.bind('tcp://*:9999')
+    요청 type별 처리 함수는 requests에 등록되어 있고 (register_request), 처리 횟수/시간은 get_stats로 조회한다.
 
-    def _send(self, res):
-        self.socket.send_string(json.dumps(res))
+    요청/응답 encoding은 hello 요청으로 협상한다. (msgpack 등, 협상하지 않으면 JSON)
+    server는 요청 payload의 codec을 보고 같은 codec으로 응답한다. (periphery.codec.detect)
 
-    def start_server(self):
-        print('Starting ledger server')
-        while True:
-            req = self.socket.recv_string()
-            req = json.loads(req)
-            print(req)
+    shutdown 요청을 받으면 더이상 요청을 받지 않고, worker들이 받은 요청을 마저 처리한 뒤에
+    자신의 ledger를 모두 저장하고 내리면 응답하고 종료한다. (start_server가 리턴)
+    """
 
-            try:
-                req_type = req['type']
-
-                if req_type == 'ping':
-                    self._send({'status': 'success', 'result': 'pong'})
-
-                elif req_type == 'add_ledger':
-                    params = req.get('params', {})
-                    ledger_name = self.add_ledger(**params)
-                    self._send({'status': 'success', 'result': ledger_name})
-
-                elif req_type == 'get_cash':
-                    params = req.get('params', {})
-                    cash = self.get_cash(**params)
-                    self._send({'status': 'success', 'result': cash})
-
-                elif req_type == 'update_cash':
-                    params = req.get('params', {})
-                    self.update_cash(**params)
-                    self._send({'status': 'success', 'result': f'{req_type} successful'})
-
-                elif req_type == 'get_orders':
-                    params = req.get('params', {})
-                    orders = self.get_orders(**params)
-                    self._send({'status': 'success', 'result': orders})
-
-                elif req_type == 'get_order':
-                    params = req.get('params', {})
-                    order = self.get_order(**params)
-                    self._send({'status': 'success', 'result': order})
-
-                elif req_type == 'clean_orders':
-                    params = req.get('params', {})
-                    self.clean_orders(**params)
-                    self._send({'status': 'success', 'result': f'{req_type} successful'})
-
-                elif req_type == 'init_order':
-                    params = req.get('params', {})
-                    order_hash = self.init_order(**params)
-                    self._send({'status': 'success', 'result': order_hash})
-
-                elif req_type == 'register_order':
-                    params = req.get('params', {})
-                    strategy_name = self.register_order(**params)
-                    self._send({'status': 'success', 'result': strategy_name})
-
-                elif req_type == 'cancel_order':
-                    params = req.get('params', {})
-                    self.cancel_order(**params)
-                    self._send({'status': 'success', 'result': f'{req_type} successful'})
-
-                elif req_type == 'fill_order':
-                    params = req.get('params', {})
-                    self.fill_order(**params)
-                    self._send({'status': 'success', 'result': f'{req_type} successful'})
-
-                elif req_type == 'get_positions':
-                    params = req.get('params', {})
-                    positions = self.get_positions(**params)
-                    self._send({'status': 'success', 'result': positions})
-
-                elif req_type == 'get_position':
-                    params = req.get('params', {})
-                    order = self.get_position(**params)
-                    self._send({'status': 'success', 'result': order})
-
-                elif req_type == 'update_position':
-                    params = req.get('params', {})
-                    self.update_position(**params)
-                    self._send({'status': 'success', 'result': f'{req_type} successful'})
+    # 다른 ledger를 건드리거나 batch 안에서 의미가 없는 요청
+    BATCH_EXCLUDED = ('batch', 'recover_ledgers', 'close_ledger', 'close_session', 'get_stats', 'ping', 'hello')
+
+    def __init__(self, durability=Durability.SYNC, init_ttl=None, history_capacity=None,
+                 market_data_address=None, pnl_publish_rate=10.0, db_save=False, workers=4,
+                 address='tcp://*:9999', change_feed_address=None, change_feed_bind=True, idle_timeout=3600,
+                 max_ledgers=None, evict_interval=1.0):
+        """
+        durability: add_ledger 요청에서 따로 지정하지 않은 ledger에 사용할 저장 방식 (sync / grouped / async)
+        init_ttl: 접수되지 않은 init 주문을 만료시키는 시간 (초)
+        history_capacity: 포지션 history를 메모리에 유지하는 개수 (넘어가는 부분은 ledger 경로의 history 파일로)
+        market_data_address: 시세 서버 주소 (예: tcp://10.0.1.128:5567) --> 있다면 포지션별 평가손익을 계산 (get_pnl)
+        pnl_publish_rate: 평가손익을 다시 계산하는 최대 횟수 (초당)
+        db_save: ledger 변경사항을 DB에도 기록 (recover_ledgers로 DB에서 ledger를 복구할 수 있다)
+        workers: 요청을 처리하는 worker thread 수 (ledger별로 하나의 worker가 순서대로 처리)
+        address: 요청을 받는 ROUTER socket 주소 (REQ/DEALER client 모두 사용 가능)
+        change_feed_address: 있다면 ledger 변경사항을 이 주소의 PUB socket으로 내보낸다. (예: tcp://*:9997)
+        change_feed_bind: False라면 change_feed_address에 bind하지 않고 connect (feed를 모으는 proxy가 있는 경우)
+        idle_timeout: 이 시간(초) 동안 요청이 없었던 ledger는 저장 후 내린다. (None이면 시간으로 내리지 않음)
+        max_ledgers: 메모리에 유지하는 최대 ledger 수 --> 넘으면 가장 오래전에 사용한 ledger부터 내린다.
+        evict_interval: worker가 내릴 ledger를 찾는 간격 (초)
+        """
+        self.ledgers = OrderedDict()            # (username, ledger_name) --> Ledger, 마지막으로 사용한 순서
+        self.last_access = {}                   # (username, ledger_name) --> 마지막 요청 시간 (monotonic)
+        self.sessions = {}                      # (username, ledger_name) --> ledger를 사용하는 session_id들
+        self.session_ledgers = {}               # session_id --> 사용하는 (username, ledger_name)들
+        self.detached = set()                   # 연결된 session이 모두 끊긴 ledger (다음 정리 때 내린다)
+        self.pinned = {}                        # (username, ledger_name) --> 내리면 안 되는 작업 수 (recover_ledgers)
+        self.loading = set()                    # 디스크 상태에서 불러오는 중인 (username, ledger_name)
+        self.idle_timeout = idle_timeout
+        self.max_ledgers = max_ledgers
+        self.evict_interval = evict_interval
+        self.durability = durability
+        self.init_ttl = init_ttl
+        self.history_capacity = history_capacity
+        self.db_save = db_save
+
+        self.pnl = PnLEngine(publish_rate=pnl_publish_rate)
+        self.exposure = ExposureAggregator()
+        self.market_data = None
+        if market_data_address is not None:
+            self.market_data = MarketDataFeed(self.pnl, address=market_data_address)
+            self.market_data.start()
+
+        self.change_feed = None
+        if change_feed_address is not None:
+            self.change_feed = ChangeFeed(address=change_feed_address, bind=change_feed_bind)
+            self.change_feed.start()
+
+        self.workers = workers
+        self.ledgers_lock = threading.Lock()
+        self.loading_cond = threading.Condition()
+        self.stopped = threading.Event()
+
+        self.requests = {}
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self._register_requests()
+
+        self.ctx = zmq.Context.instance()
+        self.socket = self.ctx.socket(zmq.ROUTER)
+        self.socket.bind(address)
 
+    def start_server(self):
+        """
+        ROUTER front-end: 요청을 받으면 ledger별로 정해진 worker에 넘기고, worker의 응답은 도착하는 순서대로 돌려준다.
+
+        같은 ledger의 요청은 항상 같은 worker의 queue로 가기 때문에 순서대로 처리되고,
+        다른 ledger의 요청은 다른 worker에서 동시에 처리된다. (응답 순서는 요청 순서와 다를 수 있다)
+        """
+        print('Starting ledger server')
+        backends, workers = [], []
+        for i in range(self.workers):
+            backend = self.ctx.socket(zmq.PAIR)
+            backend.bind(f'inproc://ledger-worker-{id(self)}-{i}')
+            worker = threading.Thread(target=self._worker, args=(i,), daemon=True)
+            worker.start()
+            backends.append(backend)
+            workers.append(worker)
+
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        for backend in backends:
+            poller.register(backend, zmq.POLLIN)
+
+        shutdown = None
+        while not self.stopped.is_set():
+            for sock, _ in poller.poll(1000):
+                if sock is self.socket:
+                    frames = self.socket.recv_multipart()
+                    try:
+                        req_codec = codec.detect(frames[-1])
+                        req = req_codec.decode(frames[-1])
+                        key = self._route_key(req)
+                    except:
+                        req, key = None, None
+                    if isinstance(req, dict) and req.get('type') == 'shutdown':
+                        shutdown = (frames[:-1], req_codec)
+                        self.stopped.set()
+                        break
+                    backends[self._worker_index(key)].send_multipart(frames)
                 else:
-                    self._send({'status': 'failed', 'result': 'no type field'})
+                    self.socket.send_multipart(sock.recv_multipart())
+
+        # worker들이 받은 요청을 마저 처리하고 ledger를 닫을 때까지 응답을 전달한다.
+        poller.unregister(self.socket)
+        while any(worker.is_alive() for worker in workers):
+            for sock, _ in poller.poll(100):
+                self.socket.send_multipart(sock.recv_multipart())
+        for backend in backends:
+            while backend.poll(0):
+                self.socket.send_multipart(backend.recv_multipart())
+            backend.close(linger=0)
+
+        self.close_ledgers()
+        if self.market_data is not None:
+            self.market_data.stop()
+        if self.change_feed is not None:
+            self.change_feed.stop()
+        if shutdown is not None:
+            envelope, req_codec = shutdown
+            self.socket.send_multipart([*envelope, req_codec.encode({'status': 'success',
+                                                                     'result': 'shutdown successful'})])
+        self.socket.close(linger=1000)
+
+    def _route_key(self, req):
+        """
+        ledger 요청은 (username, ledger_name) --> 같은 ledger는 session과 상관없이 항상 같은 worker에서 처리
+        """
+        params = req.get('params', {})
+        if 'ledger_name' in params:
+            return params.get('username'), params.get('ledger_name')
+        return params.get('username')
+
+    def _worker_index(self, key):
+        # hash()는 process마다 달라지므로 crc32로 고정된 worker를 고른다.
+        return zlib.crc32(repr(key).encode('utf-8')) % self.workers
+
+    def _worker(self, i):
+        socket = self.ctx.socket(zmq.PAIR)
+        socket.connect(f'inproc://ledger-worker-{id(self)}-{i}')
+        last_evict = time.monotonic()
+        while True:
+            if socket.poll(1000):
+                *envelope, payload = socket.recv_multipart()
+                req_codec = codec.detect(payload)
+                try:
+                    req = req_codec.decode(payload)
+                except:
+                    req = None
+                res = self.handle_request(req)
+                socket.send_multipart([*envelope, req_codec.encode(res)])
+            elif self.stopped.is_set() and not socket.poll(0):
+                break
+
+            # 요청마다가 아니라 evict_interval마다 정리한다. (ledgers_lock을 잡고 찾기 때문에)
+            now = time.monotonic()
+            if now - last_evict >= self.evict_interval:
+                last_evict = now
+                try:
+                    self.evict_ledgers(worker=i)
+                except:
+                    traceback.print_exc()
+
+        # shutdown: 이 worker의 ledger는 이 worker에서 닫는다. (처리 중인 요청과 겹치지 않는다)
+        self.close_ledgers(worker=i)
+        socket.close(linger=1000)
+
+    def register_request(self, req_type, handler, returns_result=True):
+        """
+        요청 type을 처리할 함수를 등록한다. (handler(**params))
+
+        returns_result: False라면 결과 대신 '<req_type> successful'을 응답한다.
+        """
+        self.requests[req_type] = (handler, returns_result)
+
+    def _register_requests(self):
+        for req_type in ('add_ledger', 'recover_ledgers', 'get_cash', 'get_orders', 'get_order',
+                         'get_archived_orders', 'init_order', 'register_order', 'get_positions', 'get_position',
+                         'get_strategy_pnl', 'get_exposure', 'get_pnl'):
+            self.register_request(req_type, getattr(self, req_type))
+        for req_type in ('close_ledger', 'close_session', 'update_cash', 'clean_orders', 'cancel_order', 'fill_order',
+                         'update_position'):
+            self.register_request(req_type, getattr(self, req_type), returns_result=False)
+        self.register_request('ping', lambda **params: 'pong')
+        self.register_request('hello', self.hello)
+        self.register_request('batch', self.batch)
+        self.register_request('get_stats', self.get_stats)
+
+    def handle_request(self, req):
+        """
+        요청(json string 혹은 dict) 하나를 처리하고 응답 dict를 리턴한다.
+        """
+        try:
+            if isinstance(req, str):
+                req = json.loads(req)
+
+            req_type = req['type']
+            if req_type not in self.requests:
+                return {'status': 'failed', 'result': 'no type field'}
+            return {'status': 'success', 'result': self._call(req_type, req.get('params', {}))}
+
+        except:
+            traceback.print_exc()
+            return {'status': 'error', 'result': 'wrong request format. type field is required.'}
+
+    def _call(self, req_type, params):
+        handler, returns_result = self.requests[req_type]
+        start = time.perf_counter()
+        try:
+            result = handler(**params)
+        except:
+            self._record(req_type, time.perf_counter() - start, error=True)
+            raise
+        self._record(req_type, time.perf_counter() - start)
+        return result if returns_result else f'{req_type} successful'
+
+    def _record(self, req_type, elapsed, error=False):
+        with self.stats_lock:
+            stats = self.stats.get(req_type)
+            if stats is None:
+                stats = self.stats[req_type] = {'count': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0}
+            stats['count'] += 1
+            stats['errors'] += error
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+
+    def hello(self, codecs=None, **kwargs):
+        """
+        codec 협상: client가 선호하는 순서대로 보낸 codecs 중 server가 지원하는 첫번째 codec
+        --> {'codec': 고른 codec 이름, 'codecs': server가 지원하는 codec 목록}
+        """
+        return {'codec': codec.negotiate(codecs), 'codecs': list(codec.CODECS)}
+
+    def get_stats(self, **kwargs):
+        """
+        요청 type별 처리 횟수 / 오류 수 / 평균, 최대 처리 시간 (초)
+        """
+        with self.stats_lock:
+            return {req_type: {**stats, 'avg_time': stats['total_time'] / stats['count']}
+                    for req_type, stats in self.stats.items()}
+
+    def batch(self, session_id, username, ledger_name, requests, **kwargs):
+        """
+        한 ledger에 대한 요청 여러개를 순서대로 처리하고 결과를 한번에 리턴한다. (network 왕복 한번)
+
+        requests: [{'type': ..., 'params': {...}}, ...] --> session_id / username / ledger_name은 batch의 값을 사용
+        ledger lock을 잡은 채로 실행하기 때문에 batch 사이에 다른 요청이 끼어들지 않는다.
+        중간에 실패하면 남은 요청은 실행하지 않는다. (이미 실행된 요청은 되돌리지 않음)
+        --> [{'status': ..., 'result': ...}, ...]
+        """
+        common = {'session_id': session_id, 'username': username, 'ledger_name': ledger_name}
+        ledger = self.get_ledger(**common)
+        results = []
+        with ledger.lock:
+            for req in requests:
+                req_type = req.get('type')
+                if req_type not in self.requests or req_type in self.BATCH_EXCLUDED:
+                    results.append({'status': 'failed', 'result': f'{req_type}는 batch로 처리할 수 없습니다.'})
+                    break
+                try:
+                    result = self._call(req_type, {**req.get('params', {}), **common})
+                except Exception as e:
+                    traceback.print_exc()
+                    results.append({'status': 'error', 'result': str(e)})
+                    break
+                results.append({'status': 'success', 'result': result})
+        return results
+
+    def _serialize_order(self, order: dict):
+        """
+        core에서는 시간을 정수 nanosecond로 관리하기 때문에 응답을 보낼 때 문자열로 변환한다.
+        """
+        if order is None:
+            return order
+        for field in Order.TIME_FIELDS:
+            if field in order:
+                order[field] = format_timestamp(order[field])
+        for fill in order.get('fill_history', []):
+            fill['timestamp'] = format_timestamp(fill['timestamp'])
+        return order
 
-            except:
-                traceback.print_exc()
-                self._send({'status': 'error', 'result': 'wrong request format. type field is required.'})
+    def _serialize_position(self, position: dict):
+        if 'position_open_date' in position:
+            position['position_open_date'] = format_date(position['position_open_date'])
+        return position
 
-    def add_ledger(self, session_id, username=None, ledger_name=None, **kwargs):
+    def add_ledger(self, session_id, username=None, ledger_name=None, durability=None, **kwargs):
         if ledger_name is None:
             ledger_name = str(uuid.uuid1())
-
-        if session_id not in self.ledgers:
-            self.ledgers[session_id] = {}
-
-        if ledger_name not in self.ledgers[session_id]:
-            self.ledgers[session_id][ledger_name] = Ledger(name=ledger_name,
-                                                           username=username,
-                                                           auto_save=True,
-                                                           db_save=False)
+        self.get_ledger(session_id, username, ledger_name, durability=durability)
         return ledger_name
 
-    def get_ledger(self, session_id, username, ledger_name, **kwargs):
-        self.add_ledger(session_id, username, ledger_name)
-        return self.ledgers[session_id][ledger_name]
+    def _create_ledger(self, username, ledger_name, durability=None):
+        return Ledger(name=ledger_name,
+                      username=username,
+                      auto_save=True,
+                      db_save=self.db_save,
+                      journal=True,
+                      checkpoint_interval=60,
+                      durability=durability or self.durability,
+                      init_ttl=self.init_ttl,
+                      archive=True,
+                      history_capacity=self.history_capacity)
+
+    def _attach(self, session_id, key):
+        """
+        메모리에 있는 ledger를 session에 연결하고 마지막 사용 시간을 갱신한다. (없으면 None)
+        """
+        with self.ledgers_lock:
+            ledger = self.ledgers.get(key)
+            if ledger is not None:
+                self._touch(session_id, key)
+            return ledger
+
+    def _touch(self, session_id, key):
+        self.ledgers.move_to_end(key)
+        self.last_access[key] = time.monotonic()
+        if session_id is not None:
+            self.sessions.setdefault(key, set()).add(session_id)
+            self.session_ledgers.setdefault(session_id, set()).add(key)
+            self.detached.discard(key)
+
+    def _register_ledger(self, session_id, username, ledger_name, ledger):
+        key = (username, ledger_name)
+        with self.ledgers_lock:
+            self.ledgers[key] = ledger
+            self._touch(session_id, key)
+        self.pnl.watch(key, ledger)
+        self.exposure.watch(key, ledger)
+        if self.change_feed is not None:
+            self.change_feed.watch(username, ledger_name, ledger)
+
+    def recover_ledgers(self, session_id, username, ledger_names=None, workers=4, chunk_size=2000, **kwargs):
+        """
+        유저의 ledger를 DB 기록으로 병렬 복구한다. (ledger_names가 없으면 DB에 있는 유저의 모든 ledger)
+
+        ledger별로 thread 하나씩 (최대 workers개) DB를 읽고 table을 만든다.
+        복구하는 thread는 ledger의 worker가 아니므로 복구가 끝날 때까지 ledger를 내리지 않도록 고정(pin)한다.
+        (ledger의 worker에서 들어온 요청은 Ledger lock에서 복구가 끝나기를 기다린다)
+        """
+        if not self.db_save:
+            raise Exception('DB에서 복구할 수 없습니다. (db_save가 활성화되어 있지 않음)')
+        if ledger_names is None:
+            ledger_names = list_ledgers_db(username)
+
+        def recover(ledger_name):
+            self.get_ledger(session_id, username, ledger_name).recover_db(chunk_size=chunk_size)
+
+        keys = [(username, ledger_name) for ledger_name in ledger_names]
+        self._pin(keys)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(ledger_names)))) as executor:
+                list(executor.map(recover, ledger_names))
+        finally:
+            self._unpin(keys)
+        return ledger_names
+
+    def _pin(self, keys):
+        with self.ledgers_lock:
+            for key in keys:
+                self.pinned[key] = self.pinned.get(key, 0) + 1
+
+    def _unpin(self, keys):
+        with self.ledgers_lock:
+            for key in keys:
+                self.pinned[key] -= 1
+                if not self.pinned[key]:
+                    del self.pinned[key]
+
+    def close_ledger(self, session_id, username, ledger_name, **kwargs):
+        """
+        ledger를 저장하고 메모리에서 내린다. (연결된 session과 상관없이, 다시 요청이 오면 디스크 상태에서 불러온다)
+        """
+        self._evict((username, ledger_name))
+
+    def close_session(self, session_id, **kwargs):
+        """
+        session을 사용하던 ledger에서 끊는다. 연결된 session이 없어진 ledger는 다음 정리 때 내린다.
+        """
+        with self.ledgers_lock:
+            for key in self.session_ledgers.pop(session_id, ()):
+                sessions = self.sessions.get(key)
+                if sessions is not None:
+                    sessions.discard(session_id)
+                    if not sessions:
+                        del self.sessions[key]
+                        self.detached.add(key)
+
+    def evict_ledgers(self, worker=None):
+        """
+        연결된 session이 없거나, idle_timeout 동안 요청이 없었거나, max_ledgers를 넘는 만큼 오래전에 사용한 ledger를 내린다.
+
+        worker: 이 worker에 배정된 ledger만 내린다. (ledger는 배정된 worker에서만 사용하므로 처리 중에 닫히지 않는다)
+                모든 worker가 같은 기준으로 고르기 때문에 전체로는 LRU 순서대로 내려간다.
+        recover_ledgers가 복구 중인 (pin된) ledger는 내리지 않는다.
+        --> 내린 ledger 수
+        """
+        def assigned(key):
+            return worker is None or self._worker_index(key) == worker
+
+        now = time.monotonic()
+        with self.ledgers_lock:
+            victims = [key for key in self.detached if assigned(key)]
+            excess = len(self.ledgers) - self.max_ledgers if self.max_ledgers is not None else 0
+            # ledgers는 마지막으로 사용한 순서이므로 오래된 쪽부터 보다가 내리지 않을 ledger를 만나면 멈춘다.
+            for i, key in enumerate(self.ledgers):
+                if key in self.pinned:
+                    excess += 1                 # 대신 다음으로 오래된 ledger를 내린다.
+                    continue
+                idle = self.idle_timeout is not None and now - self.last_access[key] > self.idle_timeout
+                if i >= excess and not idle:
+                    break
+                if assigned(key):
+                    victims.append(key)
+
+        evicted = 0
+        for key in victims:
+            evicted += self._evict(key)
+        return evicted
+
+    def close_ledgers(self, worker=None):
+        """
+        메모리에 있는 ledger를 모두 저장하고 내린다. (worker: 이 worker에 배정된 ledger만) --> 내린 ledger 수
+        """
+        with self.ledgers_lock:
+            keys = [key for key in self.ledgers if worker is None or self._worker_index(key) == worker]
+        closed = 0
+        for key in keys:
+            try:
+                closed += self._evict(key)
+            except:
+                traceback.print_exc()
+        return closed
+
+    def _evict(self, key):
+        with self.ledgers_lock:
+            if key in self.pinned:
+                return False
+            ledger = self.ledgers.pop(key, None)
+            self.last_access.pop(key, None)
+            self.detached.discard(key)
+            for session_id in self.sessions.pop(key, ()):
+                keys = self.session_ledgers.get(session_id)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.session_ledgers[session_id]
+        if ledger is None:
+            return False
+
+        username, ledger_name = key
+        self.pnl.unwatch(key)
+        self.exposure.unwatch(key)
+        if self.change_feed is not None:
+            self.change_feed.unwatch(username, ledger_name)
+        ledger.close()
+        return True
+
+    def get_ledger(self, session_id, username, ledger_name, durability=None, **kwargs):
+        key = (username, ledger_name)
+        ledger = self._attach(session_id, key)
+        if ledger is not None:
+            return ledger
+
+        # ledger를 불러오는 동안 다른 ledger를 막지 않도록 ledgers_lock 밖에서 만든다.
+        # 같은 ledger는 (worker와 recover_ledgers thread가 동시에 요청해도) 한 번만 불러온다.
+        with self.loading_cond:
+            while key in self.loading:
+                self.loading_cond.wait()
+            ledger = self._attach(session_id, key)
+            if ledger is not None:
+                return ledger
+            self.loading.add(key)
+        try:
+            ledger = self._create_ledger(username, ledger_name, durability)
+            self._register_ledger(session_id, username, ledger_name, ledger)
+        finally:
+            with self.loading_cond:
+                self.loading.discard(key)
+                self.loading_cond.notify_all()
+        return ledger
 
     def get_cash(self, session_id, username, ledger_name, strategy_name, quote=None, **kwargs):
         ledger = self.get_ledger(session_id, username, ledger_name)
@@ -134,10 +530,18 @@ class LedgerServer:
         ledger = self.get_ledger(session_id, username, ledger_name)
         ledger.update_cash(strategy_name=strategy_name, amount=amount, quote=quote)
 
-    def get_orders(self, session_id, username, ledger_name, strategy_name, **kwargs):
+    def get_orders(self, session_id, username, ledger_name, strategy_name, since_version=None, epoch=None,
+                   **kwargs):
+        """
+        since_version이 있다면 이전 응답 이후 바뀐 주문만 --> {'version', 'epoch', 'full', 'orders', 'removed'}
+        """
         ledger = self.get_ledger(session_id, username, ledger_name)
+        if since_version is not None:
+            changes = ledger.get_changes('orders', strategy_name, since_version=since_version, epoch=epoch)
+            changes['orders'] = [self._serialize_order(o.to_dict()) for o in changes.pop('entries')]
+            return changes
         orders = ledger.get_orders(strategy_name=strategy_name)
-        orders = [o.__dict__ for o in orders]
+        orders = [self._serialize_order(o.to_dict()) for o in orders]
         return orders
 
     def get_order(self, session_id, username, ledger_name, strategy_name, order_number, **kwargs):
@@ -145,7 +549,13 @@ class LedgerServer:
         order = ledger.get_order(strategy_name=strategy_name,
                                  order_number=order_number,
                                  format='dict')
-        return order
+        return self._serialize_order(order)
+
+    def get_archived_orders(self, session_id, username, ledger_name, strategy_name,
+                            symbol=None, day=None, table='orders', **kwargs):
+        ledger = self.get_ledger(session_id, username, ledger_name)
+        columns = ledger.get_archived_orders(strategy_name=strategy_name, symbol=symbol, day=day, table=table)
+        return {name: [v.item() if hasattr(v, 'item') else v for v in values] for name, values in columns.items()}
 
     def clean_orders(self, session_id, username, ledger_name, strategy_name, state, **kwargs):
         ledger = self.get_ledger(session_id, username, ledger_name)
@@ -177,15 +587,24 @@ class LedgerServer:
         ledger.cancel_order(strategy_name=strategy_name, order_number=order_number)
 
     def fill_order(self, session_id, username, ledger_name, strategy_name,
-                   order_number, price, quantity, position_amount=None, **kwargs):
+                   order_number, price, quantity, position_amount=None, fee=0.0, **kwargs):
         ledger = self.get_ledger(session_id, username, ledger_name)
         ledger.fill_order(strategy_name=strategy_name, order_number=order_number, price=price,
-                          quantity=quantity, position_amount=position_amount)
+                          quantity=quantity, position_amount=position_amount, fee=fee)
 
-    def get_positions(self, session_id, username, ledger_name, strategy_name, **kwargs):
+    def get_positions(self, session_id, username, ledger_name, strategy_name, since_version=None, epoch=None,
+                      **kwargs):
+        """
+        since_version이 있다면 이전 응답 이후 바뀐 포지션만 --> {'version', 'epoch', 'full', 'positions', 'removed'}
+        """
         ledger = self.get_ledger(session_id, username, ledger_name)
+        if since_version is not None:
+            changes = ledger.get_changes('positions', strategy_name, since_version=since_version, epoch=epoch)
+            changes['positions'] = {symbol: self._serialize_position(position.to_dict())
+                                    for symbol, position in changes.pop('entries').items()}
+            return changes
         positions = ledger.get_positions(strategy_name=strategy_name)
-        res = {symbol: position.__dict__ for symbol, position in positions.items()}
+        res = {symbol: self._serialize_position(position.to_dict()) for symbol, position in positions.items()}
         return res
 
     def get_position(self, session_id, username, ledger_name, strategy_name, symbol, **kwargs):
@@ -193,10 +612,28 @@ class LedgerServer:
         position = ledger.get_position(strategy_name=strategy_name,
                                        symbol=symbol,
                                        format='dict')
-        return position
+        return self._serialize_position(position)
+
+    def get_strategy_pnl(self, session_id, username, ledger_name, strategy_name, **kwargs):
+        ledger = self.get_ledger(session_id, username, ledger_name)
+        return ledger.get_strategy_pnl(strategy_name=strategy_name)
+
+    def get_exposure(self, username, scope='user', symbol=None, **kwargs):
+        """
+        scope: user (요청한 유저의 모든 ledger) / symbol (모든 유저의 symbol 종목) / global (전체)
+        """
+        if scope == 'symbol':
+            return self.exposure.get_symbol_exposure(symbol)
+        elif scope == 'global':
+            return self.exposure.get_total_exposure()
+        return self.exposure.get_user_exposure(username)
+
+    def get_pnl(self, session_id, username, ledger_name, strategy_name=None, **kwargs):
+        self.get_ledger(session_id, username, ledger_name)
+        return self.pnl.get_pnl((username, ledger_name), strategy_name=strategy_name)
 
     def update_position(self, session_id, username, ledger_name, strategy_name, symbol,
-                        side, price, quantity, position_amount=None, order_state=None, **kwargs):
+                        side, price, quantity, position_amount=None, order_state=None, fee=0.0, **kwargs):
         ledger = self.get_ledger(session_id, username, ledger_name)
         ledger.update_position(strategy_name=strategy_name,
                                symbol=symbol,
@@ -204,7 +641,8 @@ class LedgerServer:
                                price=price,
                                quantity=quantity,
                                position_amount=position_amount,
-                               order_state=order_state)
+                               order_state=order_state,
+                               fee=fee)
 
 if __name__ == '__main__':
     ls = LedgerServer()
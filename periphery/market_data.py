@@ -0,0 +1,69 @@
+import zmq
+import json
+import threading
+import traceback
+
+
+def parse_ticks(message):
+    """
+    시세 서버의 메세지(json)를 [(symbol, price), ...]로 변환한다.
+
+    메세지 하나에 tick 하나(dict) 혹은 여러개(list)가 올 수 있고, 종목코드는 symbol/code, 가격은 price/current_price 필드를 사용한다.
+    """
+    data = json.loads(message)
+    if isinstance(data, dict):
+        data = [data]
+
+    ticks = []
+    for tick in data:
+        symbol = tick.get('symbol', tick.get('code'))
+        price = tick.get('price', tick.get('current_price'))
+        if symbol is not None and price is not None:
+            ticks.append((symbol, float(price)))
+    return ticks
+
+
+class MarketDataFeed(threading.Thread):
+    """
+    main.py의 DATA 소켓과 같은 시세 stream을 SUB으로 받아서 PnLEngine에 넘겨주는 thread
+
+    받을 수 있는 메세지를 한번에 모두 읽어서 하나의 batch로 넘기고 (batch_size개까지),
+    새로운 시세가 없더라도 poll_interval마다 publish를 시도한다. (포지션만 바뀐 경우)
+    """
+
+    def __init__(self, engine, address='tcp://10.0.1.128:5567', parse=parse_ticks, batch_size=1000,
+                 poll_interval=0.1):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.address = address
+        self.parse = parse
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        ctx = zmq.Context.instance()
+        socket = ctx.socket(zmq.SUB)
+        socket.connect(self.address)
+        socket.setsockopt_string(zmq.SUBSCRIBE, '')
+
+        while not self.stopped.is_set():
+            try:
+                if socket.poll(int(self.poll_interval * 1000)):
+                    ticks = []
+                    for _ in range(self.batch_size):
+                        try:
+                            message = socket.recv_string(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        ticks.extend(self.parse(message))
+                    self.engine.on_ticks(ticks)
+                else:
+                    self.engine.publish()
+            except:
+                traceback.print_exc()
+
+        socket.close()
+
+    def stop(self):
+        self.stopped.set()
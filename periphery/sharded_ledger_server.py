@@ -0,0 +1,382 @@
+import os
+import zmq
+import json
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+import traceback
+import multiprocessing
+
+from core.order import Order
+from core.exposure import ExposureAggregator
+from core.id_generator import SnowflakeIdGenerator
+from core.ledger_db import list_ledgers_db
+from periphery.ledger_server import LedgerServer
+from periphery import codec
+
+
+def run_shard(shard_id, address, server_params):
+    """
+    shard process: 자신에게 배정된 ledger만 가지는 LedgerServer를 shard 주소에서 실행한다.
+
+    주문 id의 worker id로 shard 번호를 사용한다. (pid로 정하면 shard끼리 겹칠 수 있다)
+    """
+    Order.set_id_generator(SnowflakeIdGenerator(worker_id=shard_id))
+    LedgerServer(address=address, **server_params).start_server()
+
+
+def rendezvous_shard(key, shard_ids):
+    """
+    rendezvous (highest random weight) hashing --> shard 수가 바뀌어도 늘어나거나 빠진 shard의 ledger만 옮겨진다.
+    """
+    def weight(shard_id):
+        digest = hashlib.md5(f'{key[0]}/{key[1]}/{shard_id}'.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big')
+    return max(shard_ids, key=weight)
+
+
+class Shard:
+    """
+    router에서 본 shard process 하나
+
+    data: 요청/응답을 그대로 전달하는 DEALER socket (응답은 순서와 상관없이 도착)
+    control: router가 직접 보내고 응답을 기다리는 REQ socket (ledger 이동, exposure 합산 등)
+    """
+
+    def __init__(self, shard_id, ctx, address, server_params):
+        self.shard_id = shard_id
+        self.address = address
+        self.process = multiprocessing.get_context('spawn').Process(target=run_shard,
+                                                                    args=(shard_id, address, server_params),
+                                                                    daemon=True)
+        self.process.start()
+
+        self.ctx = ctx
+        self.data = ctx.socket(zmq.DEALER)
+        self.data.connect(address)
+        self.control = None
+        self.reset_control()
+
+        self.requests = 0
+        self.replies = 0
+
+    def reset_control(self):
+        """
+        control socket을 새로 만든다. (응답을 받지 못한 REQ socket은 다음 요청을 보낼 수 없다)
+
+        shard가 나중에 보내는 이전 요청의 응답은 닫힌 socket으로 가므로 버려진다.
+        """
+        if self.control is not None:
+            self.control.close(linger=0)
+        self.control = self.ctx.socket(zmq.REQ)
+        self.control.connect(self.address)
+
+    def send(self, req):
+        self.control.send_multipart([json.dumps(req).encode('utf-8')])
+
+    def recv(self, timeout=30000):
+        """
+        send()로 보낸 control 요청의 응답. timeout(ms) 안에 응답이 없으면 control socket을 새로 만들고 예외
+        """
+        if not self.control.poll(timeout):
+            self.reset_control()
+            raise Exception(f'shard {self.shard_id}가 응답하지 않습니다.')
+        return json.loads(self.control.recv_multipart()[-1])
+
+    def call(self, req, timeout=30000):
+        self.send(req)
+        return self.recv(timeout)
+
+    def shutdown(self):
+        """
+        shard에 종료를 요청한다. (shard는 받은 요청을 마저 처리하고 ledger를 모두 저장한 뒤에 응답하고 종료)
+        """
+        try:
+            self.control.send_multipart([json.dumps({'type': 'shutdown'}).encode('utf-8')], zmq.NOBLOCK)
+            return True
+        except zmq.ZMQError:
+            # 이전 control 요청이 응답 없이 끝난 경우 (REQ socket이 응답을 기다리는 상태)
+            return False
+
+    def stop(self, timeout=30, requested=False):
+        """
+        shard가 ledger를 저장하고 종료할 때까지 기다린다. 응답이 없거나 종료되지 않으면 terminate한다.
+
+        requested: shutdown()을 이미 보낸 경우 (여러 shard를 동시에 종료)
+        """
+        if (requested or self.shutdown()) and self.control.poll(timeout * 1000):
+            self.control.recv_multipart()
+            self.process.join(timeout)
+        if self.process.is_alive():
+            print(f'shard {self.shard_id}가 종료되지 않아 terminate합니다.')
+            self.process.terminate()
+            self.process.join()
+        self.data.close(linger=0)
+        self.control.close(linger=0)
+
+
+class ShardedLedgerServer:
+    """
+    ledger를 여러 LedgerServer process(shard)에 나눠서 처리하는 router (GIL을 process 수만큼 나눈다)
+
+    (username, ledger_name)을 rendezvous hashing으로 shard에 배정하고, shard는 자신의 ledger와
+    디스크 상태 / DB 기록을 모두 직접 관리한다. (router는 요청을 전달만 한다)
+
+    resize: shard 수를 바꾸면 주인이 바뀌는 ledger만 이전 shard에서 저장 후 내리고(close_ledger),
+            새 shard는 다음 요청에서 디스크 상태로 불러온다.
+    shard_stats: shard별 요청 수 / 처리 중인 요청 수 / 배정된 ledger 수
+    change_feed_address: shard들의 변경사항 feed를 XSUB로 모아서 이 주소의 XPUB로 내보낸다.
+    """
+
+    def __init__(self, shards=None, address='tcp://*:9999', **server_params):
+        """
+        shards: shard process 수 (기본: cpu 수)
+        server_params: 각 shard의 LedgerServer 설정 (durability, init_ttl, workers 등)
+        """
+        self.shard_dir = tempfile.mkdtemp(prefix='easy_ledger_shards_')
+        self.ctx = zmq.Context.instance()
+        self.socket = self.ctx.socket(zmq.ROUTER)
+        self.socket.bind(address)
+
+        self.feed_frontend = None
+        self.feed_backend = None
+        change_feed_address = server_params.pop('change_feed_address', None)
+        if change_feed_address is not None:
+            self.feed_frontend = self.ctx.socket(zmq.XPUB)
+            self.feed_frontend.bind(change_feed_address)
+            self.feed_backend = self.ctx.socket(zmq.XSUB)
+            self.feed_backend.bind(f'ipc://{self.shard_dir}/feed.ipc')
+            server_params = {**server_params, 'change_feed_address': f'ipc://{self.shard_dir}/feed.ipc',
+                             'change_feed_bind': False}
+        self.server_params = server_params
+
+        self.stopped = threading.Event()
+        self.serving = threading.Event()
+        self.shards = {}
+        self.owners = {}                        # (username, ledger_name) --> shard_id
+        self.resize(shards or os.cpu_count() or 1)
+
+    def _start_shard(self, shard_id):
+        address = f'ipc://{self.shard_dir}/shard-{shard_id}.ipc'
+        self.shards[shard_id] = Shard(shard_id, self.ctx, address, self.server_params)
+
+    def resize(self, shards):
+        """
+        shard 수를 바꾸고 주인이 바뀌는 ledger를 이전 shard에서 내린다.
+        """
+        if shards < 1:
+            raise Exception('shard는 1개 이상이어야 합니다.')
+        if shards > 1 << SnowflakeIdGenerator.WORKER_BITS:
+            raise Exception(f'shard는 {1 << SnowflakeIdGenerator.WORKER_BITS}개 이하여야 합니다. (주문 id의 worker id)')
+
+        for shard_id in range(len(self.shards), shards):
+            self._start_shard(shard_id)
+        shard_ids = list(range(shards))
+
+        moved = 0
+        for key, shard_id in list(self.owners.items()):
+            owner = rendezvous_shard(key, shard_ids)
+            if owner != shard_id:
+                self._release(key, shard_id)
+                self.owners[key] = owner
+                moved += 1
+
+        removed = [self.shards.pop(shard_id) for shard_id in range(shards, len(self.shards))]
+        self._stop_shards(removed)
+        return moved
+
+    def _release(self, key, shard_id):
+        # shard는 ledger를 (username, ledger_name)별로 하나만 가지므로 session과 상관없이 한번에 내린다.
+        username, ledger_name = key
+        self.shards[shard_id].call({'type': 'close_ledger',
+                                    'params': {'session_id': None,
+                                               'username': username,
+                                               'ledger_name': ledger_name}})
+
+    def _shard_for(self, username, ledger_name):
+        key = (username, ledger_name)
+        if key not in self.owners:
+            self.owners[key] = rendezvous_shard(key, list(self.shards))
+        return self.shards[self.owners[key]]
+
+    def start_server(self):
+        print(f'Starting sharded ledger server ({len(self.shards)} shards)')
+        self.serving.set()
+        try:
+            while not self.stopped.is_set():
+                poller = zmq.Poller()
+                poller.register(self.socket, zmq.POLLIN)
+                for shard in self.shards.values():
+                    poller.register(shard.data, zmq.POLLIN)
+                if self.feed_frontend is not None:
+                    poller.register(self.feed_frontend, zmq.POLLIN)
+                    poller.register(self.feed_backend, zmq.POLLIN)
+
+                for sock, _ in poller.poll(100):
+                    if sock is self.socket:
+                        self._dispatch(self.socket.recv_multipart())
+                    elif sock is self.feed_backend:
+                        self.feed_frontend.send_multipart(sock.recv_multipart())
+                    elif sock is self.feed_frontend:
+                        # 구독 요청을 shard들의 PUB socket으로 전달
+                        self.feed_backend.send_multipart(sock.recv_multipart())
+                    else:
+                        shard = next(shard for shard in self.shards.values() if shard.data is sock)
+                        shard.replies += 1
+                        self.socket.send_multipart(sock.recv_multipart())
+        finally:
+            self._shutdown()
+            self.serving.clear()
+
+    def _reply(self, envelope, res, req_codec=codec.JSON):
+        self.socket.send_multipart([*envelope, req_codec.encode(res)])
+
+    def _dispatch(self, frames):
+        """
+        router가 처리하는 요청도 요청과 같은 codec으로 응답한다. (shard와의 control 요청은 JSON)
+        """
+        *envelope, payload = frames
+        req_codec = codec.detect(payload)
+        reply = lambda res: self._reply(envelope, res, req_codec)
+        try:
+            req = req_codec.decode(payload)
+            req_type = req['type']
+            params = req.setdefault('params', {})
+
+            if req_type == 'ping':
+                reply({'status': 'success', 'result': 'pong'})
+
+            elif req_type == 'hello':
+                reply({'status': 'success', 'result': {'codec': codec.negotiate(params.get('codecs')),
+                                                       'codecs': list(codec.CODECS)}})
+
+            elif req_type == 'shutdown':
+                # shard 하나가 아니라 router와 모든 shard를 종료한다. (loop가 끝나면서 _shutdown)
+                reply({'status': 'success', 'result': 'shutdown successful'})
+                self.stopped.set()
+
+            elif req_type == 'shard_stats':
+                reply({'status': 'success', 'result': self.shard_stats()})
+
+            elif req_type == 'resize_shards':
+                moved = self.resize(params['shards'])
+                reply({'status': 'success', 'result': moved})
+
+            elif req_type == 'get_stats':
+                stats = {shard_id: shard.call(req)['result'] for shard_id, shard in self.shards.items()}
+                reply({'status': 'success', 'result': stats})
+
+            elif req_type == 'close_session':
+                # session의 ledger는 여러 shard에 있을 수 있다.
+                for shard in self.shards.values():
+                    shard.call(req)
+                reply({'status': 'success', 'result': 'close_session successful'})
+
+            elif req_type == 'get_exposure':
+                reply({'status': 'success', 'result': self.get_exposure(**params)})
+
+            elif req_type == 'recover_ledgers':
+                reply({'status': 'success', 'result': self.recover_ledgers(**params)})
+
+            else:
+                if req_type == 'add_ledger' and params.get('ledger_name') is None:
+                    # shard를 정하려면 ledger 이름이 필요하므로 router에서 만든다.
+                    params['ledger_name'] = str(uuid.uuid1())
+                    payload = req_codec.encode(req)
+
+                shard = self._shard_for(params.get('username'), params.get('ledger_name'))
+                shard.requests += 1
+                shard.data.send_multipart([*envelope, payload])
+        except:
+            traceback.print_exc()
+            reply({'status': 'error', 'result': 'wrong request format. type field is required.'})
+
+    def shard_stats(self):
+        ledgers = {}
+        for shard_id in self.owners.values():
+            ledgers[shard_id] = ledgers.get(shard_id, 0) + 1
+        return {shard_id: {'requests': shard.requests,
+                           'pending': shard.requests - shard.replies,
+                           'ledgers': ledgers.get(shard_id, 0),
+                           'alive': shard.process.is_alive()}
+                for shard_id, shard in self.shards.items()}
+
+    def get_exposure(self, username=None, scope='user', symbol=None, **kwargs):
+        """
+        exposure는 shard마다 자신의 ledger만 합산하므로 모든 shard의 결과를 다시 더한다.
+        """
+        res = dict.fromkeys(ExposureAggregator.FIELDS, 0.0)
+        for shard in self.shards.values():
+            shard_res = shard.call({'type': 'get_exposure',
+                                    'params': {'username': username, 'scope': scope, 'symbol': symbol}})
+            if shard_res['status'] != 'success':
+                raise Exception(f'shard {shard.shard_id}: {shard_res["result"]}')
+            for field in ExposureAggregator.FIELDS:
+                res[field] += shard_res['result'][field]
+        res['leverage'] = res['gross_notional'] / res['position_amount'] if res['position_amount'] else 0.0
+        return res
+
+    def recover_ledgers(self, session_id, username, ledger_names=None, timeout=600000, **kwargs):
+        """
+        ledger를 배정된 shard별로 나눠서 복구한다. (shard들이 동시에 복구)
+
+        timeout: shard별로 복구 응답을 기다리는 시간 (ms)
+        """
+        if ledger_names is None:
+            ledger_names = list_ledgers_db(username)
+
+        by_shard = {}
+        for ledger_name in ledger_names:
+            by_shard.setdefault(self._shard_for(username, ledger_name), []).append(ledger_name)
+
+        for shard, names in by_shard.items():
+            shard.send({'type': 'recover_ledgers',
+                        'params': {**kwargs, 'session_id': session_id, 'username': username, 'ledger_names': names}})
+
+        # 실패한 shard가 있어도 모든 shard의 응답을 받은 뒤에 알려준다. (REQ socket이 응답 대기 상태로 남지 않도록)
+        errors = []
+        for shard in by_shard:
+            try:
+                res = shard.recv(timeout)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            if res['status'] != 'success':
+                errors.append(f'shard {shard.shard_id}: {res["result"]}')
+        if errors:
+            raise Exception(', '.join(errors))
+        return ledger_names
+
+    def close(self):
+        """
+        socket은 router loop thread에서만 사용하므로 loop가 실행 중이라면 loop가 끝나면서 정리하도록 한다.
+        shard는 모두 ledger를 저장하고 내린 뒤에 종료된다. (응답하지 않는 shard만 terminate)
+        """
+        self.stopped.set()
+        if self.serving.is_set():
+            while self.serving.is_set():
+                self.stopped.wait(0.01)
+        else:
+            self._shutdown()
+
+    def _stop_shards(self, shards):
+        # 모든 shard에 먼저 종료를 요청해서 ledger 저장이 동시에 진행되도록 한다.
+        requested = [shard.shutdown() for shard in shards]
+        for shard, sent in zip(shards, requested):
+            shard.stop(requested=sent)
+
+    def _shutdown(self):
+        self._stop_shards(list(self.shards.values()))
+        self.shards = {}
+        self.socket.close(linger=1000)
+        if self.feed_frontend is not None:
+            self.feed_frontend.close(linger=0)
+            self.feed_backend.close(linger=0)
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    server = ShardedLedgerServer()
+    server.start_server()
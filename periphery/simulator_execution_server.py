@@ -3,6 +3,8 @@ import json
 import pika
 import traceback
 
+from periphery import codec
+
 
 class SimulatorExecutionServer:
     """
@@ -20,20 +22,29 @@ class SimulatorExecutionServer:
         self.channel = self.rabbit_queue.channel()
         self.channel.exchange_declare('ledger_exchange', exchange_type='topic')
 
-    def _send(self, res):
-        self.socket.send_string(json.dumps(res))
+    def _send(self, res, req_codec=codec.JSON):
+        self.socket.send(req_codec.encode(res))
 
     def start_server(self):
+        """
+        요청과 같은 codec으로 응답한다. (LedgerServer와 같은 hello 협상)
+        """
         print('Starting simulator execution server')
         while True:
-            req = self.socket.recv_string()
-            req = json.loads(req)
-            print(req)
+            payload = self.socket.recv()
+            req_codec = codec.detect(payload)
 
             try:
+                req = req_codec.decode(payload)
                 req_type = req['type']
 
-                if req_type == 'send_order':
+                if req_type == 'hello':
+                    self._send({'status': 'success',
+                                'result': {'codec': codec.negotiate(req.get('params', {}).get('codecs')),
+                                           'codecs': list(codec.CODECS)}}, req_codec)
+                    continue
+
+                elif req_type == 'send_order':
                     self.send_order(request=req)
 
                 elif req_type == 'cancel_order':
@@ -45,10 +56,10 @@ class SimulatorExecutionServer:
                 else:
                     pass
 
-                self._send({'status': 'success'})
+                self._send({'status': 'success'}, req_codec)
             except:
                 traceback.print_exc()
-                self._send({'status': 'failed'})
+                self._send({'status': 'failed'}, req_codec)
 
     def send_order(self, request):
         session_id = request['session_id']
@@ -1,11 +1,15 @@
 import zmq
-import json
 import uuid
 
+from periphery import codec
+
 
 class LedgerPluginClient:
 
-    def __init__(self, ledger_name, strategy_name):
+    def __init__(self, ledger_name, strategy_name, durability=None, codecs=('msgpack', 'json')):
+        """
+        codecs: 사용할 수 있는 요청/응답 encoding (선호하는 순서) --> 연결할 때 server와 협상 (hello)
+        """
         ctx = zmq.Context()
         self.socket = ctx.socket(zmq.REQ)
         self.socket.connect('tcp://localhost:9999')
@@ -14,6 +18,7 @@ class LedgerPluginClient:
         self.username = str(uuid.uuid1())
         self.ledger_name = ledger_name
         self.strategy_name = strategy_name
+        self.durability = durability
         self.req_common = {
             'session_id': self.session_id,
             'username': self.username,
@@ -21,12 +26,33 @@ class LedgerPluginClient:
             'strategy_name': self.strategy_name
         }
 
+        self.codec = codec.JSON
+        self._hello(codecs)
         self._add_ledger()
 
+    def subscribe_changes(self, address='tcp://localhost:9997', all_strategies=False):
+        """
+        LedgerServer의 변경사항 feed 구독 (recv()로 (topic, event, gap)을 받는다. gap이면 다시 조회)
+        """
+        from periphery.change_feed import ChangeFeedSubscriber
+
+        return ChangeFeedSubscriber(self.username, self.ledger_name,
+                                    strategy_name=None if all_strategies else self.strategy_name,
+                                    address=address)
+
     def _request(self, req):
-        self.socket.send_string(json.dumps(req))
-        res = self.socket.recv_string()
-        return json.loads(res)
+        self.socket.send(self.codec.encode(req))
+        return self.codec.decode(self.socket.recv())
+
+    def _hello(self, codecs):
+        """
+        협상은 JSON으로 보낸다. (hello를 모르는 이전 server라면 JSON을 그대로 사용)
+        """
+        res = self._request(self.build_request_object('hello', codecs=[name for name in codecs
+                                                                        if name in codec.CODECS]))
+        if res.get('status') == 'success':
+            self.codec = codec.CODECS.get(res['result']['codec'], codec.JSON)
+        return res
 
     def build_request_object(self, func_name, **params):
         return {
@@ -38,7 +64,31 @@ class LedgerPluginClient:
         }
 
     def _add_ledger(self):
-        req = self.build_request_object('add_ledger')
+        req = self.build_request_object('add_ledger', durability=self.durability)
+        return self._request(req)
+
+    def recover_ledgers(self, ledger_names=None, workers=4):
+        req = self.build_request_object('recover_ledgers', ledger_names=ledger_names, workers=workers)
+        return self._request(req)
+
+    def batch(self, requests):
+        """
+        requests: [(func_name, params), ...] --> 한번의 요청으로 순서대로 처리하고 결과 목록을 받는다.
+        """
+        req = self.build_request_object('batch',
+                                        requests=[{'type': func_name, 'params': {**self.req_common, **params}}
+                                                  for func_name, params in requests])
+        return self._request(req)
+
+    def close_session(self):
+        """
+        이 client의 session을 ledger에서 끊는다. (다른 session이 없으면 server가 ledger를 저장 후 내린다)
+        """
+        req = self.build_request_object('close_session')
+        return self._request(req)
+
+    def get_stats(self):
+        req = self.build_request_object('get_stats')
         return self._request(req)
 
     def get_cash(self, quote=None):
@@ -49,14 +99,18 @@ class LedgerPluginClient:
         req = self.build_request_object('update_cash', amount=amount, quote=quote)
         return self._request(req)
 
-    def get_orders(self):
-        req = self.build_request_object('get_orders')
+    def get_orders(self, since_version=None, epoch=None):
+        req = self.build_request_object('get_orders', since_version=since_version, epoch=epoch)
         return self._request(req)
 
     def get_order(self, order_number):
         req = self.build_request_object('get_order', order_number=order_number)
         return self._request(req)
 
+    def get_archived_orders(self, symbol=None, day=None, table='orders'):
+        req = self.build_request_object('get_archived_orders', symbol=symbol, day=day, table=table)
+        return self._request(req)
+
     def clean_orders(self, state):
         req = self.build_request_object('clean_orders', state=state)
         return self._request(req)
@@ -80,30 +134,44 @@ class LedgerPluginClient:
         req = self.build_request_object('cancel_order', order_number=order_number)
         return self._request(req)
 
-    def fill_order(self, order_number, price, quantity, position_amount=None):
+    def fill_order(self, order_number, price, quantity, position_amount=None, fee=0.0):
         req = self.build_request_object('fill_order',
                                         order_number=order_number,
                                         price=price,
                                         quantity=quantity,
-                                        position_amount=position_amount)
+                                        position_amount=position_amount,
+                                        fee=fee)
         return self._request(req)
 
-    def get_positions(self):
-        req = self.build_request_object('get_positions')
+    def get_positions(self, since_version=None, epoch=None):
+        req = self.build_request_object('get_positions', since_version=since_version, epoch=epoch)
         return self._request(req)
 
     def get_position(self, symbol):
         req = self.build_request_object('get_position', symbol=symbol)
         return self._request(req)
 
-    def update_position(self, symbol, side, price, quantity, position_amount=None, order_state=None):
+    def get_strategy_pnl(self):
+        req = self.build_request_object('get_strategy_pnl')
+        return self._request(req)
+
+    def get_exposure(self, scope='user', symbol=None):
+        req = self.build_request_object('get_exposure', scope=scope, symbol=symbol)
+        return self._request(req)
+
+    def get_pnl(self):
+        req = self.build_request_object('get_pnl')
+        return self._request(req)
+
+    def update_position(self, symbol, side, price, quantity, position_amount=None, order_state=None, fee=0.0):
         req = self.build_request_object('update_position',
                                         symbol=symbol,
                                         side=side,
                                         price=price,
                                         quantity=quantity,
                                         position_amount=position_amount,
-                                        order_state=order_state)
+                                        order_state=order_state,
+                                        fee=fee)
         return self._request(req)
 
 if __name__ == '__main__':
@@ -0,0 +1,75 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from core.ledger import Ledger
+from core.order import OrderState
+
+
+class OrderArchiveTest(TestCase):
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'HOME': self.home.name})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.home.cleanup()
+
+    def make_ledger(self):
+        return Ledger(name='ledger_1', username='user_1', auto_save=True, journal=True, archive=True)
+
+    def test_completed_orders_are_archived(self):
+        ledger = self.make_ledger()
+        for i, symbol in enumerate(['005930', '005930', '000660']):
+            order_hash = ledger.init_order('strategy_1', symbol, 100 + i, 2, 'BUY', 'LIMIT')
+            ledger.register_order(f'order_{i}', order_hash)
+            ledger.fill_order('strategy_1', f'order_{i}', 100, 1)
+            ledger.fill_order('strategy_1', f'order_{i}', 100, 1)
+
+        order_hash = ledger.init_order('strategy_1', '005930', 90, 1, 'BUY', 'LIMIT')
+        ledger.register_order('order_3', order_hash)
+        ledger.cancel_order('strategy_1', 'order_3')
+        self.assertEqual(ledger.get_orders('strategy_1'), [])
+        ledger.close()
+
+        ledger = self.make_ledger()
+        orders = ledger.get_archived_orders(strategy_name='strategy_1', symbol='005930')
+        self.assertEqual(list(orders['order_number']), ['order_0', 'order_1', 'order_3'])
+        self.assertEqual(list(orders['order_state']), [OrderState.FILLED, OrderState.FILLED, OrderState.CLOSED])
+
+        fills = ledger.get_archived_orders(strategy_name='strategy_1', symbol='005930', table='fills')
+        self.assertEqual(len(fills['timestamp']), 4)
+        self.assertEqual(sum(fills['quantity']), 4)
+        self.assertEqual(list(fills['price']), [100.0] * 4)
+
+        self.assertEqual(ledger.get_archived_orders(strategy_name='strategy_2')['init_id'], [])
+
+    def test_partial_flush_is_ignored(self):
+        ledger = self.make_ledger()
+        order_hash = ledger.init_order('strategy_1', '005930', 100, 1, 'BUY', 'LIMIT')
+        ledger.register_order('order_0', order_hash)
+        ledger.fill_order('strategy_1', 'order_0', 99, 1)
+        ledger.close()
+
+        # column 하나만 기록하고 종료된 상황
+        day = ledger.archive.days()[0]
+        partition = ledger.archive.path / 'orders' / day
+        with open(partition / 'init_id.bin', 'ab') as f:
+            f.write(b'\x00' * 8)
+        with open(partition / 'order_number.strings', 'a') as f:
+            f.write('"order_')
+
+        ledger = self.make_ledger()
+        orders = ledger.get_archived_orders(strategy_name='strategy_1', day=day)
+        self.assertEqual(list(orders['order_number']), ['order_0'])
+
+        order_hash = ledger.init_order('strategy_1', '005930', 100, 1, 'BUY', 'LIMIT')
+        ledger.register_order('order_1', order_hash)
+        ledger.cancel_order('strategy_1', 'order_1')
+        orders = ledger.get_archived_orders(strategy_name='strategy_1', day=day)
+        self.assertEqual(list(orders['order_number']), ['order_0', 'order_1'])
+        self.assertEqual(len(orders['init_id']), 2)
+        with open(partition / 'order_number.strings') as f:
+            self.assertEqual(f.read().splitlines(), ['"order_0"', '"order_1"'])
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import zmq
+
+from core.ledger import Ledger
+from periphery.change_feed import ChangeFeed, ChangeFeedSubscriber
+
+
+class ChangeFeedTest(TestCase):
+
+    def test_ledger_events_have_sequence_numbers(self):
+        with tempfile.TemporaryDirectory() as home, mock.patch.dict(os.environ, {'HOME': home}):
+            ledger = Ledger(name='ledger_1', username='user_1')
+            events = []
+            ledger.add_change_listener(events.append)
+
+            ledger.update_cash('strategy_1', 100.0)
+            order_hash = ledger.init_order('strategy_1', '005930', 100, 2, 'BUY', 'LIMIT')
+            ledger.register_order('order_1', order_hash)
+            ledger.fill_order('strategy_1', 'order_1', 100, 2)
+
+            # 체결이 끝난 주문은 table에서 정리되므로 order_removed가 먼저 나간다.
+            self.assertEqual([event['seq'] for event in events], list(range(1, 7)))
+            self.assertEqual([event['type'] for event in events],
+                             ['cash', 'order', 'order', 'order_removed', 'order', 'position'])
+            self.assertEqual(events[4]['data']['ORDER_STATE'], 'filled')
+            self.assertEqual(events[5]['data']['quantity'], 2)
+
+    def test_subscriber_detects_gaps(self):
+        with tempfile.TemporaryDirectory() as home, mock.patch.dict(os.environ, {'HOME': home}):
+            feed = ChangeFeed(address='tcp://127.0.0.1:*')
+            feed.start()
+            ledger = Ledger(name='ledger_1', username='user_1')
+            feed.watch('user_1', 'ledger_1', ledger)
+
+            address = feed.socket.getsockopt_string(zmq.LAST_ENDPOINT)
+            subscriber = ChangeFeedSubscriber('user_1', 'ledger_1', strategy_name='strategy_1', address=address)
+            # PUB/SUB 연결이 끝나기 전의 event는 버려진다. (slow joiner)
+            while subscriber.recv(timeout=50) is None:
+                ledger.update_cash('strategy_1', 1.0)
+            while subscriber.recv(timeout=50) is not None:
+                pass
+
+            ledger.update_cash('strategy_2', 2.0)
+            ledger.update_cash('strategy_1', 3.0)
+            topic, event, gap = subscriber.recv(timeout=1000)
+            self.assertEqual(topic, 'user_1/ledger_1/strategy_1')
+            self.assertEqual(event['data']['amount'], 3.0)
+            self.assertFalse(gap)
+
+            ledger.change_seq += 1
+            ledger.update_cash('strategy_1', 4.0)
+            self.assertTrue(subscriber.recv(timeout=1000)[2])
+
+            subscriber.close()
+            feed.stop()
@@ -0,0 +1,40 @@
+import unittest
+from unittest import TestCase
+
+from periphery import codec
+
+
+class CodecTest(TestCase):
+
+    def test_detect_json_with_leading_whitespace(self):
+        for payload in (b'{"type": "ping"}', b'\n{"type": "ping"}', b'\t\r\n [1]', b'  {}'):
+            self.assertIs(codec.detect(payload), codec.JSON)
+            self.assertIsNotNone(codec.JSON.decode(payload))
+
+    def test_json_sends_unsafe_integers_as_strings(self):
+        order_id = (1 << 62) + 1                # SnowflakeIdGenerator의 63bit id
+        obj = {'status': 'success', 'result': {'init_id': order_id, 'removed': [order_id, 3], 'quantity': 2,
+                                               'flag': True, 'limit': codec.MAX_SAFE_INTEGER}}
+        res = codec.JSON.decode(codec.JSON.encode(obj))['result']
+        self.assertEqual(res, {'init_id': str(order_id), 'removed': [str(order_id), 3], 'quantity': 2,
+                               'flag': True, 'limit': codec.MAX_SAFE_INTEGER})
+        self.assertEqual(codec.JSON.decode(codec.JSON.encode({'id': 7})), {'id': 7})
+
+    @unittest.skipUnless(codec.MSGPACK_AVAILABLE, 'msgpack이 설치되어 있지 않음')
+    def test_msgpack_keeps_integers(self):
+        order_id = (1 << 62) + 1
+        msgpack_codec = codec.CODECS['msgpack']
+        self.assertEqual(msgpack_codec.decode(msgpack_codec.encode({'init_id': order_id})), {'init_id': order_id})
+
+    @unittest.skipUnless(codec.MSGPACK_AVAILABLE, 'msgpack이 설치되어 있지 않음')
+    def test_msgpack_round_trip(self):
+        msgpack_codec = codec.CODECS['msgpack']
+        self.assertEqual(codec.negotiate(['msgpack', 'json']), 'msgpack')
+
+        obj = {'status': 'success', 'result': {'005930': {'price_history': [100.0, 101.5], 'quantity': -2.0,
+                                                          'side': 'SELL', 'meta': None}, 1: True}}
+        payload = msgpack_codec.encode(obj)
+        self.assertIs(codec.detect(payload), msgpack_codec)
+        self.assertEqual(msgpack_codec.decode(payload), obj)
+        # msgpack으로 변환할 수 없는 값은 str로 보낸다.
+        self.assertEqual(msgpack_codec.decode(msgpack_codec.encode({'value': object})), {'value': str(object)})
@@ -0,0 +1,81 @@
+import os
+import time
+import pickle
+import tempfile
+import threading
+from unittest import TestCase
+
+from core.db_writer import DBWriter
+
+
+class DBWriterTest(TestCase):
+
+    def test_batches_and_flush(self):
+        batches = []
+        gate = threading.Event()
+
+        def handler(events):
+            gate.wait()
+            batches.append(list(events))
+
+        writer = DBWriter(handler, max_queue=100, batch_size=10)
+        writer.start()
+        for i in range(25):
+            writer.put(i)
+        gate.set()
+        writer.flush()
+
+        self.assertEqual([event for batch in batches for event in batch], list(range(25)))
+        self.assertTrue(all(len(batch) <= 10 for batch in batches))
+        self.assertLess(len(batches), 25)
+
+        writer.close()
+        self.assertFalse(writer.is_alive())
+        self.assertRaises(Exception, writer.put, 0)
+
+    def test_backpressure(self):
+        gate = threading.Event()
+        writer = DBWriter(lambda events: gate.wait(), max_queue=1, batch_size=1, put_timeout=0.05)
+        writer.start()
+        writer.put(0)
+        while not writer.queue.empty():
+            time.sleep(0.01)
+        writer.put(1)
+        self.assertRaises(Exception, writer.put, 2)
+        gate.set()
+        writer.close()
+
+    def test_failed_batch_is_kept_and_reported(self):
+        written = []
+        available = threading.Event()
+
+        def handler(events):
+            if not available.is_set():
+                raise Exception('db error')
+            written.extend(events)
+
+        writer = DBWriter(handler, batch_size=10, retries=1, retry_interval=0)
+        writer.start()
+        writer.put(0)
+        writer.put(1)
+        self.assertRaises(Exception, writer.flush)
+        writer.flush()                  # 이미 알려준 실패는 다시 알리지 않는다.
+        self.assertEqual(written, [])
+        self.assertEqual(sorted(event for events in writer.failed for event in events), [0, 1])
+
+        available.set()
+        writer.retry_failed()
+        writer.close()
+        self.assertEqual(written, [0, 1])
+        self.assertEqual(writer.failed, [])
+
+    def test_dead_letter_file(self):
+        with tempfile.TemporaryDirectory() as path:
+            dead_letter_path = os.path.join(path, 'DBWriter.dead')
+            writer = DBWriter(lambda events: 1 / 0, retries=0, dead_letter_path=dead_letter_path)
+            writer.start()
+            writer.put('event')
+            self.assertRaises(Exception, writer.close)
+            self.assertFalse(writer.is_alive())
+            with open(dead_letter_path, 'rb') as f:
+                self.assertEqual(pickle.load(f), ['event'])
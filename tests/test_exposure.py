@@ -0,0 +1,39 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from core.ledger import Ledger
+from core.exposure import ExposureAggregator
+
+
+class ExposureAggregatorTest(TestCase):
+
+    def test_exposure_is_updated_by_position_deltas(self):
+        with tempfile.TemporaryDirectory() as home, mock.patch.dict(os.environ, {'HOME': home}):
+            ledger_1 = Ledger(name='ledger_1', username='user_1')
+            ledger_2 = Ledger(name='ledger_2', username='user_2')
+            ledger_1.update_position('strategy_1', '005930', 'BUY', 100, 2)
+
+            exposure = ExposureAggregator()
+            exposure.watch(('user_1', 'ledger_1'), ledger_1)
+            exposure.watch(('user_2', 'ledger_2'), ledger_2)
+
+            ledger_1.update_position('strategy_2', '005930', 'SELL', 110, -1)
+            ledger_2.update_position('strategy_1', '005930', 'BUY', 100, 3)
+            ledger_2.update_position('strategy_1', '000660', 'BUY', 50, 1, position_amount=25)
+
+            symbol = exposure.get_symbol_exposure('005930')
+            self.assertEqual(symbol['net_quantity'], 4.0)
+            self.assertEqual(symbol['net_notional'], 200 - 110 + 300)
+            self.assertEqual(symbol['gross_notional'], 200 + 110 + 300)
+
+            user = exposure.get_user_exposure('user_2')
+            self.assertEqual(user['gross_notional'], 350.0)
+            self.assertEqual(user['leverage'], 350.0 / 325.0)
+
+            ledger_2.update_position('strategy_1', '005930', 'SELL', 120, -3)
+            self.assertEqual(exposure.get_symbol_exposure('005930')['net_quantity'], 1.0)
+            self.assertEqual(exposure.get_total_exposure()['gross_notional'], 200 + 110 + 50)
+
+            exposure.unwatch(('user_1', 'ledger_1'))
+            self.assertEqual(exposure.get_total_exposure()['gross_notional'], 50.0)
@@ -0,0 +1,124 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from core.ledger import Ledger
+from core.order import OrderState
+from core.journal import Durability
+
+
+class JournalTest(TestCase):
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'HOME': self.home.name})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.home.cleanup()
+
+    def make_ledger(self):
+        return Ledger(name='ledger_1', username='user_1', auto_save=True, journal=True)
+
+    def trade(self, ledger):
+        ledger.update_cash('strategy_1', 1000, 'krw')
+        order_hash = ledger.init_order('strategy_1', '005930', 100, 2, 'BUY', 'LIMIT')
+        ledger.register_order('order_1', order_hash)
+        ledger.fill_order('strategy_1', 'order_1', 100, 1)
+        ledger.init_order('strategy_1', '005930', 90, 1, 'BUY', 'LIMIT')
+
+    def test_replay_restores_tables(self):
+        ledger = self.make_ledger()
+        self.trade(ledger)
+
+        restored = self.make_ledger()
+        self.assertEqual(restored.get_cash('strategy_1', 'krw'), 1000)
+        self.assertEqual(set(restored.order_table.order_table), set(ledger.order_table.order_table))
+        self.assertEqual(len(restored.order_table.order_meta), 1)
+
+        order = restored.get_order('strategy_1', 'order_1', format='object')
+        self.assertEqual(order.state, OrderState.OPEN)
+        self.assertEqual(order.orders_filled, 1)
+
+        position = restored.get_position('strategy_1', '005930', format='object')
+        self.assertEqual(position.quantity, 1)
+
+    def test_torn_tail_is_dropped(self):
+        ledger = self.make_ledger()
+        self.trade(ledger)
+        ledger.cash_table.journal.close()
+
+        path = ledger.cash_table.journal.path
+        valid_size = os.path.getsize(path)
+        with open(path, 'ab') as f:
+            f.write(b'\x80\x05garbage')
+
+        restored = self.make_ledger()
+        self.assertEqual(restored.get_cash('strategy_1', 'krw'), 1000)
+        self.assertEqual(os.path.getsize(path), valid_size)
+
+    def test_checkpoint_compacts_log(self):
+        ledger = self.make_ledger()
+        self.trade(ledger)
+        ledger.checkpoint()
+
+        self.assertEqual(ledger.pending_records(), 0)
+        self.assertFalse(os.path.exists(ledger.order_table.journal.path))
+
+        ledger.fill_order('strategy_1', 'order_1', 100, 1)
+        self.assertEqual(ledger.pending_records(), 3)
+
+        restored = self.make_ledger()
+        position = restored.get_position('strategy_1', '005930', format='object')
+        self.assertEqual(position.quantity, 2)
+        self.assertIsNone(restored.get_order('strategy_1', 'order_1'))
+        self.assertEqual(restored.get_cash('strategy_1', 'krw'), 1000)
+
+    def test_interrupted_checkpoint_keeps_rotated_log(self):
+        ledger = self.make_ledger()
+        self.trade(ledger)
+        ledger.checkpoint()
+        ledger.update_cash('strategy_1', 2000, 'krw')
+
+        # snapshot 저장 전에 종료된 상황: log만 rotate 되어 있다.
+        for name in ledger.TABLES:
+            getattr(ledger, name).journal.rotate()
+        ledger.update_cash('strategy_1', 3000, 'usd')
+
+        restored = self.make_ledger()
+        self.assertEqual(restored.get_cash('strategy_1'), {'krw': 2000, 'usd': 3000})
+
+    def test_grouped_durability_flushes_in_batches(self):
+        ledger = Ledger(name='ledger_1', username='user_1', auto_save=True, journal=True,
+                        durability=Durability.GROUPED, flush_interval=60 * 1000, flush_size=3)
+        journal = ledger.cash_table.journal
+
+        ledger.update_cash('strategy_1', 1000, 'krw')
+        ledger.update_cash('strategy_1', 2000, 'krw')
+        self.assertFalse(os.path.exists(journal.path))
+
+        ledger.update_cash('strategy_1', 3000, 'krw')
+        self.assertTrue(os.path.exists(journal.path))
+
+        ledger.update_cash('strategy_1', 4000, 'krw')
+        ledger.close()
+
+        restored = self.make_ledger()
+        self.assertEqual(restored.get_cash('strategy_1', 'krw'), 4000)
+
+    def test_fill_record_size_is_flat(self):
+        ledger = self.make_ledger()
+        journal = ledger.position_table.journal
+
+        sizes = []
+        for i in range(200):
+            size = os.path.getsize(journal.path) if os.path.exists(journal.path) else 0
+            ledger.update_position('strategy_1', '005930', 'BUY', 100 + i % 7, 1)
+            sizes.append(os.path.getsize(journal.path) - size)
+        self.assertLessEqual(max(sizes[100:]), max(sizes[:10]) + 16)
+
+        position = ledger.get_position('strategy_1', '005930', format='dict')
+        restored = self.make_ledger()
+        self.assertEqual(restored.get_position('strategy_1', '005930', format='dict'), position)
+        self.assertEqual(restored.get_strategy_pnl('strategy_1'), ledger.get_strategy_pnl('strategy_1'))
@@ -0,0 +1,90 @@
+import sys
+import time
+import pickle
+import subprocess
+from unittest import TestCase, mock
+
+from core.ledger import Ledger
+from core.order import OrderState
+from core.ledger_db import load_backend, fill_events
+
+
+class LedgerDBTest(TestCase):
+
+    def test_in_memory_ledger_does_not_load_backend(self):
+        code = ("import sys; from core.ledger import Ledger; Ledger(name='ledger_1', username='user_1'); "
+                "print(' '.join(m for m in ('django', 'numpy', 'core.django_backend') if m in sys.modules))")
+        res = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(res.stdout.strip(), '')
+
+    def test_unknown_backend(self):
+        self.assertIsNone(load_backend('core.no_such_backend'))
+
+
+class RecoverDBTest(TestCase):
+    """
+    Ledger가 DB에 기록하는 event를 메모리의 Order/Fill row로 모아서 recover_db로 복구한다.
+    """
+
+    def record(self, event, data):
+        if event == 'init_order':
+            self.orders[(data['strategy_name'], data['init_id'])] = dict(data)
+        elif event == 'update_order':
+            self.orders[(data['strategy_name'], data['init_id'])].update(data)
+        elif event == 'add_fill':
+            self.fills.append(data)
+
+    def db_fills(self):
+        keys = list(self.orders)
+        fills = []
+        for fill in self.fills:
+            key = (fill['strategy_name'], fill['init_id'])
+            order = self.orders[key]
+            fills.append((keys.index(key), order['strategy_name'], order['symbol'], order['side'][0],
+                          order['order_state'], fill['timestamp'], fill['price'], fill['quantity']))
+        fills.sort(key=lambda fill: (fill[0], fill[5]))
+        cancelled = [(order['strategy_name'], order['symbol'], order['side'][0], order['closed_time'])
+                     for order in self.orders.values() if order['order_state'] == OrderState.CLOSED]
+        return fill_events(fills, cancelled)
+
+    def test_recover_round_trip(self):
+        self.orders, self.fills = {}, []
+        ledger = Ledger(name='ledger_1', username='user_1', init_ttl=60)
+        ledger.db_save = True
+        with mock.patch.object(ledger, '_write', self.record):
+            for i, (side, price, quantity, filled) in enumerate([('BUY', 100, 3, 3), ('SELL', 110, 2, 2),
+                                                                 ('SELL', 105, 4, 1), ('BUY', 90, 1, 0)]):
+                order_hash = ledger.init_order('strategy_1', '005930', price, quantity, side, 'LIMIT')
+                ledger.register_order(f'order_{i}', order_hash)
+                if filled:
+                    time.sleep(0.002)   # DB timestamp는 ms 단위
+                    ledger.fill_order('strategy_1', f'order_{i}', price, filled if side == 'BUY' else -filled)
+            ledger.cancel_order('strategy_1', 'order_3')
+            ledger.init_order('strategy_1', '000660', 50, 1, 'BUY', 'LIMIT')
+        expected = ledger.get_position('strategy_1', '005930')
+
+        restored = Ledger(name='ledger_1', username='user_1', init_ttl=60)
+        restored.db_save = True
+        # load_orders_db: init/open 주문을 init_time 순서로 복구
+        orders = pickle.loads(pickle.dumps(sorted(ledger.order_table.order_table.values(), key=lambda o: o.init_time)))
+        with mock.patch.object(restored, 'load_orders_db', return_value=orders), \
+                mock.patch.object(restored, 'load_cash_db', return_value={}), \
+                mock.patch.object(restored, 'load_fills_db', return_value=self.db_fills()):
+            restored.recover_db()
+        restored.db_save = False
+
+        position = restored.get_position('strategy_1', '005930')
+        for field in ('side', 'quantity', 'average_price', 'quantity_history', 'price_history'):
+            self.assertEqual(position[field], expected[field], msg=field)
+
+        # 복구한 init 주문은 복구 시점이 아니라 init_time 기준으로 만료된다.
+        init_order, = [order for order in restored.order_table.order_table.values() if order.state == OrderState.INIT]
+        self.assertEqual([order for _, order in restored.order_table.init_queue], [init_order])
+        init_time = init_order.init_time / 1e9
+        self.assertEqual(restored.order_table.expire_init_orders(now=init_time + 30), [])
+        self.assertEqual(restored.order_table.expire_init_orders(now=init_time + 60), [init_order])
+        self.assertNotIn(init_order.init_id, restored.order_table.order_table)
+
+        # 복구한 open 주문은 이어서 체결할 수 있다.
+        restored.fill_order('strategy_1', 'order_2', 105, -3)
+        self.assertEqual(restored.get_position('strategy_1', '005930')['quantity'], expected['quantity'] - 3)
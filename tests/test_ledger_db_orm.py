@@ -0,0 +1,125 @@
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import TestCase, mock
+
+try:
+    """
+    Django가 있다면 in-memory sqlite DB에 migration을 적용하고 실제 ORM으로 LedgerDB 기록을 검증한다.
+    """
+    import django
+    from django.conf import settings
+
+    DJANGO_AVAILABLE = True
+except ImportError:
+    DJANGO_AVAILABLE = False
+
+
+def setup_django():
+    if not settings.configured:
+        # write-behind thread도 같은 DB를 보도록 (:memory:는 connection마다 따로) 임시 파일 사용
+        db_dir = tempfile.mkdtemp()
+        settings.configure(
+            INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes',
+                            'user.apps.UserConfig', 'db.apps.DbConfig'],
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(db_dir, 'db.sqlite3')}},
+            AUTH_USER_MODEL='user.User',
+            USE_TZ=True,
+        )
+        django.setup()
+        from django.core.management import call_command
+
+        call_command('migrate', verbosity=0)
+
+    from core.ledger_db import load_backend
+    return load_backend('django')
+
+
+@unittest.skipUnless(DJANGO_AVAILABLE, 'Django가 설치되어 있지 않음')
+class WriteBatchTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 다른 test에서 (settings 없이) 불러보고 캐시한 backend는 쓰지 않고, 끝나면 되돌린다.
+        cls.backends = mock.patch.dict('core.ledger_db._loaded_backends', clear=True)
+        cls.backends.start()
+        cls.backend = setup_django()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.backends.stop()
+
+    def setUp(self):
+        if self.backend is None:
+            self.skipTest('Django backend를 불러올 수 없음')
+        self.home = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'HOME': self.home.name})
+        self.env.start()
+        self.username = f'user_{self.id().rsplit(".", 1)[-1]}@example.com'
+        self.backend.User.objects.create(username=self.username, email=self.username)
+
+    def tearDown(self):
+        self.env.stop()
+        self.home.cleanup()
+
+    def make_ledger(self, **kwargs):
+        from core.ledger import Ledger
+
+        return Ledger(name='ledger_1', username=self.username, db_save=True, **kwargs)
+
+    def test_fill_of_order_created_in_earlier_batch(self):
+        ledger = self.make_ledger(db_write_behind=False)     # event 하나가 batch 하나
+        ledger.update_cash('strategy_1', 1000.0)
+        order_hash = ledger.init_order('strategy_1', '005930', 100, 2, 'BUY', 'LIMIT')
+        ledger.register_order('order_1', order_hash)
+        ledger.fill_order('strategy_1', 'order_1', 99, 1)
+        ledger.fill_order('strategy_1', 'order_1', 98, 1)
+        ledger.update_cash('strategy_1', 800.0)
+
+        Order, Fill, Cash = self.backend.Order, self.backend.Fill, self.backend.Cash
+        order = Order.objects.get(user=ledger.user, order_number='order_1')
+        self.assertEqual(order.order_state, 'filled')
+        self.assertEqual(order.orders_filled, 2)
+        self.assertEqual(list(Fill.objects.filter(order=order).order_by('id').values_list('price', 'quantity')),
+                         [(99.0, 1.0), (98.0, 1.0)])
+        self.assertEqual(list(Cash.objects.filter(ledger=ledger.db).values_list('amount', flat=True)), [800.0])
+        ledger.close()
+
+    def test_write_behind_batches(self):
+        ledger = self.make_ledger()
+        ledger.update_cash('strategy_1', 1000.0)
+        ledger.update_cash('strategy_2', 500.0)
+        order_hash = ledger.init_order('strategy_1', '005930', 100, 2, 'BUY', 'LIMIT')
+        ledger.register_order('order_1', order_hash)
+        ledger.flush_db()
+
+        # 이전 batch에서 만든 주문의 체결 + 새 주문 + 기존 / 새 cash row를 하나의 batch로 기록
+        ledger.fill_order('strategy_1', 'order_1', 99, 2)
+        ledger.init_order('strategy_1', '000660', 50, 1, 'SELL', 'LIMIT')
+        ledger.update_cash('strategy_1', 800.0)
+        ledger.update_cash('strategy_3', 10.0)
+        ledger.flush_db()
+
+        Order, Fill, Cash = self.backend.Order, self.backend.Fill, self.backend.Cash
+        order = Order.objects.get(user=ledger.user, order_number='order_1')
+        self.assertEqual((order.order_state, order.orders_filled, order.orders_remaining), ('filled', 2.0, 0.0))
+        self.assertEqual(order.symbol, '005930')           # 다른 field는 그대로
+        self.assertEqual(list(Fill.objects.filter(order=order).values_list('price', 'quantity')), [(99.0, 2.0)])
+        self.assertEqual(Order.objects.filter(user=ledger.user, symbol='000660', order_state='init').count(), 1)
+        cash = dict(Cash.objects.filter(ledger=ledger.db).values_list('strategy_name', 'amount'))
+        self.assertEqual(cash, {'strategy_1': 800.0, 'strategy_2': 500.0, 'strategy_3': 10.0})
+
+        recovered = ledger.load_fills_db()
+        self.assertEqual([fill[:5] for fill in recovered], [('strategy_1', '005930', 'BUY', 99.0, 2.0)])
+        ledger.close()
+
+    def test_unresolved_events_are_dead_lettered(self):
+        ledger = self.make_ledger()
+        ledger._write('add_fill', {'strategy_name': 'strategy_1', 'init_id': 'unknown', 'timestamp': None,
+                                   'quantity': 1.0, 'price': 100.0})
+        self.assertRaises(Exception, ledger.flush_db)
+        with open(ledger.db_writer.dead_letter_path, 'rb') as f:
+            events = pickle.load(f)
+        self.assertEqual([event for event, _ in events], ['add_fill'])
+        ledger.close()
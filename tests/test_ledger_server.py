@@ -0,0 +1,159 @@
+import os
+import json
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+import zmq
+
+from core.ledger import Ledger
+from periphery import codec
+from periphery.ledger_server import LedgerServer
+
+
+class LedgerServerTest(TestCase):
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'HOME': self.home.name})
+        self.env.start()
+        self.server = LedgerServer(address='tcp://127.0.0.1:*', workers=4)
+
+    def tearDown(self):
+        self.env.stop()
+        self.home.cleanup()
+
+    def test_handle_request(self):
+        self.assertEqual(self.server.handle_request({'type': 'ping'})['result'], 'pong')
+        self.assertEqual(self.server.handle_request('{"type": "unknown"}')['status'], 'failed')
+        self.assertEqual(self.server.handle_request('not json')['status'], 'error')
+
+    def test_batch(self):
+        common = {'session_id': 'session_1', 'username': 'user_1', 'ledger_name': 'ledger_1'}
+        res = self.server.handle_request({'type': 'batch', 'params': {**common, 'requests': [
+            {'type': 'update_cash', 'params': {'strategy_name': 'strategy_1', 'amount': 100.0}},
+            {'type': 'init_order', 'params': {'strategy_name': 'strategy_1', 'symbol': '005930', 'price': 100,
+                                              'quantity': 1, 'side': 'BUY', 'order_type': 'LIMIT'}},
+            {'type': 'get_cash', 'params': {'strategy_name': 'strategy_1'}},
+            {'type': 'get_order', 'params': {'strategy_name': 'strategy_1'}},
+            {'type': 'get_cash', 'params': {'strategy_name': 'strategy_1'}},
+        ]}})
+
+        results = res['result']
+        self.assertEqual([r['status'] for r in results], ['success', 'success', 'success', 'error'])
+        self.assertEqual(results[2]['result'], {'cash': 100.0})
+        stats = self.server.handle_request({'type': 'get_stats'})['result']
+        self.assertEqual(stats['get_cash']['count'], 1)
+        self.assertEqual(stats['get_order']['errors'], 1)
+
+    def test_router_replies_to_each_client(self):
+        threading.Thread(target=self.server.start_server, daemon=True).start()
+        address = self.server.socket.getsockopt_string(zmq.LAST_ENDPOINT)
+
+        socket = zmq.Context.instance().socket(zmq.DEALER)
+        socket.connect(address)
+        for i in range(8):
+            req = {'type': 'add_ledger', 'params': {'session_id': f'session_{i}', 'username': 'user_1',
+                                                    'ledger_name': f'ledger_{i}'}}
+            socket.send_multipart([b'', json.dumps(req).encode('utf-8')])
+
+        self.assertTrue(socket.poll(5000))
+        results = sorted(json.loads(socket.recv_multipart()[-1])['result'] for _ in range(8))
+        self.assertEqual(results, [f'ledger_{i}' for i in range(8)])
+        socket.close()
+
+    def test_codec_negotiation(self):
+        res = self.server.handle_request({'type': 'hello', 'params': {'codecs': ['unknown', 'json']}})
+        self.assertEqual(res['result']['codec'], 'json')
+        self.assertEqual(self.server.handle_request({'type': 'hello'})['result']['codec'], 'json')
+
+        threading.Thread(target=self.server.start_server, daemon=True).start()
+        socket = zmq.Context.instance().socket(zmq.DEALER)
+        socket.connect(self.server.socket.getsockopt_string(zmq.LAST_ENDPOINT))
+
+        # 협상한 codec으로 보낸 요청은 같은 codec으로 응답한다.
+        res = self.server.handle_request({'type': 'hello', 'params': {'codecs': ['msgpack', 'json']}})
+        req_codec = codec.CODECS[res['result']['codec']]
+        socket.send_multipart([b'', req_codec.encode({'type': 'ping'})])
+        self.assertTrue(socket.poll(5000))
+        payload = socket.recv_multipart()[-1]
+        self.assertIs(codec.detect(payload), req_codec)
+        self.assertEqual(req_codec.decode(payload)['result'], 'pong')
+        socket.close()
+
+    def test_shutdown_closes_ledgers(self):
+        thread = threading.Thread(target=self.server.start_server, daemon=True)
+        thread.start()
+        socket = zmq.Context.instance().socket(zmq.DEALER)
+        socket.connect(self.server.socket.getsockopt_string(zmq.LAST_ENDPOINT))
+
+        for i in range(4):
+            req = {'type': 'update_cash', 'params': {'session_id': 'session_1', 'username': 'user_1',
+                                                     'ledger_name': f'ledger_{i}', 'strategy_name': 'strategy_1',
+                                                     'amount': float(i)}}
+            socket.send_multipart([b'', json.dumps(req).encode('utf-8')])
+        socket.send_multipart([b'', json.dumps({'type': 'shutdown'}).encode('utf-8')])
+
+        # shutdown 이전에 보낸 요청은 모두 처리되고 shutdown 응답이 마지막에 온다.
+        results = []
+        while len(results) < 5:
+            self.assertTrue(socket.poll(5000))
+            results.append(json.loads(socket.recv_multipart()[-1])['result'])
+        self.assertEqual(results[-1], 'shutdown successful')
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(self.server.ledgers), 0)
+        for i in range(4):
+            self.assertTrue(os.path.exists(os.path.join(self.home.name, 'easy_ledger', 'user_1', f'ledger_{i}',
+                                                        'Ledger.pkl')))
+        socket.close()
+
+    def test_ledgers_shared_and_evicted(self):
+        self.server.max_ledgers = 2
+        common = {'username': 'user_1', 'ledger_name': 'ledger_1', 'strategy_name': 'strategy_1'}
+        self.server.handle_request({'type': 'update_cash', 'params': {**common, 'session_id': 'session_1',
+                                                                      'amount': 100.0}})
+        # 재접속한 session도 같은 ledger를 사용한다.
+        res = self.server.handle_request({'type': 'get_cash', 'params': {**common, 'session_id': 'session_2'}})
+        self.assertEqual(res['result'], {'cash': 100.0})
+        self.assertEqual(len(self.server.ledgers), 1)
+        self.assertEqual(self.server.sessions[('user_1', 'ledger_1')], {'session_1', 'session_2'})
+
+        self.server.handle_request({'type': 'close_session', 'params': {'session_id': 'session_1'}})
+        self.assertEqual(self.server.evict_ledgers(), 0)
+        self.server.handle_request({'type': 'close_session', 'params': {'session_id': 'session_2'}})
+        self.assertEqual(self.server.evict_ledgers(), 1)
+        self.assertEqual(self.server.ledgers, {})
+        self.assertEqual(self.server.session_ledgers, {})
+
+        # LRU: max_ledgers를 넘으면 가장 오래전에 사용한 ledger부터 내린다.
+        for ledger_name in ('ledger_1', 'ledger_2', 'ledger_1', 'ledger_3'):
+            self.server.handle_request({'type': 'get_cash', 'params': {**common, 'session_id': 'session_3',
+                                                                       'ledger_name': ledger_name}})
+        self.assertEqual(self.server.evict_ledgers(), 1)
+        self.assertEqual(list(self.server.ledgers), [('user_1', 'ledger_1'), ('user_1', 'ledger_3')])
+
+        # 내린 ledger는 다음 요청에서 디스크 상태로 다시 불러온다.
+        res = self.server.handle_request({'type': 'get_cash', 'params': {**common, 'session_id': 'session_3'}})
+        self.assertEqual(res['result'], {'cash': 100.0})
+
+    @mock.patch.dict('core.ledger_db._loaded_backends', {'django': None})     # DB 없이 파일로만 복구
+    def test_recovering_ledgers_are_not_evicted(self):
+        self.server.db_save = True
+        self.server.max_ledgers = 0
+        common = {'session_id': 'session_1', 'username': 'user_1'}
+        self.server.handle_request({'type': 'update_cash', 'params': {**common, 'ledger_name': 'ledger_1',
+                                                                      'strategy_name': 'strategy_1', 'amount': 1.0}})
+        evicted = []
+
+        def recover_db(ledger, chunk_size=2000):
+            # 복구 도중에 worker가 ledger를 정리해도 복구 중인 ledger는 내리지 않는다.
+            evicted.append(self.server.evict_ledgers())
+            self.assertIs(self.server.ledgers[('user_1', ledger.name)], ledger)
+
+        with mock.patch.object(Ledger, 'recover_db', recover_db):
+            res = self.server.handle_request({'type': 'recover_ledgers',
+                                              'params': {**common, 'ledger_names': ['ledger_1', 'ledger_2']}})
+        self.assertEqual(res['result'], ['ledger_1', 'ledger_2'])
+        self.assertEqual(evicted, [0, 0])
+        self.assertEqual(self.server.evict_ledgers(), 2)
@@ -1,6 +1,7 @@
 from unittest import TestCase
 
 from core.order import Order, OrderState
+from core.id_generator import HashIdGenerator, SnowflakeIdGenerator
 
 
 class OrderTest(TestCase):
@@ -22,4 +23,47 @@ class OrderTest(TestCase):
                       order_type=order_type,
                       meta=meta)
 
-        self.assertTrue(order.ORDER_STATE == OrderState.INIT)
\ No newline at end of file
+        self.assertTrue(order.ORDER_STATE == OrderState.INIT)
+
+    def test_state_ids_are_unique(self):
+        order = Order('strategy_1', '005930', 50000, 2, 'BUY', 'LIMIT')
+        order.make_open_order('order_1')
+        order.fill_order(2)
+
+        ids = [order.init_id, order.open_id, order.filled_id]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(ids, sorted(ids))
+
+    def test_worker_ids_do_not_collide(self):
+        generators = [SnowflakeIdGenerator(worker_id=shard_id) for shard_id in range(4)]
+        ids = [generator() for generator in generators for _ in range(100)]
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_hash_ids_in_audit_mode(self):
+        self.addCleanup(Order.set_id_generator, Order.ID_GENERATOR)
+        Order.set_id_generator(HashIdGenerator())
+        order = Order('strategy_1', '005930', 50000, 2, 'BUY', 'LIMIT', meta={'exchange': object()})
+
+        self.assertEqual(len(order.init_id), 40)
+
+    def test_timestamps_are_epoch_ns(self):
+        order = Order('strategy_1', '005930', 50000, 2, 'BUY', 'LIMIT')
+        order.make_open_order('order_1')
+        order.fill_order(1)
+        order.fill_order(1)
+
+        timestamps = [order.init_time, order.open_time] + [fill['timestamp'] for fill in order.fill_history]
+        self.assertTrue(all(isinstance(timestamp, int) for timestamp in timestamps))
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertGreaterEqual(order.filled_time, timestamps[-1])
+
+    def test_legacy_string_timestamps_are_parsed(self):
+        order = Order.__new__(Order)
+        order.__setstate__({'ORDER_STATE': OrderState.OPEN, 'price': 100, 'init_time': '20210401090000123',
+                            'open_time': '20210401090001000', 'closed_time': None,
+                            'fill_history': [{'timestamp': '20210401090002500', 'quantity': 1}]})
+
+        self.assertEqual([type(order.init_time), type(order.open_time)], [int, int])
+        self.assertIsNone(order.closed_time)
+        self.assertEqual(order.init_time % 1_000_000_000, 123_000_000)
+        self.assertLess(order.open_time, order.fill_timestamps[0])
@@ -0,0 +1,140 @@
+import os
+import time
+import tempfile
+from unittest import TestCase, mock
+
+from core.order import Order, OrderState
+from core.order_table import OrderTable
+from core.ledger import Ledger
+from core.journal import Durability
+
+
+class OrderTableTest(TestCase):
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'HOME': self.home.name})
+        self.env.start()
+        self.table = OrderTable(user_name='user_1', ledger_name='ledger_1')
+
+    def tearDown(self):
+        self.env.stop()
+        self.home.cleanup()
+
+    def open_order(self, strategy_name, symbol, order_number, quantity=2):
+        order = Order(strategy_name, symbol, 100, quantity, 'BUY', 'LIMIT')
+        self.table.add_order(order)
+        return self.table.make_open_order(order.hash, order_number)
+
+    def assert_indexes_consistent(self):
+        table = self.table
+        expected = OrderTable.__new__(OrderTable)
+        expected.order_table = table.order_table
+        expected.order_meta = table.order_meta
+        expected.init_ttl = None
+        expected._build_indexes()
+        self.assertEqual(table.number_index, expected.number_index)
+        self.assertEqual(table.strategy_index, expected.strategy_index)
+        self.assertEqual(table.state_index, expected.state_index)
+
+    def test_fill_and_cancel_use_indexes(self):
+        for i in range(10):
+            self.open_order(f'strategy_{i % 2}', f'{i:06d}', f'order_{i}')
+        self.table.add_order(Order('strategy_0', '005930', 100, 1, 'BUY', 'LIMIT'))
+        self.assert_indexes_consistent()
+
+        order = self.table.fill_order('strategy_0', 'order_0', 1, return_order=True)
+        self.assertEqual(order.orders_remaining, 1)
+        self.assert_indexes_consistent()
+
+        order = self.table.fill_order('strategy_0', 'order_0', 1, return_order=True)
+        self.assertEqual(order.state, OrderState.FILLED)
+        self.assertNotIn(order.init_id, self.table.order_table)
+        self.assert_indexes_consistent()
+
+        self.assertIsNone(self.table.fill_order('strategy_1', 'order_0', 1, return_order=True))
+
+        cancelled = self.table.remove_order('order_1')
+        self.assertEqual([o.state for o in cancelled], [OrderState.CLOSED])
+        self.assertIsNone(self.table.get_order('strategy_1', 'order_1'))
+        self.assert_indexes_consistent()
+
+        self.assertEqual(len(self.table.get_orders('strategy_0')), 5)
+        self.assertEqual(len(self.table.get_orders('strategy_0', [OrderState.INIT])), 1)
+
+        self.table.clean_open_orders('strategy_0')
+        self.assertEqual(len(self.table.get_orders('strategy_0')), 1)
+        self.table.clean_init_orders()
+        self.assertEqual(self.table.get_orders('strategy_0'), [])
+        self.assert_indexes_consistent()
+
+    def test_equal_orders_are_matched_fifo(self):
+        first = Order('strategy_1', '005930', 100, 1, 'BUY', 'LIMIT')
+        second = Order('strategy_2', '005930', 100, 1, 'BUY', 'LIMIT')
+        self.table.add_order(first)
+        self.table.add_order(second)
+        self.assertEqual(self.table.pending_init_count(first.hash), 2)
+
+        self.assertIs(self.table.make_open_order(first.hash, 'order_1'), first)
+        self.assertIs(self.table.make_open_order(first.hash, 'order_2'), second)
+        self.assertEqual(self.table.pending_init_counts(), {})
+
+    def test_stale_init_orders_expire(self):
+        self.table.init_ttl = 10
+        stale = Order('strategy_1', '005930', 100, 1, 'BUY', 'LIMIT')
+        self.table.add_order(stale)
+        opened = self.open_order('strategy_1', '000660', 'order_1')
+        fresh = Order('strategy_1', '005930', 100, 1, 'BUY', 'LIMIT')
+        self.table.add_order(fresh)
+
+        now = self.table.init_queue[-1][0]
+        self.table.init_queue[0] = (now - 60, stale)
+        self.table.init_queue[1] = (now - 60, opened)
+
+        expired = self.table.expire_init_orders(now=now)
+        self.assertEqual(expired, [stale])
+        self.assertNotIn(stale.init_id, self.table.order_table)
+        self.assertIn(opened.init_id, self.table.order_table)
+        self.assertEqual(self.table.pending_init_counts(), {fresh.hash: 1})
+        self.assert_indexes_consistent()
+
+    def test_init_orders_expire_without_new_orders(self):
+        ledger = Ledger(name='ledger_1', username='user_1', auto_save=True, journal=True,
+                        durability=Durability.GROUPED, flush_interval=10, init_ttl=0.05)
+        ledger.init_order('strategy_1', '005930', 100, 1, 'BUY', 'LIMIT')
+        for _ in range(100):
+            if not ledger.get_orders('strategy_1'):
+                break
+            time.sleep(0.02)
+        self.assertEqual(ledger.get_orders('strategy_1'), [])
+        ledger.close()
+
+    def test_replayed_init_orders_expire_from_init_time(self):
+        stale = Order('strategy_1', '005930', 100, 1, 'BUY', 'LIMIT')
+        stale.init_time -= 60 * 10 ** 9        # 60초 전에 들어온 주문
+        fresh = Order('strategy_1', '000660', 100, 1, 'BUY', 'LIMIT')
+        table = OrderTable(user_name='user_1', ledger_name='ledger_3', auto_save=True, journal=True)
+        table.add_order(stale)
+        table.add_order(fresh)
+        table.flush()
+
+        # journal을 replay한 시점이 아니라 주문의 init_time부터 init_ttl을 계산한다.
+        restored = OrderTable(user_name='user_1', ledger_name='ledger_3', auto_save=True, journal=True, init_ttl=10)
+        self.assertEqual([order.init_id for order in restored.expire_init_orders()], [stale.init_id])
+        self.assertEqual(restored.pending_init_counts(), {fresh.hash: 1})
+
+    def test_load_orders_is_journaled(self):
+        open_order = Order('strategy_0', '005930', 100, 2, 'BUY', 'LIMIT')
+        open_order.make_open_order('order_0')
+        open_order.fill_order(1)
+        first, second = Order('strategy_0', '000660', 100, 1, 'BUY', 'LIMIT'), \
+            Order('strategy_1', '000660', 100, 1, 'BUY', 'LIMIT')
+
+        table = OrderTable(user_name='user_1', ledger_name='ledger_2', auto_save=True, journal=True)
+        table.load_orders([open_order, first, second])
+        table.flush()
+
+        restored = OrderTable(user_name='user_1', ledger_name='ledger_2', auto_save=True, journal=True)
+        self.assertEqual(restored.pending_init_count(first.hash), 2)
+        self.assertEqual(restored.make_open_order(first.hash, 'order_1').strategy_name, 'strategy_0')
+        self.assertEqual(restored.get_order('strategy_0', 'order_0').orders_remaining, 1)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from core.ledger import Ledger
+from core.pnl import PnLEngine
+
+
+class PnLEngineTest(TestCase):
+
+    def test_unrealized_pnl_follows_positions_and_ticks(self):
+        with tempfile.TemporaryDirectory() as home, mock.patch.dict(os.environ, {'HOME': home}):
+            ledger = Ledger(name='ledger_1', username='user_1')
+            ledger.update_position('strategy_1', '005930', 'BUY', 100, 2)
+            ledger.update_position('strategy_2', '005930', 'SELL', 100, -1)
+
+            engine = PnLEngine(publish_rate=None)
+            engine.watch(('user_1', 'ledger_1'), ledger)
+            ledger.update_position('strategy_1', '000660', 'BUY', 50, 1)
+
+            engine.on_ticks([('005930', 110.0), ('000660', 40.0)])
+            pnl = engine.get_pnl(('user_1', 'ledger_1'))
+            self.assertEqual(pnl['positions']['strategy_1']['005930']['unrealized_pnl'], 20.0)
+            self.assertEqual(pnl['positions']['strategy_2']['005930']['unrealized_pnl'], -10.0)
+            self.assertEqual(pnl['positions']['strategy_1']['000660']['unrealized_pnl'], -10.0)
+            self.assertEqual(pnl['total'], 0.0)
+
+            ledger.update_position('strategy_1', '005930', 'BUY', 110, -2)
+            engine.publish()
+            pnl = engine.get_pnl(('user_1', 'ledger_1'), strategy_name='strategy_1')
+            self.assertEqual(pnl['positions']['strategy_1']['005930']['unrealized_pnl'], 0.0)
+            self.assertNotIn('strategy_2', pnl['positions'])
+
+    def test_publish_is_throttled(self):
+        engine = PnLEngine(publish_rate=0.001)
+        engine.on_ticks([('005930', 110.0)])
+        engine.on_ticks([('005930', 120.0)])
+        self.assertFalse(engine.publish())
+        self.assertTrue(engine.publish(force=True))
+
+    def test_unwatched_rows_are_reused(self):
+        with tempfile.TemporaryDirectory() as home, mock.patch.dict(os.environ, {'HOME': home}):
+            engine = PnLEngine(publish_rate=None)
+            for i in range(5):
+                ledger = Ledger(name=f'ledger_{i}', username='user_1')
+                ledger.update_position('strategy_1', '005930', 'BUY', 100, 1)
+                ledger.update_position('strategy_1', '000660', 'BUY', 50, 1)
+                engine.watch(('user_1', ledger.name), ledger)
+                engine.unwatch(('user_1', ledger.name))
+
+            self.assertEqual(len(engine.quantity), 2)
+            self.assertEqual(engine.listeners, {})
+            engine.watch(('user_1', 'ledger_0'), ledger)
+            engine.on_ticks([('005930', 110.0), ('000660', 40.0)])
+            self.assertEqual(len(engine.quantity), 2)
+            pnl = engine.get_pnl(('user_1', 'ledger_0'))['positions']['strategy_1']
+            self.assertEqual(pnl['005930']['unrealized_pnl'], 10.0)
+            self.assertEqual(pnl['000660']['unrealized_pnl'], -10.0)
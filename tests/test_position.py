@@ -0,0 +1,95 @@
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+
+from core.order import OrderState
+from core.position import Position, PositionState
+
+
+class PositionTest(TestCase):
+
+    def test_counters_and_dict_view(self):
+        position = Position('strategy_1', '005930')
+        position.open_position(side='BUY', price=100, quantity=2, order_state=OrderState.FILLED)
+        position.update_position(price=110, quantity=1)
+        position.update_position(price=120, quantity=-1, order_state=OrderState.FILLED)
+
+        self.assertEqual(position.position_enter_cnt, 2)
+        self.assertEqual(position.position_exit_cnt, 1)
+        self.assertEqual(position.fill_cnt, 2)
+
+        res = position.to_dict()
+        self.assertEqual(res['trade_history'], ['ENTER', 'ENTER', 'EXIT'])
+        self.assertEqual(res['fill_history'], [True, False, True])
+        self.assertEqual(res['quantity'], 2)
+        self.assertNotIn('_enter_cnt', res)
+
+    def test_restores_legacy_dict_state(self):
+        position = Position.__new__(Position)
+        position.__setstate__({
+            'POSITION_STATE': PositionState.OPEN,
+            'strategy_name': 'strategy_1',
+            'symbol': '005930',
+            'quote': None,
+            'meta': None,
+            'side': 'SELL',
+            'average_price': 100.0,
+            'quantity': -2.0,
+            'price_history': [100.0, 100.0],
+            'quantity_history': [-1.0, -1.0],
+            'trade_history': ['ENTER', 'ENTER'],
+            'fill_history': [True, False],
+        })
+
+        restored = pickle.loads(pickle.dumps(position))
+        self.assertEqual(restored.position_enter_cnt, 2)
+        self.assertEqual(restored.fill_cnt, 1)
+        self.assertEqual(restored.to_dict()['trade_history'], ['ENTER', 'ENTER'])
+
+    def test_ring_buffer_history_spills_to_disk(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            position = Position('strategy_1', '005930', history_capacity=3, spill_dir=spill_dir)
+            position.open_position(side='BUY', price=100, quantity=1, order_state=OrderState.FILLED)
+            for price in range(101, 106):
+                position.update_position(price=price, quantity=1, order_state=OrderState.FILLED)
+            self.assertEqual(position.full_history('price_history'), [100.0 + i for i in range(6)])
+            self.assertFalse(os.path.exists(os.path.join(spill_dir, 'strategy_1')))
+            self.assertTrue(position.flush_spills())
+            self.assertFalse(position.flush_spills())
+
+            # journal replay로 같은 값이 다시 밀려나도 파일의 같은 위치에 기록된다.
+            replayed = pickle.loads(pickle.dumps(position))
+            replayed.price_history.pending.extend([101.0, 102.0])
+            self.assertTrue(replayed.flush_spills())
+            self.assertEqual(replayed.full_history('price_history'), [100.0 + i for i in range(6)])
+
+            res = pickle.loads(pickle.dumps(position)).to_dict()
+            self.assertEqual(res['price_history'], [103.0, 104.0, 105.0])
+            self.assertEqual(position.position_enter_cnt, 6)
+            self.assertEqual(position.fill_cnt, 6)
+            self.assertEqual(position.full_history('price_history'), [100.0 + i for i in range(6)])
+            self.assertEqual(position.full_history('trade_history'), ['ENTER'] * 6)
+
+            position.update_position(price=110, quantity=-6, order_state=OrderState.FILLED)
+            self.assertEqual(position.POSITION_STATE, PositionState.CLOSED)
+            self.assertEqual(position.full_history('price_history'), [])
+            position.flush_spills()
+            self.assertEqual(os.listdir(os.path.join(spill_dir, 'strategy_1')), [])
+
+    def test_realized_pnl_survives_close_and_flip(self):
+        position = Position('strategy_1', '005930')
+        position.apply_fill(side='BUY', price=100, quantity=2, fee=1.0)
+        position.apply_fill(side='SELL', price=110, quantity=-1, fee=1.0)
+        self.assertEqual(position.realized_pnl, 10.0)
+
+        # 남은 1개를 청산하고 반대 방향으로 2개 진입 (side 전환)
+        position.apply_fill(side='SELL', price=90, quantity=-3, fee=1.0)
+        self.assertEqual(position.side, 'SELL')
+        self.assertEqual(position.realized_pnl, 0.0)
+        position.apply_fill(side='BUY', price=80, quantity=2)
+
+        self.assertEqual(position.POSITION_STATE, PositionState.CLOSED)
+        self.assertEqual(position.realized_pnl, 20.0)
+        self.assertEqual(position.fees, 3.0)
+        self.assertEqual(position.turnover, 200 + 110 + 270 + 160)
@@ -0,0 +1,81 @@
+import os
+import random
+import tempfile
+from unittest import TestCase, mock
+
+from core.ledger import Ledger
+from core.order import OrderState
+from core.ledger_db import fill_events
+from core.rebuild import rebuild_positions, _rebuild_scalar, _columns
+
+
+def random_fills(size, seed):
+    rng = random.Random(seed)
+    fills = []
+    for _ in range(size):
+        strategy_name, symbol = rng.choice(['strategy_1', 'strategy_2']), rng.choice(['005930', '000660'])
+        if rng.random() < 0.15:
+            # 주문 취소 (Ledger.cancel_order)
+            fills.append((strategy_name, symbol, rng.choice(['BUY', 'SELL']), 0.0, 0.0, 0.0, OrderState.CLOSED))
+        else:
+            quantity = rng.choice([1, 2, 3, 0.5]) * rng.choice([1, -1])
+            fills.append((strategy_name, symbol, 'BUY' if quantity > 0 else 'SELL', round(rng.uniform(90, 110), 1),
+                          quantity, None, rng.choice([OrderState.FILLED, OrderState.OPEN])))
+    return fills
+
+
+class RebuildTest(TestCase):
+
+    def test_matches_scalar_update_position(self):
+        for seed in range(50):
+            fills = random_fills(200, seed)
+            expected = _rebuild_scalar(_columns(fills))
+            rebuilt = rebuild_positions(fills)
+
+            for strategy_name, positions in expected.items():
+                for symbol, position in positions.items():
+                    res = rebuilt[strategy_name][symbol].to_dict()
+                    for field, value in position.to_dict().items():
+                        if field in ('position_open_date', 'price_history', 'quantity_history'):
+                            continue
+                        if isinstance(value, float):
+                            self.assertAlmostEqual(res[field], value, places=6, msg=(seed, field))
+                        else:
+                            self.assertEqual(res[field], value, msg=(seed, field))
+                    self.assertEqual(res['quantity_history'], position.to_dict()['quantity_history'])
+                    self.assertEqual(res['price_history'], position.to_dict()['price_history'])
+                    self.assertEqual(rebuilt[strategy_name][symbol].fill_cnt, position.fill_cnt)
+
+    def test_ledger_rebuild_is_journaled(self):
+        with tempfile.TemporaryDirectory() as home, mock.patch.dict(os.environ, {'HOME': home}):
+            fills = random_fills(100, 0)
+            ledger = Ledger(name='ledger_1', username='user_1', auto_save=True, journal=True)
+            ledger.rebuild_positions(fills)
+            expected = ledger.get_position('strategy_1', '005930')
+            ledger.flush()
+
+            restored = Ledger(name='ledger_1', username='user_1', auto_save=True, journal=True)
+            self.assertEqual(restored.get_position('strategy_1', '005930'), expected)
+
+    def test_unsigned_db_fills(self):
+        ledger = Ledger(name='ledger_1', username='user_1')
+        fills, cancelled = [], []
+        for i, (side, price, quantity) in enumerate([('BUY', 100, 3), ('SELL', 110, 1), ('SELL', 120, 2),
+                                                     ('SELL', 90, 2), ('BUY', 95, 1)]):
+            order_hash = ledger.init_order('strategy_1', '005930', price, quantity, side, 'LIMIT')
+            ledger.register_order(f'order_{i}', order_hash)
+            ledger.fill_order('strategy_1', f'order_{i}', price, quantity if side == 'BUY' else -quantity)
+            # DB의 Fill row는 부호가 없는 수량과 B/S side로 기록된다.
+            fills.append((i, 'strategy_1', '005930', side[0], OrderState.FILLED, f'2021-01-01 00:00:0{i}',
+                          price, quantity))
+        order_hash = ledger.init_order('strategy_1', '005930', 80, 1, 'BUY', 'LIMIT')
+        ledger.register_order('order_5', order_hash)
+        ledger.cancel_order('strategy_1', 'order_5')
+        cancelled.append(('strategy_1', '005930', 'B', '2021-01-01 00:00:09'))
+
+        expected = ledger.get_position('strategy_1', '005930')
+        rebuilt = rebuild_positions(fill_events(fills, cancelled))['strategy_1']['005930'].to_dict()
+        self.assertEqual(rebuilt['quantity'], expected['quantity'])
+        self.assertEqual(rebuilt['side'], expected['side'])
+        self.assertAlmostEqual(rebuilt['average_price'], expected['average_price'])
+        self.assertEqual(rebuilt['quantity_history'], expected['quantity_history'])
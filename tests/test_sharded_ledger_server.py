@@ -0,0 +1,75 @@
+import os
+import json
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+import zmq
+
+from periphery.sharded_ledger_server import Shard, ShardedLedgerServer, rendezvous_shard
+
+
+class ShardedLedgerServerTest(TestCase):
+
+    def test_rendezvous_moves_only_new_shard_keys(self):
+        keys = [('user_1', f'ledger_{i}') for i in range(1000)]
+        before = {key: rendezvous_shard(key, [0, 1, 2]) for key in keys}
+        after = {key: rendezvous_shard(key, [0, 1, 2, 3]) for key in keys}
+        moved = [key for key in keys if before[key] != after[key]]
+        self.assertTrue(all(after[key] == 3 for key in moved))
+        self.assertTrue(150 < len(moved) < 350)
+
+    def test_control_socket_recovers_from_timeout(self):
+        ctx = zmq.Context.instance()
+        backend = ctx.socket(zmq.ROUTER)
+        backend.bind('inproc://test_control_socket')
+        shard = Shard.__new__(Shard)            # shard process 없이 control socket만 검증
+        shard.shard_id, shard.ctx, shard.address, shard.control = 0, ctx, 'inproc://test_control_socket', None
+        shard.reset_control()
+        try:
+            self.assertRaises(Exception, shard.call, {'type': 'ping'}, timeout=50)
+            backend.recv_multipart()            # 응답하지 않은 요청
+
+            # 응답을 받지 못한 뒤에도 다음 요청을 보낼 수 있다. (늦게 온 이전 응답은 버려진다)
+            shard.send({'type': 'ping'})
+            identity, empty, _ = backend.recv_multipart()
+            backend.send_multipart([identity, empty, json.dumps({'status': 'success', 'result': 'pong'}).encode()])
+            self.assertEqual(shard.recv(1000)['result'], 'pong')
+        finally:
+            shard.control.close(linger=0)
+            backend.close(linger=0)
+
+    def test_requests_follow_resized_shards(self):
+        with tempfile.TemporaryDirectory() as home, mock.patch.dict(os.environ, {'HOME': home}):
+            server = ShardedLedgerServer(shards=2, address='tcp://127.0.0.1:*', workers=2)
+            threading.Thread(target=server.start_server, daemon=True).start()
+            socket = zmq.Context.instance().socket(zmq.REQ)
+            socket.connect(server.socket.getsockopt_string(zmq.LAST_ENDPOINT))
+
+            def request(req_type, **params):
+                socket.send_string(json.dumps({'type': req_type, 'params': params}))
+                self.assertTrue(socket.poll(20000))
+                return json.loads(socket.recv_string())
+
+            try:
+                for i in range(6):
+                    params = {'session_id': 'session_1', 'username': 'user_1', 'ledger_name': f'ledger_{i}',
+                              'strategy_name': 'strategy_1'}
+                    request('update_cash', amount=float(i), **params)
+
+                stats = request('shard_stats')['result']
+                self.assertEqual(sum(shard['ledgers'] for shard in stats.values()), 6)
+
+                request('resize_shards', shards=3)
+                self.assertEqual(len(request('shard_stats')['result']), 3)
+                for i in range(6):
+                    res = request('get_cash', session_id='session_1', username='user_1', ledger_name=f'ledger_{i}',
+                                  strategy_name='strategy_1')
+                    self.assertEqual(res['result'], {'cash': float(i)})
+            finally:
+                socket.close(linger=0)
+                server.close()
+
+            # shard는 terminate되지 않고 ledger를 저장(checkpoint)한 뒤에 종료된다.
+            for i in range(6):
+                self.assertTrue(os.path.exists(os.path.join(home, 'easy_ledger', 'user_1', f'ledger_{i}', 'Ledger.pkl')))
@@ -0,0 +1,62 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from core.ledger import Ledger
+from core.versions import VersionIndex
+
+
+class VersionTest(TestCase):
+
+    def test_tombstone_floor(self):
+        index = VersionIndex(max_tombstones=2)
+        for version, key in enumerate(['a', 'b', 'c'], start=1):
+            index.touch('strategy_1', key, version)
+        for version, key in enumerate(['a', 'b', 'c'], start=4):
+            index.remove('strategy_1', key, version)
+
+        self.assertIsNone(index.changed('strategy_1', 3))
+        self.assertEqual(index.changed('strategy_1', 4), ([], ['c', 'b']))
+        self.assertEqual(index.changed('strategy_1', 6), ([], []))
+
+    def test_changed_reads_recent_entries_only(self):
+        index = VersionIndex()
+        for version in range(1, 1001):
+            index.touch('strategy_1', f'key_{version}', version)
+        index.touch('strategy_1', 'key_5', 1001)
+        index.touch('strategy_1', 'key_1000', 1002)
+
+        # version 순서로 유지되므로 since_version 이후에 바뀐 entry만 (최근 순서로) 읽는다.
+        self.assertEqual(index.changed('strategy_1', 1000), (['key_1000', 'key_5'], []))
+        self.assertEqual(index.changed('strategy_1', 999)[0], ['key_1000', 'key_5'])
+        self.assertEqual(index.changed('strategy_1', 998)[0], ['key_1000', 'key_5', 'key_999'])
+
+    def test_ledger_changes_since_version(self):
+        with tempfile.TemporaryDirectory() as home, mock.patch.dict(os.environ, {'HOME': home}):
+            ledger = Ledger(name='ledger_1', username='user_1')
+            hashes = [ledger.init_order('strategy_1', symbol, 100, 1, 'BUY', 'LIMIT') for symbol in ('005930', '000660')]
+            ledger.register_order('order_1', hashes[0])
+            ledger.fill_order('strategy_1', 'order_1', 100, 1)
+
+            full = ledger.get_changes('orders', 'strategy_1')
+            self.assertTrue(full['full'])
+            self.assertEqual(len(full['entries']), 1)
+            self.assertEqual(ledger.get_changes('orders', 'strategy_1', since_version=full['version'],
+                                                epoch=full['epoch'])['entries'], [])
+
+            ledger.register_order('order_2', hashes[1])
+            ledger.cancel_order('strategy_1', 'order_2')
+            ledger.update_position('strategy_1', '035720', 'BUY', 100, 1)
+            orders = ledger.get_changes('orders', 'strategy_1', since_version=full['version'], epoch=full['epoch'])
+            positions = ledger.get_changes('positions', 'strategy_1', since_version=full['version'],
+                                           epoch=full['epoch'])
+
+            self.assertFalse(orders['full'])
+            self.assertEqual(orders['entries'], [])
+            self.assertEqual(len(orders['removed']), 1)
+            # 취소된 주문(수량 0)도 포지션 update를 거친다.
+            self.assertEqual(sorted(positions['entries']), ['000660', '035720'])
+            self.assertTrue(ledger.get_changes('orders', 'strategy_1', since_version=full['version'])['full'])
+            # JSON 응답에서 문자열로 받은 epoch를 그대로 넘겨도 된다.
+            self.assertFalse(ledger.get_changes('orders', 'strategy_1', since_version=full['version'],
+                                                epoch=str(full['epoch']))['full'])